@@ -1,5 +1,6 @@
 #include <iostream>
 #include <unordered_map>
+#include <unordered_set>
 #include <vector>
 #include <string>
 #include <algorithm>
@@ -7,360 +8,5398 @@
 #include <sstream>
 #include <chrono>
 #include <cstdlib>
-#include <ctime>
+#include <queue>
+#include <limits>
+#include <cstdint>
+#include <cstring>
+#include <cctype>
+#include <type_traits>
+#include <thread>
+#include <functional>
+#include <memory>
+#include <mutex>
+#include <condition_variable>
+#include <atomic>
+#include <list>
+#include <deque>
+#include <map>
+#include <tuple>
+#include <cstdio>
+#include <cmath>
+#include <random>
+#if defined(__unix__) || defined(__APPLE__)
+#include <sys/mman.h>
+#include <sys/resource.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
+#define HAVE_MMAP 1
+#endif
+#ifdef __linux__
+#include <sys/epoll.h>
+#include <sys/eventfd.h>
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <netinet/in.h>
+#include <netinet/tcp.h>
+#include <arpa/inet.h>
+#include <cerrno>
+#define HAVE_EPOLL 1
+#endif
+
+#define COMPLETION_CACHE_SIZE 10  // Best completions cached on every trie node
+#define MODEL_FORMAT_VERSION 2    // Bumped whenever the binary model layout changes
+#define TRAINING_BUFFER_SIZE (1 << 16)         // Bytes read per chunk by the streaming trainer
+#define TRAINING_MAX_PENDING_WORDS (1 << 20)   // Distinct words counted before a flush into the trie
+#define TRAINING_PROGRESS_INTERVAL (64 << 20)  // Bytes between progress reports
+#define LEARNING_BATCH_WINDOW_MS 5             // Writer waits this long to batch learning events
+#define DELETE_INDEX_DISTANCE 2                // Edit distance covered by the symmetric-delete index
+#define MAX_PREDICTIONS 6                      // Next-word predictions returned by default
+#define JOURNAL_COMMIT_INTERVAL_MS 10          // Journal appends made within this window share one write and fsync
+#define JOURNAL_COMPACT_BYTES (16 << 20)       // Journal segment size that triggers a background compaction
+#define DECAY_RESCALE_HALF_LIVES 8             // With decay on, stored counts are rescaled after this many half-lives
+#define DECAY_PRUNE_FREQUENCY 1                // With decay on, words whose weight falls below this are removed
+#define MEMORY_BUDGET_LOW_WATER 90             // Eviction brings the trie down to this percent of its memory budget
+#define BENCHMARK_SEED 20240601                 // Benchmark suite runs are reproducible from this seed
+#define BENCHMARK_RESULTS_FILE "benchmark_results.jsonl"  // One JSON object per operation and dictionary size
+#define METRICS_SHARDS 8                       // Threads spread their metric updates over this many counter sets
+#define METRICS_HISTOGRAM_OCTAVES 40           // Latency histograms cover 1 ns to 2^40 ns (about 18 minutes)
+#define METRICS_SLOWEST 8                      // Slowest calls kept per operation, with their query
+#define SERVER_PORT 7878                       // TCP port of server mode and its load test
+#define SERVER_MAX_EVENTS 256                  // Socket events handled per epoll wakeup
+#define SERVER_MAX_LINE (64 << 10)             // Longest request line; a longer one closes the connection
+#define SERVER_MAX_OUTPUT (1 << 20)            // Unsent response bytes at which a client stops being read
+#define FUZZY_MAX_EDITS 2                      // Edits fuzzy completion tolerates in a prefix by default
+#define FUZZY_CHARS_PER_EDIT 3                 // Fuzzy completion allows one edit per this many typed characters
+#define FUZZY_EDIT_DISCOUNT 8                  // Fuzzy completion divides a word's frequency by this per edit
+
+// Nodes live in one contiguous pool and refer to each other by 32-bit index
+typedef uint32_t NodeId;
+const NodeId NO_NODE = std::numeric_limits<NodeId>::max();
+const NodeId ROOT_NODE = 0;
 
 // TrieNode class for storing character nodes
 class TrieNode {
 public:
-    std::unordered_map<char, TrieNode*> children;
+    NodeId firstChild;       // Children form a sibling list sorted by label
+    NodeId nextSibling;
+    NodeId parent;           // Words are rebuilt by following parents to the root
+    uint32_t labelStart;     // Full edge label in the label arena when labelLength > 1
+    uint16_t labelLength;    // Characters on the edge; always 1 without path compression
+    char label;              // First character on the edge from the parent
     bool isEndOfWord;
     int frequency;           // ML element: tracks word usage frequency
-    std::string word;        // Store complete word at end nodes
+    int maxSubtreeFrequency; // Highest frequency of any word in this subtree
+    
+    TrieNode(NodeId parentId = NO_NODE, char ch = '\0')
+        : firstChild(NO_NODE), nextSibling(NO_NODE), parent(parentId), labelStart(0), labelLength(1),
+          label(ch), isEndOfWord(false), frequency(0),
+          maxSubtreeFrequency(std::numeric_limits<int>::min()) {}
+};
+
+// Trie nodes visited by queries on this thread; the metrics timers read the
+// difference across a call, so the count costs one add per node
+thread_local uint64_t trieNodeVisits = 0;
+
+// Read-only operations over a flattened node pool. Shared by the live trie
+// and by memory-mapped model files, which are queried in place.
+class TrieView {
+public:
+    const TrieNode* nodes;
+    const char* labels;      // Label arena for multi-character edges
+    
+    TrieView(const TrieNode* nodePool, const char* labelArena) : nodes(nodePool), labels(labelArena) {}
+    
+    // Character i of the edge label leading into a node
+    char edgeChar(NodeId node, size_t i) const {
+        return i == 0 ? nodes[node].label : labels[nodes[node].labelStart + i];
+    }
+    
+    // Append a node's full edge label to a string
+    void appendLabel(NodeId node, std::string& out) const {
+        if (nodes[node].labelLength == 1) {
+            out.push_back(nodes[node].label);
+        } else {
+            out.append(labels + nodes[node].labelStart, nodes[node].labelLength);
+        }
+    }
+    
+    // Find a child by first label character; siblings are sorted so the scan can stop early
+    NodeId findChild(NodeId parent, char ch) const {
+        NodeId child = nodes[parent].firstChild;
+        while (child != NO_NODE && (unsigned char)nodes[child].label < (unsigned char)ch) {
+            child = nodes[child].nextSibling;
+        }
+        return (child != NO_NODE && nodes[child].label == ch) ? child : NO_NODE;
+    }
+    
+    // Rebuild the word ending at a node from the labels on its path
+    std::string wordAt(NodeId node) const {
+        std::string word;
+        appendWord(node, word);
+        return word;
+    }
+    
+    // Same, appended to an existing buffer
+    void appendWord(NodeId node, std::string& out) const {
+        size_t start = out.size();
+        for (NodeId current = node; current != ROOT_NODE; current = nodes[current].parent) {
+            for (size_t i = nodes[current].labelLength; i-- > 0; ) {
+                out.push_back(edgeChar(current, i));
+            }
+        }
+        std::reverse(out.begin() + start, out.end());
+    }
+    
+    // Number of edges between a node and the root
+    int depthOf(NodeId node) const {
+        int depth = 0;
+        for (NodeId current = node; current != ROOT_NODE; current = nodes[current].parent) {
+            depth++;
+        }
+        return depth;
+    }
+    
+    // Alphabetical comparison of two node paths without rebuilding the strings
+    bool wordLess(NodeId a, NodeId b) const {
+        if (a == b) return false;
+        int depthA = depthOf(a);
+        int depthB = depthOf(b);
+        bool aIsShorter = depthA < depthB;
+        
+        // A word sorts after its own prefixes
+        while (depthA > depthB) { a = nodes[a].parent; depthA--; }
+        while (depthB > depthA) { b = nodes[b].parent; depthB--; }
+        if (a == b) return aIsShorter;
+        
+        // Climb to the children of the common ancestor; siblings differ in their first character
+        while (nodes[a].parent != nodes[b].parent) {
+            a = nodes[a].parent;
+            b = nodes[b].parent;
+        }
+        return (unsigned char)nodes[a].label < (unsigned char)nodes[b].label;
+    }
+    
+    // Find the node corresponding to a prefix. A prefix that ends inside an
+    // edge returns the node below that edge, whose subtree holds exactly the
+    // words with that prefix; `exact` is cleared in that case.
+    NodeId findPrefixNode(const std::string& prefix, bool* exact = nullptr) const {
+        NodeId current = ROOT_NODE;
+        size_t matched = 0;
+        if (exact) *exact = true;
+        while (matched < prefix.size()) {
+            current = findChild(current, prefix[matched]);
+            if (current == NO_NODE) {
+                return NO_NODE;
+            }
+            trieNodeVisits++;
+            size_t length = nodes[current].labelLength;
+            for (size_t i = 1; i < length; i++) {
+                if (matched + i == prefix.size()) {
+                    if (exact) *exact = false;
+                    return current;
+                }
+                if (edgeChar(current, i) != prefix[matched + i]) {
+                    return NO_NODE;
+                }
+            }
+            matched += length;
+        }
+        return current;
+    }
+    
+    // Best-first search below a node, resumable: each next() yields the next
+    // word in ranking order. Subtrees are expanded in order of their frequency
+    // bound; a word is final once nothing left in the queue can outrank it,
+    // so asking for more words only costs the extra expansion.
+    class BestFirstCursor {
+    public:
+        BestFirstCursor() : nodes(nullptr), labels(nullptr) {}
+        
+        BestFirstCursor(const TrieView& trie, NodeId start) : nodes(trie.nodes), labels(trie.labels) {
+            frontier.push_back({nodes[start].maxSubtreeFrequency, false, start});
+        }
+        
+        // The next word's node, or NO_NODE once the subtree is exhausted
+        NodeId next() {
+            TrieView trie(nodes, labels);
+            LowerPriority lowerPriority = {&trie};
+            while (!frontier.empty()) {
+                std::pop_heap(frontier.begin(), frontier.end(), lowerPriority);
+                Entry top = frontier.back();
+                frontier.pop_back();
+                if (top.isWord) return top.node;
+                
+                const TrieNode& node = nodes[top.node];
+                trieNodeVisits++;
+                if (node.isEndOfWord) {
+                    frontier.push_back({node.frequency, true, top.node});
+                    std::push_heap(frontier.begin(), frontier.end(), lowerPriority);
+                }
+                for (NodeId child = node.firstChild; child != NO_NODE; child = nodes[child].nextSibling) {
+                    frontier.push_back({nodes[child].maxSubtreeFrequency, false, child});
+                    std::push_heap(frontier.begin(), frontier.end(), lowerPriority);
+                }
+            }
+            return NO_NODE;
+        }
+        
+    private:
+        struct Entry {
+            int score;       // Word frequency, or subtree bound for unexpanded nodes
+            bool isWord;
+            NodeId node;
+        };
+        // Higher score first; on ties expand nodes before emitting words, so that
+        // equal-frequency words are all queued and come out alphabetically
+        struct LowerPriority {
+            const TrieView* trie;
+            bool operator()(const Entry& a, const Entry& b) const {
+                if (a.score != b.score) return a.score < b.score;
+                if (a.isWord != b.isWord) return a.isWord;
+                return a.isWord && trie->wordLess(b.node, a.node);
+            }
+        };
+        
+        const TrieNode* nodes;
+        const char* labels;
+        std::vector<Entry> frontier;   // Heap ordered by LowerPriority
+    };
+    
+    // The top completions below a node, best first
+    std::vector<std::string> bestFirstSuggestions(NodeId start, int maxSuggestions) const {
+        std::vector<std::string> result;
+        BestFirstCursor cursor(*this, start);
+        while ((int)result.size() < maxSuggestions) {
+            NodeId word = cursor.next();
+            if (word == NO_NODE) break;
+            result.push_back(wordAt(word));
+        }
+        return result;
+    }
+};
+
+// Binary model file: this header, then the node pool exactly as it sits in
+// memory, then (if present) the completion caches flattened into
+// nodeCount + 1 offsets and their entries, then the label arena, then the
+// n-gram tables as uint32 records: order (2 or 3), the context word ids,
+// successor count, and (word id, count) pairs. Files are written in host
+// byte order and can be mapped read-only and queried without parsing.
+struct ModelFileHeader {
+    char magic[8];           // "PTMODEL\0"
+    uint32_t version;        // MODEL_FORMAT_VERSION
+    uint32_t nodeSize;       // sizeof(TrieNode) of the writer
+    uint64_t nodeCount;
+    uint64_t labelBytes;
+    uint64_t wordCount;
+    uint64_t cacheEntries;   // 0 when the writer kept no completion caches
+    uint64_t checksum;       // fnv1a() chained over the node, cache and label sections
+    uint32_t pathCompression;
+    uint32_t reserved;
+    uint64_t ngramWords;     // uint32 values in the n-gram section
+};
+
+static_assert(std::is_trivially_copyable<TrieNode>::value, "TrieNode is written to disk as raw bytes");
+static_assert(sizeof(ModelFileHeader) % alignof(TrieNode) == 0, "Node pool must stay aligned after the header");
+
+const char MODEL_MAGIC[8] = {'P', 'T', 'M', 'O', 'D', 'E', 'L', '\0'};
+
+// 64-bit FNV-1a taken 8 bytes per step, chained across buffers through `hash`
+inline uint64_t fnv1a(const char* data, size_t size, uint64_t hash = 14695981039346656037ULL) {
+    size_t i = 0;
+    for (; i + sizeof(uint64_t) <= size; i += sizeof(uint64_t)) {
+        uint64_t chunk;
+        std::memcpy(&chunk, data + i, sizeof(chunk));
+        hash ^= chunk;
+        hash *= 1099511628211ULL;
+    }
+    for (; i < size; i++) {
+        hash ^= (unsigned char)data[i];
+        hash *= 1099511628211ULL;
+    }
+    return hash;
+}
+
+// Check that every link in a size-checked model image stays in bounds: the
+// nodes reachable from the root form a tree whose parent links agree with
+// it, edge labels lie inside the label section, every other node is a free
+// slot, and completion caches hold reachable words. One pass over the nodes,
+// so even a corrupt file that skipped the checksum cannot send a query out
+// of the image or into a cycle.
+inline const char* validateModelStructure(const char* data) {
+    const ModelFileHeader* header = reinterpret_cast<const ModelFileHeader*>(data);
+    const TrieNode* nodes = reinterpret_cast<const TrieNode*>(data + sizeof(ModelFileHeader));
+    NodeId nodeCount = (NodeId)header->nodeCount;
+    
+    std::vector<char> reached(nodeCount, 0);
+    std::vector<NodeId> pending(1, ROOT_NODE);
+    reached[ROOT_NODE] = 1;
+    if (nodes[ROOT_NODE].parent != NO_NODE) return "root node has a parent";
+    while (!pending.empty()) {
+        NodeId node = pending.back();
+        pending.pop_back();
+        for (NodeId child = nodes[node].firstChild; child != NO_NODE; child = nodes[child].nextSibling) {
+            if (child >= nodeCount || reached[child]) return "node links out of range or cyclic";
+            if (nodes[child].parent != node) return "node parent link does not match the tree";
+            uint16_t length = nodes[child].labelLength;
+            if (length == 0) return "empty edge label";
+            if (length > 1 && (uint64_t)nodes[child].labelStart + length > header->labelBytes) {
+                return "edge label outside the label section";
+            }
+            reached[child] = 1;
+            pending.push_back(child);
+        }
+    }
+    for (NodeId node = 0; node < nodeCount; node++) {
+        if (!reached[node] && (nodes[node].parent != NO_NODE || nodes[node].isEndOfWord)) {
+            return "node unreachable from the root";
+        }
+    }
+    
+    if (header->cacheEntries) {
+        const uint32_t* offsets = reinterpret_cast<const uint32_t*>(nodes + nodeCount);
+        const uint32_t* entries = offsets + nodeCount + 1;
+        if (offsets[0] != 0 || offsets[nodeCount] != header->cacheEntries) return "completion cache offsets out of range";
+        for (NodeId node = 0; node < nodeCount; node++) {
+            if (offsets[node + 1] < offsets[node]) return "completion cache offsets out of range";
+        }
+        for (uint64_t i = 0; i < header->cacheEntries; i++) {
+            if (entries[i] >= nodeCount || !reached[entries[i]] || !nodes[entries[i]].isEndOfWord) {
+                return "completion cache entry is not a word";
+            }
+        }
+    }
+    return nullptr;
+}
+
+// Check a binary model image; returns an error message, or nullptr if usable.
+// Sizes and links are always checked. The checksum pass hashes the whole
+// image, so mapped loads may skip it.
+inline const char* validateModelImage(const char* data, size_t size, bool verifyChecksum) {
+    if (size < sizeof(ModelFileHeader)) return "file too small";
+    const ModelFileHeader* header = reinterpret_cast<const ModelFileHeader*>(data);
+    if (std::memcmp(header->magic, MODEL_MAGIC, sizeof(MODEL_MAGIC)) != 0) return "not a binary model file";
+    if (header->version != MODEL_FORMAT_VERSION) return "unsupported model format version";
+    if (header->nodeSize != sizeof(TrieNode)) return "model written with a different node layout";
+    if (header->nodeCount == 0) return "model has no root node";
+    if (header->nodeCount >= NO_NODE || header->nodeCount > size / sizeof(TrieNode) || header->cacheEntries > size ||
+        header->labelBytes > size || header->ngramWords > size) {
+        return "truncated or oversized model file";  // Also keeps the section sizes below from overflowing
+    }
+    
+    uint64_t cacheBytes = header->cacheEntries ? (header->nodeCount + 1 + header->cacheEntries) * sizeof(uint32_t) : 0;
+    uint64_t ngramBytes = header->ngramWords * sizeof(uint32_t);
+    uint64_t payload = header->nodeCount * sizeof(TrieNode) + cacheBytes + header->labelBytes + ngramBytes;
+    if (payload != size - sizeof(ModelFileHeader)) return "truncated or oversized model file";
+    if (verifyChecksum) {
+        const char* section = data + sizeof(ModelFileHeader);
+        size_t nodeBytes = (size_t)(header->nodeCount * sizeof(TrieNode));
+        uint64_t checksum = fnv1a(section, nodeBytes);
+        checksum = fnv1a(section + nodeBytes, (size_t)cacheBytes, checksum);
+        checksum = fnv1a(section + nodeBytes + cacheBytes, (size_t)header->labelBytes, checksum);
+        checksum = fnv1a(section + nodeBytes + cacheBytes + header->labelBytes, (size_t)ngramBytes, checksum);
+        if (checksum != header->checksum) return "checksum mismatch";
+    }
+    return validateModelStructure(data);
+}
+
+// UTF-8 helpers for trie keys and tokenization. The trie stores UTF-8
+// code units, so sorting by byte keeps code point order. Case folding is
+// simple folding (one code point to one code point) for Latin, Greek,
+// Cyrillic, Armenian, Georgian, Deseret and fullwidth Latin. Pure ASCII
+// text takes a byte-at-a-time fast path and is never decoded.
+class Utf8 {
+public:
+    // Bytes in the sequence a lead byte starts; 0 for a continuation or invalid byte
+    static size_t sequenceLength(unsigned char lead) {
+        if (lead < 0x80) return 1;
+        if (lead < 0xC2) return 0;
+        if (lead < 0xE0) return 2;
+        if (lead < 0xF0) return 3;
+        if (lead < 0xF5) return 4;
+        return 0;
+    }
+    
+    // Decode the code point at text[i], advancing i; false (i unchanged) for
+    // a truncated, overlong or otherwise invalid sequence
+    static bool decode(const char* text, size_t size, size_t& i, uint32_t& codePoint) {
+        unsigned char lead = (unsigned char)text[i];
+        size_t length = sequenceLength(lead);
+        if (length == 0 || i + length > size) return false;
+        if (length == 1) {
+            codePoint = lead;
+            i++;
+            return true;
+        }
+        uint32_t value = lead & (0x7F >> length);
+        for (size_t k = 1; k < length; k++) {
+            unsigned char next = (unsigned char)text[i + k];
+            if ((next & 0xC0) != 0x80) return false;
+            value = (value << 6) | (next & 0x3F);
+        }
+        static const uint32_t smallest[] = {0, 0, 0x80, 0x800, 0x10000};
+        if (value < smallest[length] || value > 0x10FFFF || (value >= 0xD800 && value <= 0xDFFF)) return false;
+        codePoint = value;
+        i += length;
+        return true;
+    }
+    
+    static void append(uint32_t codePoint, std::string& out) {
+        if (codePoint < 0x80) {
+            out += (char)codePoint;
+        } else if (codePoint < 0x800) {
+            out += (char)(0xC0 | (codePoint >> 6));
+            out += (char)(0x80 | (codePoint & 0x3F));
+        } else if (codePoint < 0x10000) {
+            out += (char)(0xE0 | (codePoint >> 12));
+            out += (char)(0x80 | ((codePoint >> 6) & 0x3F));
+            out += (char)(0x80 | (codePoint & 0x3F));
+        } else {
+            out += (char)(0xF0 | (codePoint >> 18));
+            out += (char)(0x80 | ((codePoint >> 12) & 0x3F));
+            out += (char)(0x80 | ((codePoint >> 6) & 0x3F));
+            out += (char)(0x80 | (codePoint & 0x3F));
+        }
+    }
+    
+    static uint32_t foldCase(uint32_t c) {
+        if (c < 0x80) return (c >= 'A' && c <= 'Z') ? c + 32 : c;
+        if (c < 0x100) {
+            if (c >= 0xC0 && c <= 0xDE && c != 0xD7) return c + 32;
+            return (c == 0xB5) ? 0x3BC : c;                        // Micro sign folds to mu
+        }
+        if (c < 0x180) {                                           // Latin Extended-A: mostly upper/lower pairs
+            if (c == 0x130) return 'i';
+            if (c == 0x178) return 0xFF;
+            if (c == 0x17F) return 's';
+            if (c == 0x138 || c == 0x149) return c;
+            if ((c >= 0x139 && c <= 0x148) || (c >= 0x179 && c <= 0x17E)) return (c & 1) ? c + 1 : c;
+            return (c & 1) ? c : c + 1;
+        }
+        if (c >= 0x370 && c < 0x400) {                             // Greek
+            if (c == 0x386) return 0x3AC;
+            if (c >= 0x388 && c <= 0x38A) return c + 37;
+            if (c == 0x38C) return 0x3CC;
+            if (c == 0x38E || c == 0x38F) return c + 63;
+            if ((c >= 0x391 && c <= 0x3A1) || (c >= 0x3A3 && c <= 0x3AB)) return c + 32;
+            return (c == 0x3C2) ? 0x3C3 : c;                       // Final sigma folds to sigma
+        }
+        if (c >= 0x400 && c < 0x530) {                             // Cyrillic
+            if (c < 0x410) return c + 80;
+            if (c < 0x430) return c + 32;
+            if ((c >= 0x460 && c <= 0x481) || (c >= 0x48A && c <= 0x4BF) || (c >= 0x4D0 && c <= 0x52F)) {
+                return (c & 1) ? c : c + 1;
+            }
+            if (c >= 0x4C1 && c <= 0x4CE) return (c & 1) ? c + 1 : c;
+            return c;
+        }
+        if (c >= 0x531 && c <= 0x556) return c + 48;               // Armenian
+        if (c >= 0x10A0 && c <= 0x10C5) return c + 7264;           // Georgian
+        if (c >= 0x1E00 && c <= 0x1EFF) {                          // Latin Extended Additional
+            if (c == 0x1E9E) return 0xDF;
+            return ((c <= 0x1E95 || c >= 0x1EA0) && !(c & 1)) ? c + 1 : c;
+        }
+        if (c == 0x2126) return 0x3C9;                             // Ohm, Kelvin and Angstrom signs
+        if (c == 0x212A) return 'k';
+        if (c == 0x212B) return 0xE5;
+        if (c >= 0xFF21 && c <= 0xFF3A) return c + 32;             // Fullwidth Latin
+        if (c >= 0x10400 && c <= 0x10427) return c + 40;           // Deseret
+        return c;
+    }
+    
+    // How the tokenizer treats a non-ASCII code point: spaces separate words,
+    // punctuation, symbols, emoji and invisible formatting are dropped, and
+    // everything else (letters, marks, digits of every script) is part of a word
+    enum CharClass { WordChar, Separator, Dropped };
+    
+    static CharClass classify(uint32_t c) {
+        if (c == 0x85 || c == 0xA0 || c == 0x1680 || (c >= 0x2000 && c <= 0x200B) || c == 0x2028 || c == 0x2029 ||
+            c == 0x202F || c == 0x205F || c == 0x3000) {
+            return Separator;
+        }
+        if (c < 0xC0) return (c == 0xAA || c == 0xB5 || c == 0xBA) ? WordChar : Dropped;
+        if (c == 0xD7 || c == 0xF7) return Dropped;
+        if ((c >= 0x2010 && c <= 0x2027) || (c >= 0x202A && c <= 0x202E) || (c >= 0x2030 && c <= 0x205E) ||
+            (c >= 0x2060 && c <= 0x206F) || (c >= 0x20A0 && c <= 0x20CF) || (c >= 0x2190 && c <= 0x2BFF) ||
+            (c >= 0x3001 && c <= 0x3004) || (c >= 0x3008 && c <= 0x3020) || c == 0x3030 || c == 0x303D ||
+            (c >= 0xFE30 && c <= 0xFE6F) || c == 0xFEFF || (c >= 0xFF01 && c <= 0xFF0F) ||
+            (c >= 0xFF1A && c <= 0xFF20) || (c >= 0xFF3B && c <= 0xFF40) || (c >= 0xFF5B && c <= 0xFF65) ||
+            (c >= 0x1F000 && c <= 0x1FAFF)) {
+            return Dropped;
+        }
+        return WordChar;
+    }
+    
+    // Bytes in the character at text[i]: a lead byte and the continuation
+    // bytes it announces (fewer if the text ends first). Any other byte is a
+    // character of its own, so invalid text still splits deterministically.
+    static size_t characterLength(const char* text, size_t size, size_t i) {
+        size_t length = sequenceLength((unsigned char)text[i]);
+        return length ? std::min(length, size - i) : 1;
+    }
+    
+    // Read a character a byte at a time, packing its bytes into `character`
+    // so characters compare as integers. `pending` counts the bytes still
+    // expected; returns true once the character is complete.
+    static bool feedByte(uint32_t& character, uint8_t& pending, char byte) {
+        unsigned char c = (unsigned char)byte;
+        if (pending == 0) {
+            size_t length = sequenceLength(c);
+            character = c;
+            pending = (uint8_t)(length > 1 ? length - 1 : 0);
+        } else {
+            character = (character << 8) | c;
+            pending--;
+        }
+        return pending == 0;
+    }
+    
+    // Text as packed characters, the units edit distances are counted in
+    static void splitCharacters(const std::string& text, std::vector<uint32_t>& out) {
+        out.clear();
+        uint32_t character = 0;
+        uint8_t pending = 0;
+        for (char byte : text) {
+            if (feedByte(character, pending, byte)) out.push_back(character);
+        }
+        if (pending) out.push_back(character);  // Truncated sequence at the end
+    }
+    
+    // True if folding would leave the text unchanged: lowercase ASCII only
+    static bool isFolded(const char* text, size_t size) {
+        for (size_t i = 0; i < size; i++) {
+            unsigned char c = (unsigned char)text[i];
+            if (c >= 0x80 || (c >= 'A' && c <= 'Z')) return false;
+        }
+        return true;
+    }
+    
+    // Case-fold text into out (replacing its contents, keeping its capacity).
+    // Bytes that are not valid UTF-8 are copied through unchanged.
+    static void foldText(const char* text, size_t size, std::string& out) {
+        out.clear();
+        size_t i = 0;
+        while (i < size) {
+            unsigned char c = (unsigned char)text[i];
+            if (c < 0x80) {
+                out += (char)((c >= 'A' && c <= 'Z') ? c + 32 : c);
+                i++;
+                continue;
+            }
+            uint32_t codePoint;
+            if (decode(text, size, i, codePoint)) {
+                append(foldCase(codePoint), out);
+            } else {
+                out += (char)c;
+                i++;
+            }
+        }
+    }
+};
+
+// A case-folded string to use as a trie key without allocating. Text that
+// is already folded, such as lowercase ASCII, is used in place. Anything
+// else is folded into a per-thread buffer that keeps its capacity between
+// calls. Instances may nest, since each takes its own buffer; scoping
+// releases buffers in reverse order.
+class FoldedText {
+public:
+    explicit FoldedText(const std::string& original) : text(&original), slot(0) {
+        if (Utf8::isFolded(original.data(), original.size())) return;
+        std::deque<std::string>& pool = buffers();  // A deque never moves the buffers it holds
+        slot = ++slotsInUse();
+        if (pool.size() < slot) pool.emplace_back();
+        Utf8::foldText(original.data(), original.size(), pool[slot - 1]);
+        text = &pool[slot - 1];
+    }
+    
+    ~FoldedText() {
+        if (slot) slotsInUse()--;
+    }
+    
+    FoldedText(const FoldedText&) = delete;
+    FoldedText& operator=(const FoldedText&) = delete;
+    
+    const std::string& str() const {
+        return *text;
+    }
+    
+private:
+    const std::string* text;
+    size_t slot;             // 1-based buffer index, or 0 when used in place
+    
+    static std::deque<std::string>& buffers() {
+        thread_local std::deque<std::string> pool;
+        return pool;
+    }
+    
+    static size_t& slotsInUse() {
+        thread_local size_t count = 0;
+        return count;
+    }
+};
+
+// Splits a byte stream into words the same way splitIntoWords does, one
+// buffer at a time: whitespace separates tokens, punctuation and invalid
+// UTF-8 are dropped, and letters are case-folded. ASCII bytes are handled
+// directly; a multi-byte character may straddle two buffers. The token
+// buffer is reused, so words cost no allocation of their own.
+class WordTokenizer {
+private:
+    std::string token;
+    char pending[4];         // Bytes of a multi-byte character not yet complete
+    size_t pendingSize = 0;
+    
+    template <typename Callback>
+    void emit(Callback& onWord) {
+        if (!token.empty()) {
+            onWord(token);
+            token.clear();
+        }
+    }
+    
+    template <typename Callback>
+    void feedMultiByte(unsigned char c, Callback& onWord) {
+        if (c >= 0xC0) {
+            pendingSize = 0;                                     // A new lead byte abandons a truncated character
+        } else if (pendingSize == 0) {
+            return;                                              // Stray continuation byte
+        }
+        pending[pendingSize++] = (char)c;
+        size_t length = Utf8::sequenceLength((unsigned char)pending[0]);
+        if (length == 0) {
+            pendingSize = 0;
+            return;
+        }
+        if (pendingSize < length) return;
+        
+        size_t i = 0;
+        uint32_t codePoint;
+        bool valid = Utf8::decode(pending, pendingSize, i, codePoint);
+        pendingSize = 0;
+        if (!valid) return;
+        switch (Utf8::classify(codePoint)) {
+            case Utf8::Separator: emit(onWord); break;
+            case Utf8::WordChar: Utf8::append(Utf8::foldCase(codePoint), token); break;
+            case Utf8::Dropped: break;
+        }
+    }
+    
+public:
+    static bool isSeparator(unsigned char c) {
+        return c == ' ' || (c >= '\t' && c <= '\r');
+    }
+    
+    // Call onWord(const std::string&) for every word completed inside the buffer
+    template <typename Callback>
+    void feed(const char* data, size_t size, Callback onWord) {
+        for (size_t i = 0; i < size; i++) {
+            unsigned char c = (unsigned char)data[i];
+            if (c >= 0x80) {
+                feedMultiByte(c, onWord);
+                continue;
+            }
+            pendingSize = 0;
+            if (isSeparator(c)) {
+                emit(onWord);
+            } else if (std::isalnum(c)) {
+                token.push_back((char)std::tolower(c));
+            }
+        }
+    }
+    
+    // Emit the word still open at the end of the stream
+    template <typename Callback>
+    void finish(Callback onWord) {
+        pendingSize = 0;
+        emit(onWord);
+    }
+};
+
+// Word counts from one worker, split into shards by word hash so shards can
+// be merged in parallel
+typedef std::unordered_map<std::string, int> WordCounts;
+
+struct ShardedWordCounts {
+    std::vector<WordCounts> shards;
+    uint64_t tokens;
+    
+    explicit ShardedWordCounts(size_t shardCount = 1) : shards(shardCount), tokens(0) {}
+    
+    void add(const std::string& word) {
+        shards[std::hash<std::string>()(word) % shards.size()][word]++;
+        tokens++;
+    }
+};
+
+// Split [0, size) into `parts` ranges whose boundaries fall on separators, so
+// no word straddles two ranges. byteAt(i) reads the input at offset i.
+template <typename ByteReader>
+std::vector<uint64_t> wordAlignedBoundaries(uint64_t size, int parts, ByteReader byteAt) {
+    std::vector<uint64_t> boundaries(1, 0);
+    for (int i = 1; i < parts; i++) {
+        uint64_t boundary = std::max(boundaries.back(), size * i / parts);
+        while (boundary < size && !WordTokenizer::isSeparator((unsigned char)byteAt(boundary))) {
+            boundary++;
+        }
+        boundaries.push_back(boundary);
+    }
+    boundaries.push_back(size);
+    return boundaries;
+}
+
+// Outcome of a training run
+struct TrainingReport {
+    uint64_t bytes;
+    uint64_t tokens;
+    double seconds;
+};
+
+// Where the trie's memory goes
+struct MemoryReport {
+    size_t totalBytes;       // Node pool, label arena and completion caches as allocated
+    size_t nodeBytes;
+    size_t labelBytes;
+    size_t cacheBytes;
+    size_t inUseBytes;       // What the memory budget counts: live nodes, labels and cache entries
+    size_t liveNodes;
+    size_t freeNodes;        // Slots of removed words waiting to be reused
+    size_t words;
+    double bytesPerNode;     // totalBytes per live node
+    double bytesPerWord;     // totalBytes per word
+};
+
+// Bounded LRU cache of suggestion lists keyed by lowercased prefix. An
+// entry computed for k results also answers any smaller k. Lookups reorder
+// the LRU list, so every operation takes the lock; a copy starts empty with
+// the same capacity.
+class ResultCache {
+private:
+    struct Entry {
+        std::string prefix;
+        int maxResults;                     // k the results were computed for
+        std::vector<std::string> results;
+    };
+    
+    size_t capacity;                        // 0 disables the cache
+    std::list<Entry> recent;                // Most recently used first
+    std::unordered_map<std::string, std::list<Entry>::iterator> entries;
+    uint64_t hits;
+    uint64_t misses;
+    uint64_t evictions;
+    uint64_t invalidations;
+    mutable std::mutex mutex;
+    
+public:
+    explicit ResultCache(size_t capacity = 0)
+        : capacity(capacity), hits(0), misses(0), evictions(0), invalidations(0) {}
+    
+    ResultCache(const ResultCache& other)
+        : capacity(other.capacity), hits(0), misses(0), evictions(0), invalidations(0) {}
+    
+    ResultCache& operator=(const ResultCache& other) {
+        if (this != &other) {
+            std::lock_guard<std::mutex> lock(mutex);
+            capacity = other.capacity;
+            recent.clear();
+            entries.clear();
+        }
+        return *this;
+    }
+    
+    bool enabled() const {
+        return capacity > 0;
+    }
+    
+    // Resize, evicting the least recently used entries if needed
+    void setCapacity(size_t newCapacity) {
+        std::lock_guard<std::mutex> lock(mutex);
+        capacity = newCapacity;
+        while (recent.size() > capacity) {
+            entries.erase(recent.back().prefix);
+            recent.pop_back();
+            evictions++;
+        }
+    }
+    
+    // Fill `out` with the first maxResults cached results for a prefix
+    bool lookup(const std::string& prefix, int maxResults, std::vector<std::string>& out) {
+        std::lock_guard<std::mutex> lock(mutex);
+        auto it = entries.find(prefix);
+        // A shorter list than was asked for holds every result, so it serves any k
+        if (it == entries.end() || (maxResults > it->second->maxResults &&
+                                    (int)it->second->results.size() == it->second->maxResults)) {
+            misses++;
+            return false;
+        }
+        recent.splice(recent.begin(), recent, it->second);
+        const std::vector<std::string>& results = it->second->results;
+        out.assign(results.begin(), results.begin() + std::min((size_t)maxResults, results.size()));
+        hits++;
+        return true;
+    }
+    
+    void store(const std::string& prefix, int maxResults, const std::vector<std::string>& results) {
+        std::lock_guard<std::mutex> lock(mutex);
+        if (capacity == 0) return;
+        auto it = entries.find(prefix);
+        if (it != entries.end()) {
+            if (it->second->maxResults >= maxResults) return;  // Already holds at least as much
+            recent.erase(it->second);
+            entries.erase(it);
+        } else if (recent.size() >= capacity) {
+            entries.erase(recent.back().prefix);
+            recent.pop_back();
+            evictions++;
+        }
+        recent.push_front(Entry{prefix, maxResults, results});
+        entries[prefix] = recent.begin();
+    }
+    
+    // Drop the entries for every prefix of a word whose frequency changed
+    void invalidateWord(const std::string& word) {
+        std::lock_guard<std::mutex> lock(mutex);
+        if (entries.empty()) return;
+        std::string prefix;
+        for (char c : word) {
+            prefix += c;
+            auto it = entries.find(prefix);
+            if (it != entries.end()) {
+                recent.erase(it->second);
+                entries.erase(it);
+                invalidations++;
+            }
+        }
+    }
+    
+    void clear() {
+        std::lock_guard<std::mutex> lock(mutex);
+        invalidations += recent.size();
+        recent.clear();
+        entries.clear();
+    }
+    
+    void printStats() const {
+        std::lock_guard<std::mutex> lock(mutex);
+        uint64_t lookups = hits + misses;
+        std::cout << "Result cache: " << recent.size() << "/" << capacity << " entries, " << hits << " hits, "
+                  << misses << " misses (" << (lookups ? 100.0 * hits / lookups : 0.0) << "% hit rate), "
+                  << evictions << " evictions, " << invalidations << " invalidations" << std::endl;
+    }
+};
+
+// Operations timed by the built-in metrics
+enum class MetricOperation {
+    Suggestions,
+    FuzzySuggestions,
+    AutoCorrect,
+    Prediction,
+    Insert,
+    ModelLoad,
+    ModelSave,
+    Count
+};
+
+// Latency histogram (which also counts the calls), node visits and slowest calls of one
+// operation. Updates are relaxed atomic adds on one of METRICS_SHARDS
+// counter sets, so concurrent readers rarely share a cache line; the
+// histogram has four buckets per power of two (within 25%). The slowest
+// list takes its lock only for a call slower than the fastest in it.
+class OperationMetrics {
+public:
+    struct SlowCall {
+        std::string query;
+        uint64_t nanos;
+        uint64_t nodeVisits;
+    };
+    
+    static const size_t BUCKETS = 4 * METRICS_HISTOGRAM_OCTAVES;
+    
+    OperationMetrics() {
+        reset();
+    }
+    
+    void record(uint64_t nanos, uint64_t nodeVisits, const std::string& query) {
+        Shard& shard = shards[shardIndex()];
+        shard.nanos.fetch_add(nanos, std::memory_order_relaxed);
+        shard.nodeVisits.fetch_add(nodeVisits, std::memory_order_relaxed);
+        shard.buckets[bucketOf(nanos)].fetch_add(1, std::memory_order_relaxed);
+        if (nanos > slowThreshold.load(std::memory_order_relaxed)) {
+            recordSlow(nanos, nodeVisits, query);
+        }
+    }
+    
+    void reset() {
+        for (Shard& shard : shards) {
+            shard.nanos.store(0, std::memory_order_relaxed);
+            shard.nodeVisits.store(0, std::memory_order_relaxed);
+            for (auto& bucket : shard.buckets) bucket.store(0, std::memory_order_relaxed);
+        }
+        std::lock_guard<std::mutex> lock(slowMutex);
+        slowest.clear();
+        slowThreshold.store(0, std::memory_order_relaxed);
+    }
+    
+    uint64_t calls() const {
+        uint64_t total = 0;
+        for (const Shard& shard : shards) {
+            for (const auto& bucket : shard.buckets) total += bucket.load(std::memory_order_relaxed);
+        }
+        return total;
+    }
+    
+    uint64_t totalNanos() const { return sum(&Shard::nanos); }
+    uint64_t nodeVisits() const { return sum(&Shard::nodeVisits); }
+    
+    // Latency at percentile p (0-100), as the middle of its histogram bucket
+    double percentileNanos(double p) const {
+        std::vector<uint64_t> counts(BUCKETS, 0);
+        uint64_t total = 0;
+        for (const Shard& shard : shards) {
+            for (size_t i = 0; i < BUCKETS; i++) {
+                uint64_t count = shard.buckets[i].load(std::memory_order_relaxed);
+                counts[i] += count;
+                total += count;
+            }
+        }
+        if (total == 0) return 0;
+        uint64_t rank = std::max<uint64_t>(1, (uint64_t)std::ceil(p / 100 * total));
+        uint64_t seen = 0;
+        for (size_t i = 0; i < BUCKETS; i++) {
+            seen += counts[i];
+            if (seen >= rank) {
+                if (i < 4) return (double)i;
+                uint64_t width = 1ull << (i / 4 - 1);
+                return (double)((4 + i % 4) * width) + width / 2.0;
+            }
+        }
+        return 0;
+    }
+    
+    // Slowest calls, slowest first
+    std::vector<SlowCall> slowestCalls() const {
+        std::lock_guard<std::mutex> lock(slowMutex);
+        return slowest;
+    }
+    
+private:
+    struct Shard {
+        std::atomic<uint64_t> nanos;
+        std::atomic<uint64_t> nodeVisits;
+        std::atomic<uint64_t> buckets[BUCKETS];
+    };
+    
+    Shard shards[METRICS_SHARDS];
+    std::vector<SlowCall> slowest;                // Sorted slowest first
+    std::atomic<uint64_t> slowThreshold;          // Fastest call in a full slowest list
+    mutable std::mutex slowMutex;
+    
+    // Each thread keeps to one shard, handed out in turn
+    static size_t shardIndex() {
+        static std::atomic<size_t> nextShard(0);
+        thread_local size_t shard = nextShard.fetch_add(1, std::memory_order_relaxed) % METRICS_SHARDS;
+        return shard;
+    }
+    
+    // Bucket i < 4 holds exactly i; above that, four buckets per power of two
+    static size_t bucketOf(uint64_t nanos) {
+        if (nanos < 4) return (size_t)nanos;
+#ifdef __GNUC__
+        int msb = 63 - __builtin_clzll(nanos);
+#else
+        int msb = 0;
+        while (nanos >> (msb + 1)) msb++;
+#endif
+        size_t bucket = 4 * (size_t)(msb - 1) + (size_t)((nanos >> (msb - 2)) & 3);
+        return std::min(bucket, BUCKETS - 1);
+    }
+    
+    uint64_t sum(std::atomic<uint64_t> Shard::*counter) const {
+        uint64_t total = 0;
+        for (const Shard& shard : shards) total += (shard.*counter).load(std::memory_order_relaxed);
+        return total;
+    }
+    
+    // A query is listed once, at its slowest, so the list names distinct expensive queries
+    void recordSlow(uint64_t nanos, uint64_t nodeVisits, const std::string& query) {
+        std::lock_guard<std::mutex> lock(slowMutex);
+        auto same = std::find_if(slowest.begin(), slowest.end(), [&query](const SlowCall& call) { return call.query == query; });
+        if (same != slowest.end()) {
+            if (same->nanos >= nanos) return;
+            slowest.erase(same);
+        }
+        auto at = std::find_if(slowest.begin(), slowest.end(), [nanos](const SlowCall& call) { return call.nanos < nanos; });
+        if (at == slowest.end() && slowest.size() >= METRICS_SLOWEST) return;
+        slowest.insert(at, SlowCall{query, nanos, nodeVisits});
+        if (slowest.size() > METRICS_SLOWEST) slowest.pop_back();
+        if (slowest.size() == METRICS_SLOWEST) slowThreshold.store(slowest.back().nanos, std::memory_order_relaxed);
+    }
+};
+
+// Metrics for every MetricOperation. A copy starts empty, like ResultCache.
+class SystemMetrics {
+public:
+    SystemMetrics() : operations(new OperationMetrics[(size_t)MetricOperation::Count]) {}
+    SystemMetrics(const SystemMetrics&) : SystemMetrics() {}
+    
+    SystemMetrics& operator=(const SystemMetrics& other) {
+        if (this != &other) reset();
+        return *this;
+    }
+    
+    OperationMetrics& operator[](MetricOperation operation) {
+        return operations[(size_t)operation];
+    }
+    
+    const OperationMetrics& operator[](MetricOperation operation) const {
+        return operations[(size_t)operation];
+    }
+    
+    void reset() {
+        for (size_t i = 0; i < (size_t)MetricOperation::Count; i++) operations[i].reset();
+    }
+    
+    static const char* name(MetricOperation operation) {
+        static const char* const names[] = {"getSuggestions", "getFuzzySuggestions", "autoCorrect", "predictNextWord",
+                                            "insertWord", "loadModel", "saveModel"};
+        return names[(size_t)operation];
+    }
+    
+    // One line per operation that has been called, optionally followed by its slowest calls
+    void print(std::ostream& out, bool withSlowest) const {
+        for (size_t i = 0; i < (size_t)MetricOperation::Count; i++) {
+            const OperationMetrics& operation = operations[i];
+            uint64_t calls = operation.calls();
+            if (calls == 0) continue;
+            std::string label = name((MetricOperation)i);
+            out << label << std::string(label.size() < 16 ? 16 - label.size() : 1, ' ') << calls << " calls, mean "
+                << operation.totalNanos() / 1000.0 / calls << " us, p50 " << operation.percentileNanos(50) / 1000
+                << " / p95 " << operation.percentileNanos(95) / 1000 << " / p99 " << operation.percentileNanos(99) / 1000
+                << " us, " << (double)operation.nodeVisits() / calls << " nodes/call" << std::endl;
+            if (!withSlowest) continue;
+            std::vector<OperationMetrics::SlowCall> slowest = operation.slowestCalls();
+            if (slowest.empty()) continue;
+            out << "  slowest:";
+            for (size_t k = 0; k < slowest.size(); k++) {
+                out << (k ? ", " : " ") << "'" << slowest[k].query << "' " << slowest[k].nanos / 1000.0 << " us ("
+                    << slowest[k].nodeVisits << " nodes)";
+            }
+            out << std::endl;
+        }
+    }
+    
+    // The same as one JSON object keyed by operation name
+    void printJson(std::ostream& out) const {
+        out << "{";
+        for (size_t i = 0; i < (size_t)MetricOperation::Count; i++) {
+            const OperationMetrics& operation = operations[i];
+            uint64_t calls = operation.calls();
+            std::vector<OperationMetrics::SlowCall> slowest = operation.slowestCalls();
+            out << (i ? "," : "") << "\"" << name((MetricOperation)i) << "\":{\"calls\":" << calls
+                << ",\"mean_us\":" << (calls ? operation.totalNanos() / 1000.0 / calls : 0)
+                << ",\"p50_us\":" << operation.percentileNanos(50) / 1000
+                << ",\"p95_us\":" << operation.percentileNanos(95) / 1000
+                << ",\"p99_us\":" << operation.percentileNanos(99) / 1000
+                << ",\"max_us\":" << (slowest.empty() ? 0 : slowest[0].nanos / 1000.0)
+                << ",\"node_visits\":" << operation.nodeVisits() << ",\"slowest\":[";
+            for (size_t k = 0; k < slowest.size(); k++) {
+                out << (k ? "," : "") << "{\"query\":\"" << jsonEscape(slowest[k].query) << "\",\"us\":"
+                    << slowest[k].nanos / 1000.0 << ",\"nodes\":" << slowest[k].nodeVisits << "}";
+            }
+            out << "]}";
+        }
+        out << "}";
+    }
+    
+private:
+    std::unique_ptr<OperationMetrics[]> operations;
+    
+    static std::string jsonEscape(const std::string& text) {
+        std::string escaped;
+        for (char c : text) {
+            if (c == '"' || c == '\\') {
+                escaped += '\\';
+                escaped += c;
+            } else if ((unsigned char)c < 0x20) {
+                char code[8];
+                std::snprintf(code, sizeof(code), "\\u%04x", (unsigned char)c);
+                escaped += code;
+            } else {
+                escaped += c;
+            }
+        }
+        return escaped;
+    }
+};
+
+// Times one call from construction to destruction and records it with the
+// trie nodes this thread visited meanwhile. `query` must outlive the timer.
+class MetricsTimer {
+public:
+    MetricsTimer(SystemMetrics& metrics, MetricOperation operation, const std::string& query)
+        : metrics(metrics[operation]), query(query), startVisits(trieNodeVisits),
+          start(std::chrono::steady_clock::now()) {}
+    
+    ~MetricsTimer() {
+        auto elapsed = std::chrono::duration_cast<std::chrono::nanoseconds>(std::chrono::steady_clock::now() - start);
+        metrics.record((uint64_t)elapsed.count(), trieNodeVisits - startVisits, query);
+    }
+    
+private:
+    OperationMetrics& metrics;
+    const std::string& query;
+    uint64_t startVisits;
+    std::chrono::steady_clock::time_point start;
+};
+
+// Results of a batch query packed into flat buffers, which keep their
+// capacity when the same object is reused for the next batch
+struct BatchResults {
+    std::string text;                                    // All result words back to back
+    std::vector<uint32_t> wordEnds;                      // End of word i in text
+    std::vector<std::pair<uint32_t, uint32_t>> queries;  // Per query: first word index, word count
+    
+    void clear() {
+        text.clear();
+        wordEnds.clear();
+        queries.clear();
+    }
+    
+    size_t wordCount(size_t query) const {
+        return queries[query].second;
+    }
+    
+    std::string word(size_t query, size_t i) const {
+        size_t index = queries[query].first + i;
+        size_t start = index ? wordEnds[index - 1] : 0;
+        return text.substr(start, wordEnds[index] - start);
+    }
+    
+    std::vector<std::string> results(size_t query) const {
+        std::vector<std::string> words;
+        for (size_t i = 0; i < wordCount(query); i++) {
+            words.push_back(word(query, i));
+        }
+        return words;
+    }
+    
+    // Move another part's words onto the end; its queries' ranges shift with them
+    void appendPart(const BatchResults& part, const std::vector<uint32_t>& order, size_t begin, size_t end) {
+        uint32_t wordBase = (uint32_t)wordEnds.size();
+        uint32_t textBase = (uint32_t)text.size();
+        text += part.text;
+        for (uint32_t wordEnd : part.wordEnds) {
+            wordEnds.push_back(textBase + wordEnd);
+        }
+        for (size_t i = begin; i < end; i++) {
+            queries[order[i]].first += wordBase;
+        }
+    }
+};
+
+// Fixed set of worker threads for splitting one job into independent tasks.
+// The calling thread works on the job too, so n workers run n + 1 tasks at
+// a time.
+class WorkerPool {
+private:
+    struct Job {
+        const std::function<void(size_t)>* task;
+        size_t count;
+        std::atomic<size_t> next;   // Next task to hand out
+        size_t finished;            // Guarded by mutex
+    };
+    
+    std::vector<std::thread> threads;
+    std::mutex mutex;
+    std::condition_variable wake;
+    std::condition_variable done;
+    std::shared_ptr<Job> current;   // Latest job; a late worker only ever sees its own
+    bool stopping;
+    
+    void runTasks(Job& job) {
+        size_t finished = 0;
+        for (size_t task = job.next++; task < job.count; task = job.next++) {
+            (*job.task)(task);
+            finished++;
+        }
+        if (finished) {
+            std::lock_guard<std::mutex> lock(mutex);
+            job.finished += finished;
+            if (job.finished == job.count) done.notify_all();
+        }
+    }
+    
+    void workerLoop() {
+        std::shared_ptr<Job> seen;
+        while (true) {
+            {
+                std::unique_lock<std::mutex> lock(mutex);
+                wake.wait(lock, [&]() { return stopping || current != seen; });
+                if (stopping) return;
+                seen = current;
+            }
+            runTasks(*seen);
+        }
+    }
+    
+public:
+    // 0 workers: one per hardware thread besides the caller's
+    explicit WorkerPool(int workerCount = 0) : stopping(false) {
+        if (workerCount <= 0) workerCount = std::max(1, (int)std::thread::hardware_concurrency()) - 1;
+        for (int i = 0; i < workerCount; i++) {
+            threads.emplace_back(&WorkerPool::workerLoop, this);
+        }
+    }
+    
+    ~WorkerPool() {
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            stopping = true;
+        }
+        wake.notify_all();
+        for (auto& thread : threads) {
+            thread.join();
+        }
+    }
+    
+    WorkerPool(const WorkerPool&) = delete;
+    WorkerPool& operator=(const WorkerPool&) = delete;
+    
+    size_t size() const {
+        return threads.size();
+    }
+    
+    // Run task(0) .. task(count - 1) across the pool; returns when all are done
+    void parallelFor(size_t count, const std::function<void(size_t)>& task) {
+        if (count == 0) return;
+        std::shared_ptr<Job> job(new Job());
+        job->task = &task;
+        job->count = count;
+        job->next = 0;
+        job->finished = 0;
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            current = job;
+        }
+        wake.notify_all();
+        runTasks(*job);
+        
+        std::unique_lock<std::mutex> lock(mutex);
+        done.wait(lock, [&]() { return job->finished == job->count; });
+    }
+};
+
+// Write-ahead journal of learning events for a text model file. Each event
+// is a line in the text model format ("word delta", "@2 w1 w2 delta", ...),
+// "!word" for a removed word, or "#rescale divisor" when frequency decay
+// divided every count learned so far.
+// Appending only copies into a buffer; a writer thread commits whatever has
+// been buffered every JOURNAL_COMMIT_INTERVAL_MS with one write and one
+// fsync. The journal is split into numbered segments next to the snapshot
+// (model.txt.journal.1, .2, ...), and the snapshot's "#absorbed n" line
+// records which segments it already includes. Compaction switches to a new
+// segment and, in the background, merges the snapshot with the finished
+// segments into a new snapshot that replaces the old one by rename, so a
+// crash at any point leaves the snapshot plus newer segments intact.
+// A copy of a journal starts closed.
+class LearningJournal {
+private:
+    std::string snapshotPath;
+    std::FILE* file;
+    int segment;                  // Segment being appended to (writer thread)
+    uint64_t segmentBytes;        // Writer thread
+    
+    std::mutex mutex;
+    std::condition_variable changed;
+    std::condition_variable committed;
+    std::string pending;          // Appended, not yet written
+    uint64_t appendedBytes;
+    uint64_t committedBytes;
+    bool compactRequested;
+    bool stopping;
+    bool open;
+    
+    std::thread writer;
+    std::thread compactor;
+    std::atomic<bool> compacting;
+    
+    // Write and fsync one batch; false if the disk refused it
+    bool commit(const std::string& batch) {
+        if (batch.empty()) return true;
+        bool ok = std::fwrite(batch.data(), 1, batch.size(), file) == batch.size() && std::fflush(file) == 0;
+#ifdef HAVE_MMAP
+        ok = ok && fsync(fileno(file)) == 0;
+#endif
+        segmentBytes += batch.size();
+        return ok;
+    }
+    
+    void writerLoop() {
+        std::string batch;
+        while (true) {
+            bool last;
+            {
+                std::unique_lock<std::mutex> lock(mutex);
+                changed.wait(lock, [this]() { return stopping || compactRequested || !pending.empty(); });
+                if (stopping && pending.empty()) return;
+                last = stopping;
+            }
+            
+            // Let more events arrive so one fsync covers many of them
+            if (!last) std::this_thread::sleep_for(std::chrono::milliseconds(JOURNAL_COMMIT_INTERVAL_MS));
+            uint64_t upTo;
+            bool rotate;
+            {
+                std::lock_guard<std::mutex> lock(mutex);
+                batch.swap(pending);
+                upTo = appendedBytes;
+                rotate = compactRequested;
+                compactRequested = false;
+            }
+            if (!commit(batch)) {
+                std::cout << "Error: Could not write journal for " << snapshotPath << std::endl;
+            }
+            batch.clear();
+            
+            if (rotate || (segmentBytes >= JOURNAL_COMPACT_BYTES && !compacting)) {
+                startCompaction();
+            }
+            {
+                std::lock_guard<std::mutex> lock(mutex);
+                committedBytes = upTo;
+            }
+            committed.notify_all();
+        }
+    }
+    
+    // Finish the current segment and merge everything up to it in the background
+    void startCompaction() {
+        if (compactor.joinable()) compactor.join();
+        std::FILE* next = std::fopen(segmentPath(snapshotPath, segment + 1).c_str(), "ab");
+        if (!next) {
+            std::cout << "Error: Could not start a new journal segment for " << snapshotPath << std::endl;
+            return;
+        }
+        std::fclose(file);
+        file = next;
+        segmentBytes = 0;
+        int finished = segment++;
+        compacting = true;
+        compactor = std::thread([this, finished]() {
+            mergeSegments(snapshotPath, finished);
+            compacting = false;
+        });
+    }
+    
+public:
+    LearningJournal()
+        : file(nullptr), segment(0), segmentBytes(0), appendedBytes(0), committedBytes(0),
+          compactRequested(false), stopping(false), open(false), compacting(false) {}
+    
+    LearningJournal(const LearningJournal&) : LearningJournal() {}
+    
+    LearningJournal& operator=(const LearningJournal&) {
+        return *this;  // A system's journal stays its own
+    }
+    
+    ~LearningJournal() {
+        close();
+    }
+    
+    static std::string segmentPath(const std::string& snapshot, int number) {
+        return snapshot + ".journal." + std::to_string(number);
+    }
+    
+    static bool fileExists(const std::string& name) {
+        return std::ifstream(name).good();
+    }
+    
+    // The segments a snapshot already includes, from its "#absorbed n" line
+    static int absorbedSegments(const std::string& snapshot) {
+        std::ifstream file(snapshot);
+        std::string tag;
+        int absorbed = 0;
+        if (file >> tag && tag == "#absorbed" && file >> absorbed) return absorbed;
+        return 0;
+    }
+    
+    // Highest journal segment present for a snapshot
+    static int lastSegment(const std::string& snapshot) {
+        int last = absorbedSegments(snapshot);
+        while (fileExists(segmentPath(snapshot, last + 1))) last++;
+        return last;
+    }
+    
+    // Read the complete lines of a journal segment; a torn final line from
+    // an interrupted write is ignored
+    template <typename Callback>
+    static void readSegment(const std::string& name, Callback onLine) {
+        std::ifstream in(name);
+        std::string line;
+        while (std::getline(in, line)) {
+            if (in.eof()) break;  // No newline: the write never completed
+            onLine(line);
+        }
+    }
+    
+    // Fold segments up to `upTo` into the snapshot: values of identical
+    // lines (everything before the last space) are summed, a "!word" line
+    // drops the word and its n-grams, a "#rescale" line divides the totals so
+    // far and drops what decay would have pruned, words are written before
+    // n-grams, and the result replaces the snapshot by rename
+    static bool mergeSegments(const std::string& snapshot, int upTo) {
+        std::vector<std::string> keys;
+        std::unordered_map<std::string, long long> totals;
+        
+        // Erase the totals of these words and of every n-gram that mentions one
+        auto dropWords = [&](const std::unordered_set<std::string>& words) {
+            for (auto it = totals.begin(); it != totals.end();) {
+                bool mentions = words.count(it->first) != 0;
+                if (it->first[0] == '@') {
+                    std::istringstream iss(it->first);
+                    std::string word;
+                    iss >> word;  // Order tag
+                    while (!mentions && iss >> word) mentions = words.count(word) != 0;
+                }
+                it = mentions ? totals.erase(it) : std::next(it);
+            }
+        };
+        auto rescale = [&](double divisor) {
+            std::unordered_set<std::string> expired;
+            for (auto it = totals.begin(); it != totals.end();) {
+                it->second = std::llround(it->second / divisor);
+                bool ngram = it->first[0] == '@';
+                if (!ngram && it->second < DECAY_PRUNE_FREQUENCY) expired.insert(it->first);
+                it = (ngram && it->second <= 0) ? totals.erase(it) : std::next(it);
+            }
+            if (!expired.empty()) dropWords(expired);
+        };
+        auto addLine = [&](const std::string& line) {
+            if (!line.empty() && line[0] == '!') {
+                dropWords({line.substr(1)});
+                return;
+            }
+            if (line.compare(0, 9, "#rescale ") == 0) {
+                double divisor = std::atof(line.c_str() + 9);
+                if (divisor > 0) rescale(divisor);
+                return;
+            }
+            size_t space = line.rfind(' ');
+            if (line.empty() || line[0] == '#' || space == std::string::npos) return;
+            std::string key = line.substr(0, space);
+            long long value = std::atoll(line.c_str() + space + 1);
+            auto inserted = totals.insert({key, value});
+            if (inserted.second) {
+                keys.push_back(key);
+            } else {
+                inserted.first->second += value;
+            }
+        };
+        
+        int absorbed = absorbedSegments(snapshot);
+        {
+            std::ifstream in(snapshot);
+            std::string line;
+            while (std::getline(in, line)) addLine(line);
+        }
+        for (int number = absorbed + 1; number <= upTo; number++) {
+            readSegment(segmentPath(snapshot, number), addLine);
+        }
+        
+        std::string text = "#absorbed " + std::to_string(upTo) + "\n";
+        for (int ngrams = 0; ngrams < 2; ngrams++) {
+            for (const auto& key : keys) {
+                auto total = totals.find(key);
+                if (total == totals.end() || (key[0] == '@') != (ngrams == 1)) continue;
+                text += key;
+                text += ' ';
+                text += std::to_string(total->second);
+                text += '\n';
+                totals.erase(total);  // A key re-learned after a removal is listed twice
+            }
+        }
+        if (!replaceFile(snapshot, text)) return false;
+        removeSegments(snapshot, upTo);
+        return true;
+    }
+    
+    // Write a file through a temporary and rename it into place, so readers
+    // see either the old contents or the complete new ones
+    static bool replaceFile(const std::string& name, const std::string& text) {
+        std::string temporary = name + ".tmp";
+        std::FILE* out = std::fopen(temporary.c_str(), "wb");
+        if (!out) return false;
+        bool ok = std::fwrite(text.data(), 1, text.size(), out) == text.size() && std::fflush(out) == 0;
+#ifdef HAVE_MMAP
+        ok = ok && fsync(fileno(out)) == 0;
+#endif
+        ok = (std::fclose(out) == 0) && ok;
+        if (!ok || std::rename(temporary.c_str(), name.c_str()) != 0) {
+            std::remove(temporary.c_str());
+            return false;
+        }
+        return true;
+    }
+    
+    // Delete segments up to `upTo` once a snapshot includes them
+    static void removeSegments(const std::string& snapshot, int upTo) {
+        for (int number = upTo; number > 0 && std::remove(segmentPath(snapshot, number).c_str()) == 0; number--) {}
+    }
+    
+    // Start appending to segment `number` of a snapshot's journal
+    bool openSegment(const std::string& snapshot, int number) {
+        close();
+        file = std::fopen(segmentPath(snapshot, number).c_str(), "ab");
+        if (!file) return false;
+        snapshotPath = snapshot;
+        segment = number;
+        segmentBytes = 0;
+        stopping = false;
+        open = true;
+        writer = std::thread(&LearningJournal::writerLoop, this);
+        return true;
+    }
+    
+    // Commit everything appended, wait for any compaction, and stop
+    void close() {
+        if (!open) return;
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            stopping = true;
+        }
+        changed.notify_all();
+        writer.join();
+        if (compactor.joinable()) compactor.join();
+        std::fclose(file);
+        file = nullptr;
+        open = false;
+    }
+    
+    bool isOpen() const {
+        return open;
+    }
+    
+    const std::string& path() const {
+        return snapshotPath;
+    }
+    
+    // Buffer one event line; it reaches the disk with the next group commit
+    void append(const std::string& line) {
+        std::lock_guard<std::mutex> lock(mutex);
+        bool wasEmpty = pending.empty();
+        pending += line;
+        pending += '\n';
+        appendedBytes += line.size() + 1;
+        if (wasEmpty) changed.notify_one();
+    }
+    
+    // Block until every event appended so far is on disk
+    void sync() {
+        std::unique_lock<std::mutex> lock(mutex);
+        uint64_t target = appendedBytes;
+        changed.notify_one();
+        committed.wait(lock, [&]() { return committedBytes >= target || !open; });
+    }
+    
+    // Merge the journal into a new snapshot in the background
+    void compact() {
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            compactRequested = true;
+        }
+        changed.notify_one();
+    }
+};
+
+// How getSuggestions finds the best completions below a prefix
+enum class SuggestionStrategy {
+    CompletionCache,   // Read the ranked list cached on the prefix node: O(m + k)
+    BestFirstSearch,   // Priority-queue search guided by subtree frequency bounds, no caches
+    SubtreeWalk        // Collect the whole subtree and sort it
+};
+
+// Main Predictive Text System with ML capabilities
+class PredictiveTextSystem {
+private:
+    friend class CompletionSession;
+    friend class PersonalizedText;
+    friend class ConcurrentPredictiveText;
+    
+    std::vector<TrieNode> nodes;                        // Node pool; root is ROOT_NODE
+    std::string labels;                                 // Arena for multi-character edge labels
+    bool pathCompression;                               // Radix mode: single-child chains share one edge
+    std::vector<std::vector<NodeId>> completionCaches;  // Per node, only for CompletionCache
+    SuggestionStrategy strategy;
+    bool deleteIndexEnabled;                            // Autocorrect through deleteIndex instead of a trie walk
+    std::unordered_map<std::string, std::vector<NodeId>> deleteIndex;  // Word with characters deleted -> word nodes
+    
+    // Next-word counts, keyed by the word ids of the context
+    struct Successor {
+        NodeId word;
+        int count;
+    };
+    typedef std::vector<Successor> SuccessorList;           // Highest count first
+    std::unordered_map<NodeId, SuccessorList> bigrams;      // Previous word -> next words
+    std::unordered_map<uint64_t, SuccessorList> trigrams;   // trigramKey(word before, previous word) -> next words
+    mutable ResultCache resultCache;                        // getSuggestions results by prefix
+    LearningJournal journal;                                // Learning events since the last text snapshot
+    std::vector<NodeId> freeNodes;                          // Pool slots of removed words, reused by allocateNode
+    size_t labelGarbage;                                    // Label arena bytes of freed nodes
+    size_t memoryBudget;                                    // Trie bytes in use before eviction; 0 = unlimited
+    size_t budgetCheckNodes;                                // Live node count at which the budget is checked again
+    double decayHalfLife;                                   // Seconds for learned weight to halve; 0 = no decay
+    std::chrono::steady_clock::time_point decayEpoch;       // Stored counts are weights times 2^((now - epoch) / half-life)
+    size_t wordCount;                                       // Words in the trie, kept current by every update
+    long long frequencyTotal;                               // Sum of stored word counts
+    mutable SystemMetrics metrics;                          // Hot-path latencies and node visits
+    std::vector<NodeId> insertPath;                         // addWordFrequency's path, reused between calls
+    
+    // Case-fold a string (UTF-8 aware); hot paths use FoldedText instead
+    static std::string toLower(const std::string& str) {
+        std::string result;
+        Utf8::foldText(str.data(), str.size(), result);
+        return result;
+    }
+    
+    // Read-only view of the pool; pointers are only valid until the next insert
+    TrieView view() const {
+        return TrieView(nodes.data(), labels.data());
+    }
+    
+    char edgeChar(NodeId node, size_t i) const { return view().edgeChar(node, i); }
+    void appendLabel(NodeId node, std::string& out) const { view().appendLabel(node, out); }
+    NodeId findChild(NodeId parent, char ch) const { return view().findChild(parent, ch); }
+    std::string wordAt(NodeId node) const { return view().wordAt(node); }
+    bool wordLess(NodeId a, NodeId b) const { return view().wordLess(a, b); }
+    NodeId findPrefixNode(const std::string& prefix, bool* exact = nullptr) const {
+        return view().findPrefixNode(prefix, exact);
+    }
+    
+    // A fresh node, reusing the slot of a removed one when there is one
+    NodeId allocateNode(NodeId parent, char ch) {
+        if (freeNodes.empty()) {
+            nodes.push_back(TrieNode(parent, ch));
+            if (strategy == SuggestionStrategy::CompletionCache) {
+                completionCaches.emplace_back();
+            }
+            return (NodeId)(nodes.size() - 1);
+        }
+        NodeId node = freeNodes.back();
+        freeNodes.pop_back();
+        nodes[node] = TrieNode(parent, ch);
+        return node;
+    }
+    
+    // Take a node out of its parent's sibling list
+    void unlinkChild(NodeId parent, NodeId child) {
+        if (nodes[parent].firstChild == child) {
+            nodes[parent].firstChild = nodes[child].nextSibling;
+        } else {
+            NodeId sibling = nodes[parent].firstChild;
+            while (nodes[sibling].nextSibling != child) sibling = nodes[sibling].nextSibling;
+            nodes[sibling].nextSibling = nodes[child].nextSibling;
+        }
+    }
+    
+    // Link a new node holding word[from, from + length) into the parent's sorted sibling list
+    NodeId addChild(NodeId parent, const std::string& word, size_t from, size_t length) {
+        NodeId previous = NO_NODE;
+        NodeId next = nodes[parent].firstChild;
+        while (next != NO_NODE && (unsigned char)nodes[next].label < (unsigned char)word[from]) {
+            previous = next;
+            next = nodes[next].nextSibling;
+        }
+        
+        NodeId added = allocateNode(parent, word[from]);
+        if (length > 1) {
+            nodes[added].labelStart = (uint32_t)labels.size();
+            nodes[added].labelLength = (uint16_t)length;
+            labels.append(word, from, length);
+        }
+        nodes[added].nextSibling = next;
+        if (previous == NO_NODE) {
+            nodes[parent].firstChild = added;
+        } else {
+            nodes[previous].nextSibling = added;
+        }
+        return added;
+    }
+    
+    // Split a node's edge after `keep` characters. The new upper node takes the
+    // node's place among its siblings; the node keeps its id and subtree.
+    NodeId splitEdge(NodeId node, size_t keep) {
+        NodeId upper = allocateNode(nodes[node].parent, nodes[node].label);
+        
+        TrieNode& top = nodes[upper];
+        TrieNode& bottom = nodes[node];
+        top.labelStart = bottom.labelStart;
+        top.labelLength = (uint16_t)keep;
+        top.maxSubtreeFrequency = bottom.maxSubtreeFrequency;
+        top.firstChild = node;
+        top.nextSibling = bottom.nextSibling;
+        
+        bottom.labelStart += (uint32_t)keep;
+        bottom.labelLength -= (uint16_t)keep;
+        bottom.label = labels[bottom.labelStart];
+        labelGarbage += (keep == 1) + (bottom.labelLength == 1);  // One-character edges only use `label`
+        bottom.parent = upper;
+        bottom.nextSibling = NO_NODE;
+        
+        NodeId parent = top.parent;
+        if (nodes[parent].firstChild == node) {
+            nodes[parent].firstChild = upper;
+        } else {
+            NodeId sibling = nodes[parent].firstChild;
+            while (nodes[sibling].nextSibling != node) sibling = nodes[sibling].nextSibling;
+            nodes[sibling].nextSibling = upper;
+        }
+        if (strategy == SuggestionStrategy::CompletionCache) {
+            completionCaches[upper] = completionCaches[node];  // Same subtree, same best words
+        }
+        return upper;
+    }
+    
+    // Recursively collect all words with given prefix
+    void collectSuggestions(NodeId node, std::string& prefix, std::vector<std::pair<std::string, int>>& suggestions) const {
+        trieNodeVisits++;
+        if (nodes[node].isEndOfWord) {
+            suggestions.push_back({prefix, nodes[node].frequency});
+        }
+        
+        for (NodeId child = nodes[node].firstChild; child != NO_NODE; child = nodes[child].nextSibling) {
+            size_t length = prefix.size();
+            appendLabel(child, prefix);
+            collectSuggestions(child, prefix, suggestions);
+            prefix.resize(length);
+        }
+    }
+    
+    // Top completions of a lowercased prefix under the current strategy
+    std::vector<std::string> rankedSuggestions(const std::string& lowerPrefix, int maxSuggestions) const {
+        NodeId prefixNode = findPrefixNode(lowerPrefix);
+        
+        if (prefixNode == NO_NODE) return {};
+        
+        // Fast path: the prefix node already knows its best completions
+        if (strategy == SuggestionStrategy::CompletionCache && maxSuggestions <= COMPLETION_CACHE_SIZE) {
+            std::vector<std::string> result;
+            const std::vector<NodeId>& cache = completionCaches[prefixNode];
+            for (int i = 0; i < std::min(maxSuggestions, (int)cache.size()); i++) {
+                result.push_back(wordAt(cache[i]));
+            }
+            return result;
+        }
+        
+        if (strategy != SuggestionStrategy::SubtreeWalk) {
+            return view().bestFirstSuggestions(prefixNode, maxSuggestions);
+        }
+        
+        // Collect all words with this prefix; the prefix may end inside the node's edge
+        std::vector<std::pair<std::string, int>> suggestions;
+        std::string nodePath = wordAt(prefixNode);
+        collectSuggestions(prefixNode, nodePath, suggestions);
+        
+        // Sort by frequency (ML element) then alphabetically
+        std::sort(suggestions.begin(), suggestions.end(), 
+                 [](const std::pair<std::string, int>& a, const std::pair<std::string, int>& b) {
+                     if (a.second != b.second) {
+                         return a.second > b.second; // Higher frequency first
+                     }
+                     return a.first < b.first; // Alphabetical for same frequency
+                 });
+        
+        // Extract top suggestions
+        std::vector<std::string> result;
+        for (int i = 0; i < std::min(maxSuggestions, (int)suggestions.size()); i++) {
+            result.push_back(suggestions[i].first);
+        }
+        
+        return result;
+    }
+    
+    // Ranking used everywhere: higher frequency first, then alphabetical
+    bool ranksHigher(NodeId a, NodeId b) const {
+        if (nodes[a].frequency != nodes[b].frequency) {
+            return nodes[a].frequency > nodes[b].frequency;
+        }
+        return wordLess(a, b);
+    }
+    
+    // Move a word whose frequency grew into its place in a node's completion cache
+    void promoteInCache(NodeId node, NodeId wordNode) {
+        std::vector<NodeId>& cache = completionCaches[node];
+        auto it = std::find(cache.begin(), cache.end(), wordNode);
+        if (it == cache.end()) {
+            if (cache.size() >= COMPLETION_CACHE_SIZE) {
+                if (!ranksHigher(wordNode, cache.back())) return;
+                cache.pop_back();
+            }
+            cache.push_back(wordNode);
+            it = cache.end() - 1;
+        }
+        
+        // Bubble up to the new rank; the rest of the list stays sorted
+        while (it != cache.begin() && ranksHigher(*it, *(it - 1))) {
+            std::iter_swap(it, it - 1);
+            --it;
+        }
+    }
+    
+    // Rebuild a node's completion cache from its own word and its children's caches
+    void rebuildCache(NodeId node) {
+        std::vector<NodeId> candidates;
+        if (nodes[node].isEndOfWord) {
+            candidates.push_back(node);
+        }
+        for (NodeId child = nodes[node].firstChild; child != NO_NODE; child = nodes[child].nextSibling) {
+            candidates.insert(candidates.end(), completionCaches[child].begin(), completionCaches[child].end());
+        }
+        
+        size_t keep = std::min(candidates.size(), (size_t)COMPLETION_CACHE_SIZE);
+        std::partial_sort(candidates.begin(), candidates.begin() + keep, candidates.end(),
+                          [this](NodeId a, NodeId b) { return ranksHigher(a, b); });
+        candidates.resize(keep);
+        completionCaches[node].swap(candidates);
+    }
+    
+    // Rebuild every completion cache below a node (post-order)
+    void rebuildAllCaches(NodeId node) {
+        for (NodeId child = nodes[node].firstChild; child != NO_NODE; child = nodes[child].nextSibling) {
+            rebuildAllCaches(child);
+        }
+        rebuildCache(node);
+    }
+    
+    // Recompute a node's frequency bound from its own word and its children
+    void refreshSubtreeBound(NodeId node) {
+        int bound = nodes[node].isEndOfWord ? nodes[node].frequency : std::numeric_limits<int>::min();
+        for (NodeId child = nodes[node].firstChild; child != NO_NODE; child = nodes[child].nextSibling) {
+            bound = std::max(bound, nodes[child].maxSubtreeFrequency);
+        }
+        nodes[node].maxSubtreeFrequency = bound;
+    }
+    
+    // Remove words from the vocabulary. Their n-grams and delete-index
+    // entries go with them, branches left without words are unlinked and
+    // their nodes freed for reuse, and bounds and caches above are refreshed.
+    // Remaining word ids stay valid; a radix edge left with one child is not
+    // merged back into it.
+    void eraseWords(const std::vector<NodeId>& words) {
+        std::vector<char> removed(nodes.size(), 0);
+        std::vector<NodeId> doomed;
+        for (NodeId word : words) {
+            if (!nodes[word].isEndOfWord) continue;
+            std::string text = wordAt(word);
+            resultCache.invalidateWord(text);
+            if (deleteIndexEnabled) unindexWordDeletes(word, text);
+            wordCount--;
+            frequencyTotal -= nodes[word].frequency;
+            nodes[word].isEndOfWord = false;
+            nodes[word].frequency = 0;
+            removed[word] = 1;
+            doomed.push_back(word);
+        }
+        if (doomed.empty()) return;
+        dropNgrams(removed);
+        
+        bool cachesEnabled = (strategy == SuggestionStrategy::CompletionCache);
+        std::vector<char> stale(nodes.size(), 0);
+        for (NodeId node : doomed) {
+            if (nodes[node].parent == NO_NODE) continue;  // Freed with a longer removed word
+            
+            // Free the childless, wordless chain above the word
+            while (node != ROOT_NODE && !nodes[node].isEndOfWord && nodes[node].firstChild == NO_NODE) {
+                NodeId parent = nodes[node].parent;
+                unlinkChild(parent, node);
+                if (nodes[node].labelLength > 1) labelGarbage += nodes[node].labelLength;
+                nodes[node] = TrieNode();  // No parent marks a free slot
+                if (cachesEnabled) std::vector<NodeId>().swap(completionCaches[node]);
+                freeNodes.push_back(node);
+                stale[node] = 0;
+                node = parent;
+            }
+            for (; node != NO_NODE && !stale[node]; node = nodes[node].parent) {
+                stale[node] = 1;
+            }
+        }
+        refreshStale(ROOT_NODE, stale);
+        if (labelGarbage > labels.size() / 2) compactLabels();
+    }
+    
+    // Copy the labels of live nodes into a fresh arena
+    void compactLabels() {
+        std::string live;
+        for (TrieNode& node : nodes) {
+            if (node.labelLength > 1) {
+                size_t start = live.size();
+                live.append(labels, node.labelStart, node.labelLength);
+                node.labelStart = (uint32_t)start;
+            }
+        }
+        labels.swap(live);
+        labelGarbage = 0;
+    }
+    
+    // Remove words, recording each removal in the journal
+    void forgetWords(const std::vector<NodeId>& words) {
+        if (journal.isOpen()) {
+            for (NodeId word : words) journal.append("!" + wordAt(word));
+        }
+        eraseWords(words);
+    }
+    
+    // Trie bytes the memory budget counts: live nodes, live label characters
+    // and completion cache entries
+    size_t trieBytesInUse() const {
+        size_t liveNodes = nodes.size() - freeNodes.size();
+        size_t bytes = liveNodes * sizeof(TrieNode) + labels.size() - labelGarbage;
+        if (strategy == SuggestionStrategy::CompletionCache) {
+            bytes += liveNodes * sizeof(std::vector<NodeId>);
+            for (const auto& cache : completionCaches) {
+                bytes += cache.size() * sizeof(NodeId);
+            }
+        }
+        return bytes;
+    }
+    
+    // Over budget, evict the least frequent words (ties by node id, which
+    // is deterministic) until the trie is back to MEMORY_BUDGET_LOW_WATER
+    // percent of it. `keep` is never evicted. The full check runs only after
+    // enough new nodes could have filled the remaining room, so its cost is
+    // spread over many inserts.
+    void enforceMemoryBudget(NodeId keep) {
+        if (memoryBudget == 0 || nodes.size() - freeNodes.size() < budgetCheckNodes) return;
+        
+        size_t used = trieBytesInUse();
+        if (used > memoryBudget) {
+            std::vector<std::pair<int, NodeId>> candidates;
+            for (NodeId node = 0; node < nodes.size(); node++) {
+                if (nodes[node].isEndOfWord && node != keep) candidates.push_back({nodes[node].frequency, node});
+            }
+            
+            // How much a word frees is unknown up front (prefixes are
+            // shared), so evict in rounds sized by the average per word
+            size_t target = memoryBudget / 100 * MEMORY_BUDGET_LOW_WATER;
+            double bytesPerNode = (double)used / (nodes.size() - freeNodes.size());
+            double estimate = (double)used;
+            auto next = candidates.begin();
+            while (estimate > target && next != candidates.end()) {
+                double bytesPerWord = estimate / (candidates.end() - next + 1);
+                auto last = next + std::min<size_t>(candidates.end() - next, (size_t)((estimate - target) / bytesPerWord) + 1);
+                std::nth_element(next, last - 1, candidates.end());
+                std::vector<NodeId> victims;
+                for (; next != last; ++next) victims.push_back(next->second);
+                size_t freeBefore = freeNodes.size();
+                forgetWords(victims);
+                estimate -= (freeNodes.size() - freeBefore) * bytesPerNode;
+            }
+            used = trieBytesInUse();
+        }
+        // New nodes can cost more than the average, so check again halfway
+        size_t liveNodes = nodes.size() - freeNodes.size();
+        size_t room = used < memoryBudget ? (size_t)((memoryBudget - used) / ((double)used / liveNodes)) : 0;
+        budgetCheckNodes = liveNodes + room / 2 + 1;
+    }
+    
+    // Refresh the bounds and caches of stale nodes, children first; the
+    // ancestors of a stale node are stale too
+    void refreshStale(NodeId node, const std::vector<char>& stale) {
+        for (NodeId child = nodes[node].firstChild; child != NO_NODE; child = nodes[child].nextSibling) {
+            if (stale[child]) refreshStale(child, stale);
+        }
+        refreshSubtreeBound(node);
+        if (strategy == SuggestionStrategy::CompletionCache) rebuildCache(node);
+    }
+    
+    // Drop the n-grams that mention a removed word
+    void dropNgrams(const std::vector<char>& removed) {
+        auto dropSuccessors = [&removed](SuccessorList& successors) {
+            successors.erase(std::remove_if(successors.begin(), successors.end(),
+                                            [&removed](const Successor& next) { return removed[next.word] != 0; }),
+                             successors.end());
+            return successors.empty();
+        };
+        for (auto it = bigrams.begin(); it != bigrams.end();) {
+            it = (removed[it->first] || dropSuccessors(it->second)) ? bigrams.erase(it) : std::next(it);
+        }
+        for (auto it = trigrams.begin(); it != trigrams.end();) {
+            bool context = removed[(NodeId)(it->first >> 32)] || removed[(NodeId)it->first];
+            it = (context || dropSuccessors(it->second)) ? trigrams.erase(it) : std::next(it);
+        }
+    }
+    
+    // Factor between stored counts and decayed weights right now
+    double decayScale() const {
+        if (decayHalfLife <= 0) return 1.0;
+        double elapsed = std::chrono::duration<double>(std::chrono::steady_clock::now() - decayEpoch).count();
+        return std::exp2(elapsed / decayHalfLife);
+    }
+    
+    // Stored count for a learning event of the given weight. Recent events
+    // are stored larger, which ages every older count without touching it.
+    int scaledIncrease(int weight) {
+        if (decayHalfLife <= 0) return weight;
+        int halvings = agingDue();
+        if (halvings) ageFrequencies(halvings);
+        return clampFrequency((long long)std::llround(weight * decayScale()));
+    }
+    
+    // Weight a stored count stands for at the given decay scale
+    static int decayedWeight(int count, double scale) {
+        return scale == 1.0 ? count : (int)std::llround(count / scale);
+    }
+    
+    static int clampFrequency(long long frequency) {
+        return (int)std::max<long long>(std::min<long long>(frequency, std::numeric_limits<int>::max()),
+                                        std::numeric_limits<int>::min() + 1);
+    }
+    
+    // Whole half-lives to fold into the stored counts once the decay scale
+    // reaches 2^DECAY_RESCALE_HALF_LIVES, else 0
+    int agingDue() const {
+        if (decayHalfLife <= 0 || decayScale() < (double)(1 << DECAY_RESCALE_HALF_LIVES)) return 0;
+        double elapsed = std::chrono::duration<double>(std::chrono::steady_clock::now() - decayEpoch).count();
+        return std::max(1, std::min(30, (int)(elapsed / decayHalfLife)));
+    }
+    
+    // Fold `halvings` half-lives of the decay scale into the stored counts
+    void ageFrequencies(int halvings) {
+        decayEpoch += std::chrono::duration_cast<std::chrono::steady_clock::duration>(
+            std::chrono::duration<double>(halvings * decayHalfLife));
+        rescaleFrequencies(std::ldexp(1.0, halvings));
+    }
+    
+    // Divide every stored count by `divisor` (rounding keeps the order and
+    // the subtree bounds), then remove the words whose weight fell below
+    // DECAY_PRUNE_FREQUENCY. An open journal gets a "#rescale" line, which
+    // replay and compaction apply to everything before it.
+    void rescaleFrequencies(double divisor) {
+        std::vector<NodeId> expired;
+        frequencyTotal = 0;
+        for (NodeId node = 0; node < nodes.size(); node++) {
+            TrieNode& current = nodes[node];
+            if (current.maxSubtreeFrequency != std::numeric_limits<int>::min()) {
+                current.maxSubtreeFrequency = (int)std::llround(current.maxSubtreeFrequency / divisor);
+            }
+            if (current.isEndOfWord) {
+                current.frequency = (int)std::llround(current.frequency / divisor);
+                frequencyTotal += current.frequency;
+                if (current.frequency < DECAY_PRUNE_FREQUENCY) expired.push_back(node);
+            }
+        }
+        auto rescaleSuccessors = [divisor](SuccessorList& successors) {
+            for (Successor& next : successors) next.count = (int)std::llround(next.count / divisor);
+            successors.erase(std::remove_if(successors.begin(), successors.end(),
+                                            [](const Successor& next) { return next.count <= 0; }),
+                             successors.end());
+            return successors.empty();
+        };
+        for (auto it = bigrams.begin(); it != bigrams.end();) {
+            it = rescaleSuccessors(it->second) ? bigrams.erase(it) : std::next(it);
+        }
+        for (auto it = trigrams.begin(); it != trigrams.end();) {
+            it = rescaleSuccessors(it->second) ? trigrams.erase(it) : std::next(it);
+        }
+        
+        resultCache.clear();
+        eraseWords(expired);
+        if (strategy == SuggestionStrategy::CompletionCache) {
+            rebuildAllCaches(ROOT_NODE);  // Rounding can tie counts, which reorders them alphabetically
+        }
+        if (journal.isOpen()) journal.append("#rescale " + std::to_string(divisor));
+    }
+    
+    // Node of a known word, or NO_NODE
+    NodeId findWordNode(const std::string& word) const {
+        bool exact;
+        FoldedText key(word);
+        NodeId node = findPrefixNode(key.str(), &exact);
+        return (node != NO_NODE && exact && nodes[node].isEndOfWord) ? node : NO_NODE;
+    }
+    
+    // Move one character down from the point `consumed` characters into a
+    // node's edge. Returns the node reached, with consumed updated, or NO_NODE.
+    NodeId stepDown(NodeId node, uint16_t& consumed, char ch) const {
+        if (consumed < nodes[node].labelLength) {
+            if (edgeChar(node, consumed) != ch) return NO_NODE;
+            consumed++;
+            return node;
+        }
+        NodeId child = findChild(node, ch);  // Siblings are sorted, so this stops early
+        consumed = 1;
+        return child;
+    }
+    
+    // Lowercase a batch and order it so equal and shared prefixes are adjacent
+    static void sortBatch(const std::vector<std::string>& queries, std::vector<std::string>& lowered,
+                          std::vector<uint32_t>& order) {
+        lowered.resize(queries.size());
+        order.resize(queries.size());
+        for (size_t i = 0; i < queries.size(); i++) {
+            Utf8::foldText(queries[i].data(), queries[i].size(), lowered[i]);
+            order[i] = (uint32_t)i;
+        }
+        std::sort(order.begin(), order.end(), [&lowered](uint32_t a, uint32_t b) { return lowered[a] < lowered[b]; });
+    }
+    
+    // Split a sorted batch into contiguous runs, one per thread, and merge
+    // the runs' words into `out` in order
+    void runBatch(const std::vector<uint32_t>& order, BatchResults& out, WorkerPool* pool,
+                  const std::function<void(size_t, size_t, BatchResults&)>& runPart) const {
+        out.clear();
+        out.queries.assign(order.size(), std::make_pair(0u, 0u));
+        size_t parts = pool ? std::min(pool->size() + 1, order.size()) : 1;
+        if (parts <= 1) {
+            runPart(0, order.size(), out);
+            return;
+        }
+        
+        std::vector<BatchResults> partResults(parts);
+        pool->parallelFor(parts, [&](size_t part) {
+            runPart(order.size() * part / parts, order.size() * (part + 1) / parts, partResults[part]);
+        });
+        for (size_t part = 0; part < parts; part++) {
+            out.appendPart(partResults[part], order, order.size() * part / parts, order.size() * (part + 1) / parts);
+        }
+    }
+    
+    // Suggestions for order[begin..end) of a sorted batch. The descent for
+    // each prefix resumes from where it shares characters with the previous
+    // one, and a repeated prefix reuses the previous result.
+    void suggestSortedRun(const std::vector<std::string>& lowered, const std::vector<uint32_t>& order,
+                          size_t begin, size_t end, int maxSuggestions,
+                          BatchResults& part, std::vector<std::pair<uint32_t, uint32_t>>& queries) const {
+        std::vector<NodeId> pathNodes(1, ROOT_NODE);    // Node after i characters of the previous prefix
+        std::vector<uint16_t> pathConsumed(1, 0);
+        TrieView trie = view();
+        
+        for (size_t i = begin; i < end; i++) {
+            const std::string& prefix = lowered[order[i]];
+            if (i > begin && prefix == lowered[order[i - 1]]) {
+                queries[order[i]] = queries[order[i - 1]];
+                continue;
+            }
+            
+            const std::string& previous = (i > begin) ? lowered[order[i - 1]] : prefix;
+            size_t common = 0;
+            while (common < pathNodes.size() - 1 && common < prefix.size() && previous[common] == prefix[common]) {
+                common++;
+            }
+            pathNodes.resize(common + 1);
+            pathConsumed.resize(common + 1);
+            for (size_t j = common; j < prefix.size(); j++) {
+                uint16_t consumed = pathConsumed.back();
+                NodeId node = (pathNodes.back() != NO_NODE) ? stepDown(pathNodes.back(), consumed, prefix[j]) : NO_NODE;
+                pathNodes.push_back(node);
+                pathConsumed.push_back(consumed);
+            }
+            
+            uint32_t first = (uint32_t)part.wordEnds.size();
+            NodeId prefixNode = pathNodes.back();
+            if (!prefix.empty() && prefixNode != NO_NODE) {
+                if (strategy == SuggestionStrategy::CompletionCache && maxSuggestions <= COMPLETION_CACHE_SIZE) {
+                    const std::vector<NodeId>& cache = completionCaches[prefixNode];
+                    for (int k = 0; k < std::min(maxSuggestions, (int)cache.size()); k++) {
+                        trie.appendWord(cache[k], part.text);
+                        part.wordEnds.push_back((uint32_t)part.text.size());
+                    }
+                } else {
+                    // Best-first ranks exactly like the other strategies
+                    TrieView::BestFirstCursor cursor(trie, prefixNode);
+                    for (int k = 0; k < maxSuggestions; k++) {
+                        NodeId word = cursor.next();
+                        if (word == NO_NODE) break;
+                        trie.appendWord(word, part.text);
+                        part.wordEnds.push_back((uint32_t)part.text.size());
+                    }
+                }
+            }
+            queries[order[i]] = std::make_pair(first, (uint32_t)part.wordEnds.size() - first);
+        }
+    }
+    
+    static uint64_t trigramKey(NodeId first, NodeId second) {
+        return ((uint64_t)first << 32) | second;
+    }
+    
+    // Count one more occurrence of `word` after a context, keeping the list
+    // ordered by count
+    static void learnSuccessor(SuccessorList& successors, NodeId word, int count) {
+        size_t i = 0;
+        while (i < successors.size() && successors[i].word != word) i++;
+        if (i == successors.size()) successors.push_back({word, 0});
+        successors[i].count = clampFrequency((long long)successors[i].count + count);
+        while (i > 0 && successors[i].count > successors[i - 1].count) {
+            std::swap(successors[i], successors[i - 1]);
+            i--;
+        }
+    }
+    
+    // Learn the bigram and trigram ending at each word of a sequence
+    void learnNgrams(const std::vector<NodeId>& sequence) {
+        int count = scaledIncrease(1);
+        for (size_t i = 1; i < sequence.size(); i++) {
+            learnSuccessor(bigrams[sequence[i - 1]], sequence[i], count);
+            if (i >= 2) {
+                learnSuccessor(trigrams[trigramKey(sequence[i - 2], sequence[i - 1])], sequence[i], count);
+            }
+        }
+        if (journal.isOpen()) {
+            for (size_t i = 1; i < sequence.size(); i++) {
+                std::string last = wordAt(sequence[i - 1]) + " " + wordAt(sequence[i]) + " 1";
+                journal.append("@2 " + last);
+                if (i >= 2) journal.append("@3 " + wordAt(sequence[i - 2]) + " " + last);
+            }
+        }
+    }
+    
+    // Re-key the n-gram tables after the pool was rebuilt; newIds maps each
+    // old word id to its new one
+    void remapNgrams(const std::unordered_map<NodeId, SuccessorList>& oldBigrams,
+                     const std::unordered_map<uint64_t, SuccessorList>& oldTrigrams,
+                     const std::vector<NodeId>& newIds) {
+        for (const auto& entry : oldBigrams) {
+            SuccessorList& successors = bigrams[newIds[entry.first]];
+            for (const Successor& next : entry.second) {
+                successors.push_back({newIds[next.word], next.count});
+            }
+        }
+        for (const auto& entry : oldTrigrams) {
+            NodeId first = newIds[(NodeId)(entry.first >> 32)];
+            NodeId second = newIds[(NodeId)entry.first];
+            SuccessorList& successors = trigrams[trigramKey(first, second)];
+            for (const Successor& next : entry.second) {
+                successors.push_back({newIds[next.word], next.count});
+            }
+        }
+    }
+    
+    // Write the n-gram tables as text lines: "@2 w1 w2 count", "@3 w1 w2 w3 count";
+    // counts are divided by the decay scale and those that round to 0 dropped
+    void saveNgramsToFile(std::ostream& file, double scale) const {
+        for (const auto& entry : bigrams) {
+            std::string previous = wordAt(entry.first);
+            for (const Successor& next : entry.second) {
+                int count = decayedWeight(next.count, scale);
+                if (count > 0) file << "@2 " << previous << " " << wordAt(next.word) << " " << count << std::endl;
+            }
+        }
+        for (const auto& entry : trigrams) {
+            std::string context = wordAt((NodeId)(entry.first >> 32)) + " " + wordAt((NodeId)entry.first);
+            for (const Successor& next : entry.second) {
+                int count = decayedWeight(next.count, scale);
+                if (count > 0) file << "@3 " << context << " " << wordAt(next.word) << " " << count << std::endl;
+            }
+        }
+    }
+    
+    // Parse one n-gram line written by saveNgramsToFile; words not in the trie are skipped
+    void loadNgramLine(const std::string& order, std::istringstream& iss) {
+        std::string words[3];
+        int count;
+        int length = (order == "@3") ? 3 : 2;
+        for (int i = 0; i < length; i++) {
+            if (!(iss >> words[i])) return;
+        }
+        if (!(iss >> count)) return;
+        
+        NodeId ids[3];
+        for (int i = 0; i < length; i++) {
+            ids[i] = findWordNode(words[i]);
+            if (ids[i] == NO_NODE) return;
+        }
+        count = scaledIncrease(count);  // Saved counts are weights, as for words
+        if (length == 2) {
+            learnSuccessor(bigrams[ids[0]], ids[1], count);
+        } else {
+            learnSuccessor(trigrams[trigramKey(ids[0], ids[1])], ids[2], count);
+        }
+    }
+    
+    // Flatten the n-gram tables into the binary model's uint32 records;
+    // counts are divided by the decay scale and those that round to 0 dropped
+    void flattenNgrams(std::vector<uint32_t>& out, double scale) const {
+        auto flattenSuccessors = [&out, scale](const SuccessorList& successors) {
+            size_t size = out.size();
+            out.push_back(0);
+            for (const Successor& next : successors) {
+                int count = decayedWeight(next.count, scale);
+                if (count <= 0) continue;
+                out.push_back(next.word);
+                out.push_back((uint32_t)count);
+                out[size]++;
+            }
+            return out[size] != 0;
+        };
+        for (const auto& entry : bigrams) {
+            size_t start = out.size();
+            out.push_back(2);
+            out.push_back(entry.first);
+            if (!flattenSuccessors(entry.second)) out.resize(start);
+        }
+        for (const auto& entry : trigrams) {
+            size_t start = out.size();
+            out.push_back(3);
+            out.push_back((uint32_t)(entry.first >> 32));
+            out.push_back((uint32_t)entry.first);
+            if (!flattenSuccessors(entry.second)) out.resize(start);
+        }
+    }
+    
+    // Rebuild the n-gram tables from flattened records; false if they are malformed
+    bool unflattenNgrams(const uint32_t* records, size_t size) {
+        bigrams.clear();
+        trigrams.clear();
+        size_t i = 0;
+        while (i < size) {
+            uint32_t order = records[i++];
+            if ((order != 2 && order != 3) || i + order > size) return false;
+            NodeId first = records[i++];
+            NodeId second = (order == 3) ? records[i++] : NO_NODE;
+            size_t count = records[i++];
+            if (count > (size - i) / 2) return false;
+            
+            SuccessorList& successors = (order == 2) ? bigrams[first] : trigrams[trigramKey(first, second)];
+            for (size_t k = 0; k < count; k++, i += 2) {
+                if (records[i] >= nodes.size()) return false;
+                successors.push_back({records[i], (int)records[i + 1]});
+            }
+        }
+        return true;
+    }
+    
+    // State of one bounded edit-distance search down the trie. Distances
+    // count characters (code points), not bytes. `rows` holds one DP row per
+    // character depth: entry j of row d is the edit distance between the
+    // first d characters on the current path and the first j of target.
+    struct CorrectionSearch {
+        std::string target;
+        int maxDistance;
+        std::vector<uint32_t> characters;              // target split by Utf8::splitCharacters
+        std::vector<int> rows;
+        std::vector<std::pair<NodeId, int>> matches;   // (word node, distance)
+    };
+    
+    // Searches walked down the trie together, so a node is read once for all
+    // searches still within their limit there
+    struct CorrectionWalk {
+        std::vector<CorrectionSearch> searches;
+        std::vector<uint32_t> path;                    // Trie character at each depth
+        uint32_t partial = 0;                          // Character being read off the trie, and
+        uint8_t pending = 0;                           // the bytes of it still to come
+        std::vector<std::vector<uint32_t>> alive;      // alive[d]: searches still in reach at depth d
+    };
+    
+    // Walk the trie once for every search in `walk`
+    void runCorrectionWalk(CorrectionWalk& walk) const {
+        size_t longest = 0;
+        walk.alive.assign(1, std::vector<uint32_t>());
+        for (uint32_t i = 0; i < walk.searches.size(); i++) {
+            CorrectionSearch& search = walk.searches[i];
+            Utf8::splitCharacters(search.target, search.characters);
+            search.rows.resize(search.characters.size() + 1);
+            for (size_t j = 0; j <= search.characters.size(); j++) {
+                search.rows[j] = (int)j;
+            }
+            longest = std::max(longest, search.characters.size() + (size_t)std::max(search.maxDistance, 0));
+            walk.alive[0].push_back(i);
+        }
+        walk.alive.resize(longest + 2);  // Pruning keeps the path within this depth; never resized mid-walk
+        walk.path.clear();
+        walk.pending = 0;
+        continueCorrection(walk, ROOT_NODE, 0);
+    }
+    
+    // Fill `next`, the edit-distance row for a path extended by ch, from the
+    // rows of the path (`row`) and of the path without its last character
+    // (`rowBefore`, nullptr at depth 1), whose last character is `previous`.
+    // Characters are packed by Utf8::feedByte. Returns the smallest entry.
+    static int nextDistanceRow(const std::vector<uint32_t>& target, const int* rowBefore, uint32_t previous,
+                               const int* row, uint32_t ch, int* next) {
+        next[0] = row[0] + 1;
+        int best = next[0];
+        for (size_t j = 1; j <= target.size(); j++) {
+            int cost = (target[j - 1] == ch) ? 0 : 1;
+            int value = std::min(std::min(row[j] + 1, next[j - 1] + 1), row[j - 1] + cost);
+            if (rowBefore && j > 1 && ch == target[j - 2] && previous == target[j - 1]) {
+                value = std::min(value, rowBefore[j - 2] + 1);  // Transposition
+            }
+            next[j] = value;
+            best = std::min(best, value);
+        }
+        return best;
+    }
+    
+    // Extend the current path by one trie byte. Once it completes a
+    // character, each live search's new row follows from its previous one
+    // (and the one before it, for transpositions); a search whose row is
+    // entirely over its limit cannot match anything below and drops out.
+    void stepCorrection(CorrectionWalk& walk, NodeId node, size_t consumed, char byte) const {
+        trieNodeVisits++;
+        uint32_t partial = walk.partial;
+        uint8_t pending = walk.pending;
+        if (!Utf8::feedByte(walk.partial, walk.pending, byte)) {
+            continueCorrection(walk, node, consumed);  // No row until the character is complete
+            walk.partial = partial;
+            walk.pending = pending;
+            return;
+        }
+        
+        uint32_t ch = walk.partial;
+        size_t depth = walk.path.size() + 1;
+        walk.alive[depth].clear();
+        for (uint32_t index : walk.alive[depth - 1]) {
+            CorrectionSearch& search = walk.searches[index];
+            size_t width = search.characters.size() + 1;
+            if (search.rows.size() < (depth + 1) * width) {
+                search.rows.resize((depth + 1) * width);
+            }
+            const int* rowBefore = (depth > 1) ? &search.rows[(depth - 2) * width] : nullptr;
+            int best = nextDistanceRow(search.characters, rowBefore, walk.path.empty() ? 0 : walk.path.back(),
+                                       &search.rows[(depth - 1) * width], ch, &search.rows[depth * width]);
+            if (best <= search.maxDistance) walk.alive[depth].push_back(index);
+        }
+        if (!walk.alive[depth].empty()) {
+            walk.path.push_back(ch);
+            continueCorrection(walk, node, consumed);
+            walk.path.pop_back();
+        }
+        walk.partial = partial;
+        walk.pending = pending;
+    }
+    
+    // Visit the point `consumed` bytes into a node's edge label
+    void continueCorrection(CorrectionWalk& walk, NodeId node, size_t consumed) const {
+        if (consumed < nodes[node].labelLength) {
+            // Inside a compressed edge there is exactly one next byte
+            stepCorrection(walk, node, consumed + 1, edgeChar(node, consumed));
+            return;
+        }
+        
+        size_t depth = walk.path.size();
+        if (nodes[node].isEndOfWord && walk.pending == 0) {  // A word ending mid-character is not valid UTF-8
+            for (uint32_t index : walk.alive[depth]) {
+                CorrectionSearch& search = walk.searches[index];
+                size_t width = search.characters.size() + 1;
+                int distance = search.rows[depth * width + width - 1];
+                if (distance <= search.maxDistance) search.matches.push_back({node, distance});
+            }
+        }
+        for (NodeId child = nodes[node].firstChild; child != NO_NODE; child = nodes[child].nextSibling) {
+            stepCorrection(walk, child, 1, nodes[child].label);
+        }
+    }
+    
+    // Every distinct string left after deleting up to maxDeletes characters
+    // from word, word itself included
+    static void collectDeletes(const std::string& word, int maxDeletes, std::vector<std::string>& out) {
+        out.assign(1, word);
+        size_t levelStart = 0;
+        for (int deletes = 0; deletes < maxDeletes; deletes++) {
+            size_t levelEnd = out.size();
+            for (size_t i = levelStart; i < levelEnd; i++) {
+                size_t length;
+                for (size_t position = 0; position < out[i].size(); position += length) {
+                    length = Utf8::characterLength(out[i].data(), out[i].size(), position);
+                    std::string shorter = out[i];
+                    shorter.erase(position, length);
+                    out.push_back(shorter);
+                }
+            }
+            levelStart = levelEnd;
+        }
+        std::sort(out.begin(), out.end());
+        out.erase(std::unique(out.begin(), out.end()), out.end());
+    }
+    
+    // Edit distance in characters with adjacent transpositions, or limit + 1
+    // once it is certain to exceed limit
+    static int boundedEditDistance(const std::string& a, const std::string& b, int limit) {
+        std::vector<uint32_t> left, right;
+        Utf8::splitCharacters(a, left);
+        Utf8::splitCharacters(b, right);
+        if (std::abs((int)left.size() - (int)right.size()) > limit) return limit + 1;
+        size_t width = right.size() + 1;
+        std::vector<int> rows(3 * width);
+        int* before = &rows[0];
+        int* row = &rows[width];
+        int* next = &rows[2 * width];
+        for (size_t j = 0; j < width; j++) row[j] = (int)j;
+        for (size_t i = 1; i <= left.size(); i++) {
+            int best = nextDistanceRow(right, (i > 1) ? before : nullptr, (i > 1) ? left[i - 2] : 0, row, left[i - 1],
+                                       next);
+            if (best > limit) return limit + 1;
+            std::swap(before, row);
+            std::swap(row, next);
+        }
+        return std::min(row[width - 1], limit + 1);
+    }
+    
+    // Add a word's deletes to the index
+    void indexWordDeletes(NodeId node) {
+        std::vector<std::string> deletes;
+        collectDeletes(wordAt(node), DELETE_INDEX_DISTANCE, deletes);
+        for (const auto& key : deletes) {
+            deleteIndex[key].push_back(node);
+        }
+    }
+    
+    // Take a removed word's deletes out of the index
+    void unindexWordDeletes(NodeId node, const std::string& word) {
+        std::vector<std::string> deletes;
+        collectDeletes(word, DELETE_INDEX_DISTANCE, deletes);
+        for (const auto& key : deletes) {
+            auto it = deleteIndex.find(key);
+            if (it == deleteIndex.end()) continue;
+            it->second.erase(std::remove(it->second.begin(), it->second.end(), node), it->second.end());
+            if (it->second.empty()) deleteIndex.erase(it);
+        }
+    }
+    
+    // Index every word in the pool from scratch
+    void rebuildDeleteIndex() {
+        deleteIndex.clear();
+        if (!deleteIndexEnabled) return;
+        for (NodeId node = 0; node < nodes.size(); node++) {
+            if (nodes[node].isEndOfWord) indexWordDeletes(node);
+        }
+    }
+    
+    // Correction candidates through the delete index: two strings within
+    // distance d share a string reachable by at most d deletes from each,
+    // so candidates come from looking up the target's deletes and are then
+    // checked against the real distance
+    std::vector<std::pair<NodeId, int>> lookupDeleteIndex(const std::string& target, int maxDistance) const {
+        std::vector<std::string> deletes;
+        collectDeletes(target, maxDistance, deletes);
+        std::vector<NodeId> candidates;
+        for (const auto& key : deletes) {
+            auto it = deleteIndex.find(key);
+            if (it != deleteIndex.end()) {
+                candidates.insert(candidates.end(), it->second.begin(), it->second.end());
+            }
+        }
+        std::sort(candidates.begin(), candidates.end());
+        candidates.erase(std::unique(candidates.begin(), candidates.end()), candidates.end());
+        
+        trieNodeVisits += candidates.size();
+        std::vector<std::pair<NodeId, int>> matches;
+        for (NodeId node : candidates) {
+            int distance = boundedEditDistance(wordAt(node), target, maxDistance);
+            if (distance <= maxDistance) matches.push_back({node, distance});
+        }
+        return matches;
+    }
+    
+    // Order correction matches: weight minus 10 per edit, then fewer edits,
+    // then alphabetical. The penalty is scaled like the stored counts so
+    // decay does not change how much an edit costs.
+    void rankCorrections(std::vector<std::pair<NodeId, int>>& matches) const {
+        double penalty = 10 * decayScale();
+        std::sort(matches.begin(), matches.end(),
+                  [this, penalty](const std::pair<NodeId, int>& a, const std::pair<NodeId, int>& b) {
+                      double scoreA = nodes[a.first].frequency - a.second * penalty;  // Penalize edit distance
+                      double scoreB = nodes[b.first].frequency - b.second * penalty;
+                      if (scoreA != scoreB) return scoreA > scoreB;
+                      if (a.second != b.second) return a.second < b.second;
+                      return wordLess(a.first, b.first);
+                  });
+    }
+    
+    // Split text into individual case-folded words
+    static std::vector<std::string> splitIntoWords(const std::string& text) {
+        std::vector<std::string> words;
+        WordTokenizer tokenizer;
+        auto onWord = [&words](const std::string& word) { words.push_back(word); };
+        tokenizer.feed(text.data(), text.size(), onWord);
+        tokenizer.finish(onWord);
+        return words;
+    }
+    
+    // Load common English words with initial frequencies
+    void loadCommonWords() {
+        std::vector<std::pair<std::string, int>> commonWords = {
+            {"the", 100}, {"and", 90}, {"to", 85}, {"of", 80}, {"a", 75},
+            {"in", 70}, {"is", 65}, {"it", 60}, {"you", 55}, {"that", 50},
+            {"he", 45}, {"was", 45}, {"for", 40}, {"on", 40}, {"are", 35},
+            {"as", 35}, {"with", 30}, {"his", 30}, {"they", 25}, {"i", 25},
+            {"at", 20}, {"be", 20}, {"this", 20}, {"have", 18}, {"from", 18},
+            {"or", 15}, {"one", 15}, {"had", 15}, {"by", 12}, {"word", 12},
+            {"but", 10}, {"not", 10}, {"what", 10}, {"all", 8}, {"were", 8},
+            {"would", 7}, {"there", 7}, {"we", 6}, {"when", 6}, {"your", 5},
+            {"can", 12}, {"said", 11}, {"each", 9}, {"which", 9}, {"she", 8},
+            {"do", 15}, {"how", 12}, {"their", 10}, {"if", 14}, {"will", 13},
+            {"up", 11}, {"other", 8}, {"about", 7}, {"out", 10}, {"many", 6},
+            {"then", 9}, {"them", 8}, {"these", 6}, {"so", 12}, {"some", 7},
+            {"her", 9}, {"would", 7}, {"make", 8}, {"like", 9}, {"into", 6},
+            {"him", 7}, {"time", 8}, {"has", 9}, {"two", 6}, {"more", 7},
+            {"go", 8}, {"no", 9}, {"way", 6}, {"could", 6}, {"my", 10},
+            {"than", 6}, {"first", 5}, {"been", 6}, {"call", 4}, {"who", 7},
+            {"its", 5}, {"now", 8}, {"find", 5}, {"long", 4}, {"down", 5},
+            {"day", 6}, {"did", 6}, {"get", 8}, {"come", 5}, {"made", 5},
+            {"may", 4}, {"part", 4}, {"over", 5}, {"new", 6}, {"sound", 3},
+            {"take", 6}, {"only", 5}, {"little", 4}, {"work", 5}, {"know", 7}
+        };
+        
+        for (const auto& pair : commonWords) {
+            insertWord(pair.first, pair.second);
+        }
+    }
+    
+    // Save trie to file recursively; counts are divided by the decay scale
+    void saveTrieToFile(NodeId node, std::string& prefix, std::ostream& file, double scale) {
+        if (nodes[node].isEndOfWord) {
+            file << prefix << " " << decayedWeight(nodes[node].frequency, scale) << std::endl;
+        }
+        
+        for (NodeId child = nodes[node].firstChild; child != NO_NODE; child = nodes[child].nextSibling) {
+            size_t length = prefix.size();
+            appendLabel(child, prefix);
+            saveTrieToFile(child, prefix, file, scale);
+            prefix.resize(length);
+        }
+    }
+    
+    // Empty the trie down to a bare root, which has no edge label
+    void resetPool() {
+        nodes.assign(1, TrieNode());
+        nodes[ROOT_NODE].labelLength = 0;
+        labels.clear();
+        if (strategy == SuggestionStrategy::CompletionCache) {
+            completionCaches.assign(1, std::vector<NodeId>());
+        }
+        freeNodes.clear();
+        labelGarbage = 0;
+        budgetCheckNodes = 0;
+        wordCount = 0;
+        frequencyTotal = 0;
+        deleteIndex.clear();
+        bigrams.clear();
+        trigrams.clear();
+        resultCache.clear();
+    }
+    
+    // Gather every word and its frequency, in alphabetical order
+    void collectWords(NodeId node, std::string& prefix, std::vector<std::pair<std::string, int>>& words) {
+        if (nodes[node].isEndOfWord) {
+            words.push_back({prefix, nodes[node].frequency});
+        }
+        
+        for (NodeId child = nodes[node].firstChild; child != NO_NODE; child = nodes[child].nextSibling) {
+            size_t length = prefix.size();
+            appendLabel(child, prefix);
+            collectWords(child, prefix, words);
+            prefix.resize(length);
+        }
+    }
+    
+    // insertWord for a count already scaled by the decay, and not journaled.
+    // ConcurrentPredictiveText works the counts out once per batch so its
+    // two copies store identical ones.
+    NodeId insertScaledCount(const std::string& word, int count) {
+        MetricsTimer timer(metrics, MetricOperation::Insert, word);
+        NodeId node = addWordFrequency(word, count);
+        enforceMemoryBudget(node);
+        return node;
+    }
+    
+    // insertWord without the memory budget, so returned ids stay valid
+    NodeId learnWord(const std::string& word, int frequencyIncrease) {
+        NodeId node = addWordFrequency(word, scaledIncrease(frequencyIncrease));
+        if (node != NO_NODE && journal.isOpen()) {
+            FoldedText key(word);
+            journal.append(key.str() + " " + std::to_string(frequencyIncrease));
+        }
+        return node;
+    }
+    
+    // Add to a word's frequency, inserting it if new; insertWord without the journal
+    NodeId addWordFrequency(const std::string& word, int frequencyIncrease) {
+        if (word.empty()) return NO_NODE;
+        
+        NodeId current = ROOT_NODE;
+        
+        // Case-fold for consistency, without copying text that is already folded
+        FoldedText key(word);
+        const std::string& lowerWord = key.str();
+        resultCache.invalidateWord(lowerWord);
+        
+        std::vector<NodeId>& path = insertPath;
+        path.assign(1, ROOT_NODE);
+        size_t matched = 0;
+        while (matched < lowerWord.size()) {
+            NodeId child = findChild(current, lowerWord[matched]);
+            if (child == NO_NODE) {
+                // New branch: one node per character, or the whole rest as one edge
+                size_t length = pathCompression ? std::min(lowerWord.size() - matched, (size_t)UINT16_MAX) : 1;
+                current = addChild(current, lowerWord, matched, length);
+                matched += length;
+            } else {
+                // Follow the edge as far as it agrees with the word, splitting it if they diverge
+                size_t length = nodes[child].labelLength;
+                size_t common = 1;
+                while (common < length && matched + common < lowerWord.size() &&
+                       edgeChar(child, common) == lowerWord[matched + common]) {
+                    common++;
+                }
+                current = (common < length) ? splitEdge(child, common) : child;
+                matched += common;
+            }
+            path.push_back(current);
+        }
+        
+        bool newWord = !nodes[current].isEndOfWord;
+        int oldFrequency = nodes[current].frequency;
+        nodes[current].isEndOfWord = true;
+        nodes[current].frequency = clampFrequency((long long)nodes[current].frequency + frequencyIncrease);  // ML: Learn from usage
+        wordCount += newWord;
+        frequencyTotal += nodes[current].frequency - oldFrequency;
+        trieNodeVisits += path.size();
+        if (newWord && deleteIndexEnabled) indexWordDeletes(current);
+        
+        // Keep the frequency bounds and cached completions on the path current
+        bool cachesEnabled = (strategy == SuggestionStrategy::CompletionCache);
+        if (frequencyIncrease >= 0) {
+            for (NodeId node : path) {
+                nodes[node].maxSubtreeFrequency = std::max(nodes[node].maxSubtreeFrequency, nodes[current].frequency);
+                if (cachesEnabled) promoteInCache(node, current);
+            }
+        } else {
+            // A lower frequency can let hidden words back in, so rebuild bottom-up
+            for (auto it = path.rbegin(); it != path.rend(); ++it) {
+                refreshSubtreeBound(*it);
+                if (cachesEnabled) rebuildCache(*it);
+            }
+        }
+        return current;
+    }
+    
+public:
+    PredictiveTextSystem()
+        : pathCompression(false), strategy(SuggestionStrategy::CompletionCache), deleteIndexEnabled(false),
+          labelGarbage(0), memoryBudget(0), budgetCheckNodes(0), decayHalfLife(0) {
+        resetPool();
+        loadCommonWords(); // Initialize with common vocabulary
+    }
+    
+    // Insert word with frequency tracking (Learning Component); returns its node
+    NodeId insertWord(const std::string& word, int frequencyIncrease = 1) {
+        MetricsTimer timer(metrics, MetricOperation::Insert, word);
+        NodeId node = learnWord(word, frequencyIncrease);
+        enforceMemoryBudget(node);
+        return node;
+    }
+    
+    // Let learned counts fade so recent usage wins: a count loses half its
+    // weight every halfLifeSeconds. Rather than rescanning the trie, new
+    // events are stored multiplied by a global scale that doubles every
+    // half-life; every DECAY_RESCALE_HALF_LIVES half-lives the scale is
+    // folded back into the counts and words whose weight fell below
+    // DECAY_PRUNE_FREQUENCY are removed, so the vocabulary stays bounded.
+    // Saved models hold the decayed weights. 0 turns decay off.
+    void setFrequencyDecay(double halfLifeSeconds) {
+        if (decayHalfLife > 0) {
+            rescaleFrequencies(decayScale());
+        }
+        decayHalfLife = std::max(0.0, halfLifeSeconds);
+        decayEpoch = std::chrono::steady_clock::now();
+    }
+    
+    // Search for exact word in trie
+    bool search(const std::string& word) const {
+        bool exact;
+        FoldedText key(word);
+        NodeId node = findPrefixNode(key.str(), &exact);
+        return node != NO_NODE && exact && nodes[node].isEndOfWord;
+    }
+    
+    // Choose how suggestions are found; only CompletionCache keeps per-node caches
+    void setSuggestionStrategy(SuggestionStrategy newStrategy) {
+        if (newStrategy == strategy) return;
+        if (newStrategy == SuggestionStrategy::CompletionCache) {
+            completionCaches.assign(nodes.size(), std::vector<NodeId>());
+            rebuildAllCaches(ROOT_NODE);
+        } else if (strategy == SuggestionStrategy::CompletionCache) {
+            std::vector<std::vector<NodeId>>().swap(completionCaches);
+        }
+        strategy = newStrategy;
+    }
+    
+    // Radix mode: store single-child chains as one multi-character edge.
+    // Switching rebuilds the pool from the current vocabulary.
+    void setPathCompression(bool enabled) {
+        if (enabled == pathCompression) return;
+        
+        std::vector<std::pair<std::string, int>> words;
+        std::string prefix;
+        collectWords(ROOT_NODE, prefix, words);
+        std::vector<NodeId> oldIds;
+        for (const auto& pair : words) {
+            oldIds.push_back(findWordNode(pair.first));
+        }
+        std::unordered_map<NodeId, SuccessorList> oldBigrams;
+        std::unordered_map<uint64_t, SuccessorList> oldTrigrams;
+        oldBigrams.swap(bigrams);
+        oldTrigrams.swap(trigrams);
+        std::vector<NodeId> newIds(nodes.size(), NO_NODE);
+        
+        resetPool();
+        pathCompression = enabled;
+        for (size_t i = 0; i < words.size(); i++) {
+            newIds[oldIds[i]] = addWordFrequency(words[i].first, words[i].second);
+        }
+        remapNgrams(oldBigrams, oldTrigrams, newIds);
+    }
+    
+    // Keep a symmetric-delete index for autocorrect: every word's deletes up
+    // to DELETE_INDEX_DISTANCE point back at the word, so a correction is a
+    // handful of hash lookups rather than a trie walk. Costs memory; see
+    // deleteIndexMemoryUsage().
+    void setDeleteIndex(bool enabled) {
+        if (enabled == deleteIndexEnabled) return;
+        deleteIndexEnabled = enabled;
+        rebuildDeleteIndex();
+        if (!enabled) std::unordered_map<std::string, std::vector<NodeId>>().swap(deleteIndex);
+    }
+    
+    // Cache up to `entries` getSuggestions results in front of the trie; 0
+    // turns it off. A word's frequency change drops the entries for each of
+    // its prefixes, so cached results are never stale.
+    void setResultCacheCapacity(size_t entries) {
+        resultCache.setCapacity(entries);
+    }
+    
+    // Number of nodes in the pool, root included
+    size_t nodeCount() const {
+        return nodes.size();
+    }
+    
+    // Bytes held by the trie: node pool plus any completion caches
+    size_t memoryUsage() const {
+        size_t bytes = nodes.capacity() * sizeof(TrieNode) + labels.capacity();
+        bytes += completionCaches.capacity() * sizeof(std::vector<NodeId>);
+        for (const auto& cache : completionCaches) {
+            bytes += cache.capacity() * sizeof(NodeId);
+        }
+        return bytes;
+    }
+    
+    // Memory of the trie by part, with the cost per live node and per word
+    MemoryReport memoryReport() const {
+        MemoryReport report;
+        report.nodeBytes = nodes.capacity() * sizeof(TrieNode);
+        report.labelBytes = labels.capacity();
+        report.cacheBytes = memoryUsage() - report.nodeBytes - report.labelBytes;
+        report.totalBytes = memoryUsage();
+        report.inUseBytes = trieBytesInUse();
+        report.liveNodes = nodes.size() - freeNodes.size();
+        report.freeNodes = freeNodes.size();
+        report.words = wordCount;
+        report.bytesPerNode = (double)report.totalBytes / report.liveNodes;
+        report.bytesPerWord = report.words ? (double)report.totalBytes / report.words : 0;
+        return report;
+    }
+    
+    // Keep the trie (nodes, labels, completion caches) within `bytes`: when
+    // learning pushes it over, the lowest-ranked words (by frequency, or
+    // decayed weight with decay on) are evicted until it is back to
+    // MEMORY_BUDGET_LOW_WATER percent. Freed nodes are reused, so the pool
+    // stops growing. 0 removes the budget.
+    void setMemoryBudget(size_t bytes) {
+        memoryBudget = bytes;
+        budgetCheckNodes = 0;
+        enforceMemoryBudget(NO_NODE);
+    }
+    
+    // Forget a word: it leaves the vocabulary with its n-grams, and nodes
+    // no other word needs are freed for reuse
+    bool removeWord(const std::string& word) {
+        NodeId node = findWordNode(word);
+        if (node == NO_NODE) return false;
+        forgetWords(std::vector<NodeId>(1, node));
+        return true;
+    }
+    
+    // Remove every word whose weight is below minFrequency, such as typos
+    // learned once; returns how many were removed
+    size_t pruneWords(int minFrequency) {
+        double threshold = minFrequency * decayScale();
+        std::vector<NodeId> words;
+        for (NodeId node = 0; node < nodes.size(); node++) {
+            if (nodes[node].isEndOfWord && nodes[node].frequency < threshold) words.push_back(node);
+        }
+        forgetWords(words);
+        return words.size();
+    }
+    
+    // Approximate bytes held by the delete index: buckets, hash nodes, keys
+    // too long for in-place storage, and the word lists
+    size_t deleteIndexMemoryUsage() const {
+        size_t bytes = deleteIndex.bucket_count() * sizeof(void*);
+        for (const auto& entry : deleteIndex) {
+            bytes += sizeof(entry) + 2 * sizeof(void*);  // Entry plus node link and cached hash
+            const char* inlineStart = reinterpret_cast<const char*>(&entry.first);
+            if (entry.first.data() < inlineStart || entry.first.data() >= inlineStart + sizeof(std::string)) {
+                bytes += entry.first.capacity() + 1;
+            }
+            bytes += entry.second.capacity() * sizeof(NodeId);
+        }
+        return bytes;
+    }
+    
+    // Smart search with learning-based ranking. Read-only: safe to call from
+    // many threads at once as long as nothing modifies the system meanwhile.
+    std::vector<std::string> getSuggestions(const std::string& prefix, int maxSuggestions = 5) const {
+        if (prefix.empty()) return {};
+        
+        MetricsTimer timer(metrics, MetricOperation::Suggestions, prefix);
+        FoldedText key(prefix);
+        const std::string& lowerPrefix = key.str();
+        std::vector<std::string> result;
+        if (resultCache.enabled() && resultCache.lookup(lowerPrefix, maxSuggestions, result)) {
+            return result;
+        }
+        result = rankedSuggestions(lowerPrefix, maxSuggestions);
+        if (resultCache.enabled()) {
+            resultCache.store(lowerPrefix, maxSuggestions, result);
+        }
+        return result;
+    }
+    
+    // Completions of every trie path within maxEdits of the prefix, so a
+    // mistyped prefix still completes ("progrma" -> "programming"). Short
+    // prefixes get fewer edits: one per FUZZY_CHARS_PER_EDIT characters. A
+    // word scores its frequency divided by FUZZY_EDIT_DISCOUNT per edit, so a
+    // typo of a rare word still completes, just below closer matches.
+    // Ties go to fewer edits, then higher frequency, then alphabetical order.
+    //
+    // One best-first traversal: each queued path carries its edit-distance
+    // row and is ranked by the best score any word below it could reach. A
+    // path that can no longer get closer to the prefix drops its row and is
+    // expanded like exact completion, and the search stops after the top
+    // words, leaving low-scoring subtrees unvisited.
+    std::vector<std::string> getFuzzySuggestions(const std::string& prefix, int maxSuggestions = 5,
+                                                 int maxEdits = FUZZY_MAX_EDITS) const {
+        if (prefix.empty()) return {};
+        FoldedText key(prefix);
+        std::vector<uint32_t> target;
+        Utf8::splitCharacters(key.str(), target);
+        int edits = std::min(maxEdits, (int)(target.size() / FUZZY_CHARS_PER_EDIT));
+        if (edits <= 0) return getSuggestions(prefix, maxSuggestions);
+        
+        MetricsTimer timer(metrics, MetricOperation::FuzzySuggestions, prefix);
+        enum Kind { Word, Subtree, Path };
+        struct Candidate {
+            double score;
+            int distance;        // Edits for a word or subtree; the fewest possible below a path
+            int frequency;       // Word frequency, or subtree bound
+            Kind kind;
+            NodeId node;
+            uint32_t path;       // Path: index into `paths`
+        };
+        struct PathState {
+            uint16_t consumed;   // Bytes of node's edge label matched
+            uint8_t pending;     // Bytes still to come of a character cut by the path, packed in `partial`
+            uint32_t partial;
+            uint32_t ch;         // Last complete character on the path
+            int closest;         // Fewest edits from the prefix to the path or any of its prefixes
+            uint32_t row;        // Offsets of the path's row and its parent's row in `rows`
+            uint32_t parentRow;
+        };
+        auto score = [](int frequency, int distance) {
+            double discounted = frequency;  // Fractional, so rare words keep their order instead of rounding to 0
+            for (int i = 0; i < distance; i++) discounted /= FUZZY_EDIT_DISCOUNT;
+            return discounted;
+        };
+        TrieView trie = view();
+        auto lowerPriority = [&trie](const Candidate& a, const Candidate& b) {
+            if (a.score != b.score) return a.score < b.score;
+            if (a.distance != b.distance) return a.distance > b.distance;
+            if (a.frequency != b.frequency) return a.frequency < b.frequency;
+            if ((a.kind == Word) != (b.kind == Word)) return a.kind == Word;  // Expand before emitting an equal word
+            return a.kind == Word && trie.wordLess(b.node, a.node);
+        };
+        
+        size_t width = target.size() + 1;
+        std::vector<int> rows(width);
+        for (size_t j = 0; j < width; j++) rows[j] = (int)j;
+        std::vector<PathState> paths;
+        std::vector<Candidate> heap;
+        std::vector<Candidate> queuedWords;  // Best maxSuggestions words queued so far, worst on top
+        auto higherPriority = [&lowerPriority](const Candidate& a, const Candidate& b) { return lowerPriority(b, a); };
+        // Words unlearned to a non-positive frequency are not worth an edit,
+        // and once enough words are queued anything ranked below all of them
+        // is useless
+        auto worthQueuing = [&](const Candidate& candidate) {
+            if (candidate.distance > 0 && candidate.score <= 0) return false;
+            return (int)queuedWords.size() < maxSuggestions || !lowerPriority(candidate, queuedWords.front());
+        };
+        auto push = [&](const Candidate& candidate) {
+            if (!worthQueuing(candidate)) return;
+            if (candidate.kind == Word) {
+                if ((int)queuedWords.size() == maxSuggestions) {
+                    std::pop_heap(queuedWords.begin(), queuedWords.end(), higherPriority);
+                    queuedWords.pop_back();
+                }
+                queuedWords.push_back(candidate);
+                std::push_heap(queuedWords.begin(), queuedWords.end(), higherPriority);
+            }
+            heap.push_back(candidate);
+            std::push_heap(heap.begin(), heap.end(), lowerPriority);
+        };
+        auto pushSubtree = [&](NodeId node, int distance) {
+            int bound = nodes[node].maxSubtreeFrequency;
+            push({score(bound, distance), distance, bound, Subtree, node, 0});
+        };
+        // Queue the point `consumed` bytes into node's edge, reached by `byte`
+        // from a path `parentBest` edits from the prefix. Rows are only added
+        // once a character is complete; the root's row is the only one at offset 0.
+        std::vector<int> next(width);
+        auto pushPath = [&](const PathState& parent, int parentBest, NodeId node, uint16_t consumed, char byte) {
+            PathState state = parent;
+            state.consumed = consumed;
+            int bound = nodes[node].maxSubtreeFrequency;
+            if (!Utf8::feedByte(state.partial, state.pending, byte)) {
+                Candidate candidate = {score(bound, parentBest), parentBest, bound, Path, node, (uint32_t)paths.size()};
+                if (!worthQueuing(candidate)) return;
+                paths.push_back(state);
+                push(candidate);
+                return;
+            }
+            uint32_t ch = state.partial;
+            int best = nextDistanceRow(target, parent.row ? &rows[parent.parentRow] : nullptr, parent.ch, &rows[parent.row],
+                                       ch, next.data());
+            int closest = std::min(parent.closest, next[width - 1]);
+            if (best >= closest) {
+                if (closest <= edits) pushSubtree(node, closest);  // Nothing below gets closer
+                return;
+            }
+            if (best > edits) return;
+            Candidate candidate = {score(bound, best), best, bound, Path, node, (uint32_t)paths.size()};
+            if (!worthQueuing(candidate)) return;
+            paths.push_back({consumed, 0, 0, ch, closest, (uint32_t)rows.size(), parent.row});
+            rows.insert(rows.end(), next.begin(), next.end());
+            push(candidate);
+        };
+        
+        int rootDistance = (int)target.size();
+        paths.push_back({0, 0, 0, 0, rootDistance <= edits ? rootDistance : edits + 1, 0, 0});
+        push({score(nodes[ROOT_NODE].maxSubtreeFrequency, 0), 0, nodes[ROOT_NODE].maxSubtreeFrequency, Path, ROOT_NODE, 0});
+        
+        std::vector<std::string> result;
+        while (!heap.empty() && (int)result.size() < maxSuggestions) {
+            std::pop_heap(heap.begin(), heap.end(), lowerPriority);
+            Candidate top = heap.back();
+            heap.pop_back();
+            if (top.kind == Word) {
+                result.push_back(wordAt(top.node));
+                continue;
+            }
+            const TrieNode& node = nodes[top.node];
+            trieNodeVisits++;
+            if (top.kind == Subtree) {
+                if (node.isEndOfWord) push({score(node.frequency, top.distance), top.distance, node.frequency, Word, top.node, 0});
+                for (NodeId child = node.firstChild; child != NO_NODE; child = nodes[child].nextSibling) {
+                    pushSubtree(child, top.distance);
+                }
+            } else {
+                PathState state = paths[top.path];
+                if (state.consumed < node.labelLength) {
+                    pushPath(state, top.distance, top.node, state.consumed + 1, edgeChar(top.node, state.consumed));
+                    continue;
+                }
+                if (node.isEndOfWord && state.pending == 0 && state.closest <= edits) {
+                    push({score(node.frequency, state.closest), state.closest, node.frequency, Word, top.node, 0});
+                }
+                for (NodeId child = node.firstChild; child != NO_NODE; child = nodes[child].nextSibling) {
+                    pushPath(state, top.distance, child, 1, nodes[child].label);
+                }
+            }
+        }
+        return result;
+    }
+    
+    // getSuggestions for a whole batch: out.results(i) holds the suggestions
+    // for prefixes[i]. The batch is sorted so shared prefixes are descended
+    // once and repeated ones answered once; with a pool it is split into
+    // contiguous runs. Reusing `out` across batches avoids reallocation.
+    void getSuggestionsBatch(const std::vector<std::string>& prefixes, int maxSuggestions, BatchResults& out,
+                             WorkerPool* pool = nullptr) const {
+        std::vector<std::string> lowered;
+        std::vector<uint32_t> order;
+        sortBatch(prefixes, lowered, order);
+        runBatch(order, out, pool, [&](size_t begin, size_t end, BatchResults& part) {
+            suggestSortedRun(lowered, order, begin, end, maxSuggestions, part, out.queries);
+        });
+    }
+    
+    // autoCorrect for a whole batch, one word per query. The distinct unknown
+    // words of each run share one trie walk, so the nodes near the root that
+    // every search visits are read once. With the delete index on, each word
+    // is looked up directly instead.
+    void autoCorrectBatch(const std::vector<std::string>& words, BatchResults& out, WorkerPool* pool = nullptr,
+                          int maxDistance = 2) const {
+        std::vector<std::string> lowered;
+        std::vector<uint32_t> order;
+        sortBatch(words, lowered, order);
+        bool useIndex = deleteIndexEnabled && maxDistance <= DELETE_INDEX_DISTANCE;
+        
+        runBatch(order, out, pool, [&](size_t begin, size_t end, BatchResults& part) {
+            // One search per distinct unknown word in the run
+            CorrectionWalk walk;
+            std::vector<int> searchFor(end - begin, -1);
+            for (size_t i = begin; i < end; i++) {
+                if (useIndex || search(words[order[i]])) continue;
+                if (i > begin && searchFor[i - 1 - begin] >= 0 && lowered[order[i]] == lowered[order[i - 1]]) {
+                    searchFor[i - begin] = searchFor[i - 1 - begin];
+                    continue;
+                }
+                searchFor[i - begin] = (int)walk.searches.size();
+                walk.searches.push_back(CorrectionSearch());
+                walk.searches.back().target = lowered[order[i]];
+                walk.searches.back().maxDistance = maxDistance;
+            }
+            runCorrectionWalk(walk);
+            for (auto& search : walk.searches) {
+                rankCorrections(search.matches);
+            }
+            
+            TrieView trie = view();
+            for (size_t i = begin; i < end; i++) {
+                const std::string& word = words[order[i]];
+                uint32_t first = (uint32_t)part.wordEnds.size();
+                int index = searchFor[i - begin];
+                if (useIndex) {
+                    part.text += autoCorrect(word, maxDistance);
+                } else if (index < 0 || walk.searches[index].matches.empty()) {
+                    part.text += word;  // Known word, or nothing close enough
+                } else {
+                    trie.appendWord(walk.searches[index].matches[0].first, part.text);
+                }
+                part.wordEnds.push_back((uint32_t)part.text.size());
+                out.queries[order[i]] = std::make_pair(first, 1u);
+            }
+        });
+    }
+    
+    // Learn from user selection (Reinforcement Learning)
+    void userSelectedWord(const std::string& word) {
+        insertWord(word, 5); // Boost frequency significantly for user choices
+        std::cout << "Learning: Increased priority for '" << word << "'" << std::endl;
+    }
+    
+    // Predict next word based on context (Advanced ML feature). Uses the
+    // trigram counts for the last two words, backs off to the bigram counts
+    // for the last word, and fills any remaining places with the most
+    // frequent words overall.
+    std::vector<std::string> predictNextWord(const std::string& context, int maxPredictions = MAX_PREDICTIONS) const {
+        MetricsTimer timer(metrics, MetricOperation::Prediction, context);
+        std::vector<std::string> contextWords = splitIntoWords(context);
+        if (contextWords.empty()) return {};
+        
+        std::vector<NodeId> chosen;
+        auto addSuccessors = [&](const SuccessorList& successors) {
+            for (const Successor& next : successors) {
+                if ((int)chosen.size() >= maxPredictions) return;
+                if (std::find(chosen.begin(), chosen.end(), next.word) == chosen.end()) {
+                    chosen.push_back(next.word);
+                }
+            }
+        };
+        
+        NodeId last = findWordNode(contextWords.back());
+        if (last != NO_NODE) {
+            if (contextWords.size() >= 2) {
+                NodeId before = findWordNode(contextWords[contextWords.size() - 2]);
+                auto it = (before != NO_NODE) ? trigrams.find(trigramKey(before, last)) : trigrams.end();
+                if (it != trigrams.end()) addSuccessors(it->second);
+            }
+            auto it = bigrams.find(last);
+            if (it != bigrams.end()) addSuccessors(it->second);
+        }
+        
+        std::vector<std::string> predictions;
+        for (NodeId word : chosen) {
+            predictions.push_back(wordAt(word));
+        }
+        if ((int)predictions.size() < maxPredictions) {
+            for (const auto& word : view().bestFirstSuggestions(ROOT_NODE, maxPredictions)) {
+                if ((int)predictions.size() >= maxPredictions) break;
+                if (std::find(predictions.begin(), predictions.end(), word) == predictions.end()) {
+                    predictions.push_back(word);
+                }
+            }
+        }
+        return predictions;
+    }
+    
+    // Known words within maxDistance edits (insertion, deletion, substitution
+    // or transposition of neighbours), best first. One pass down the trie
+    // carries an edit-distance row per character and skips every subtree
+    // that is already out of reach. With the delete index on, distances it
+    // covers are answered from the index instead.
+    std::vector<std::string> getCorrections(const std::string& word, int maxDistance = 2, int maxResults = 5) const {
+        CorrectionWalk walk;
+        walk.searches.resize(1);
+        CorrectionSearch& search = walk.searches[0];
+        search.target = toLower(word);
+        search.maxDistance = maxDistance;
+        if (deleteIndexEnabled && maxDistance <= DELETE_INDEX_DISTANCE) {
+            search.matches = lookupDeleteIndex(search.target, maxDistance);
+        } else {
+            runCorrectionWalk(walk);
+        }
+        
+        rankCorrections(search.matches);
+        std::vector<std::string> result;
+        for (size_t i = 0; i < search.matches.size() && (int)result.size() < maxResults; i++) {
+            result.push_back(wordAt(search.matches[i].first));
+        }
+        return result;
+    }
+    
+    // Auto-correct with learning (ML-based correction)
+    std::string autoCorrect(const std::string& word, int maxDistance = 2) const {
+        MetricsTimer timer(metrics, MetricOperation::AutoCorrect, word);
+        if (search(word)) return word; // Word is correct
+        
+        // Find closest words using edit distance
+        std::vector<std::string> candidates = getCorrections(word, maxDistance, 1);
+        
+        if (candidates.empty()) return word;
+        
+        return candidates[0];
+    }
+    
+    // Save learned patterns to file; saving to the journaled file starts a new journal after it
+    void saveModel(const std::string& filename) {
+        MetricsTimer timer(metrics, MetricOperation::ModelSave, filename);
+        if (journal.isOpen() && journal.path() == filename) {
+            if (openJournal(filename)) std::cout << "Model saved to " << filename << std::endl;
+            return;
+        }
+        std::ofstream file(filename);
+        if (file.is_open()) {
+            std::string prefix;
+            saveTrieToFile(ROOT_NODE, prefix, file, decayScale());
+            saveNgramsToFile(file, decayScale());
+            file.close();
+            std::cout << "Model saved to " << filename << std::endl;
+        } else {
+            std::cout << "Error: Could not save model to " << filename << std::endl;
+        }
+    }
+    
+    // Save a binary snapshot of the node pool that can be loaded or mapped directly
+    void saveBinaryModel(const std::string& filename) {
+        MetricsTimer timer(metrics, MetricOperation::ModelSave, filename);
+        std::ofstream file(filename, std::ios::binary);
+        if (!file.is_open()) {
+            std::cout << "Error: Could not save model to " << filename << std::endl;
+            return;
+        }
+        // The file holds weights, as text saves do: under decay, write a copy
+        // of the nodes with the counts divided by the scale
+        double scale = decayScale();
+        std::vector<TrieNode> scaledNodes;
+        const std::vector<TrieNode>& image = (scale == 1.0) ? nodes : scaledNodes;
+        if (scale != 1.0) {
+            scaledNodes = nodes;
+            for (TrieNode& node : scaledNodes) {
+                if (node.maxSubtreeFrequency != std::numeric_limits<int>::min()) {
+                    node.maxSubtreeFrequency = decayedWeight(node.maxSubtreeFrequency, scale);
+                }
+                if (node.isEndOfWord) node.frequency = decayedWeight(node.frequency, scale);
+            }
+        }
+        
+        ModelFileHeader header;
+        std::memset(&header, 0, sizeof(header));
+        std::memcpy(header.magic, MODEL_MAGIC, sizeof(MODEL_MAGIC));
+        header.version = MODEL_FORMAT_VERSION;
+        header.nodeSize = sizeof(TrieNode);
+        header.nodeCount = nodes.size();
+        header.labelBytes = labels.size();
+        header.pathCompression = pathCompression ? 1 : 0;
+        header.wordCount = wordCount;
+        
+        // Flatten the completion caches so loading does not have to re-rank
+        // anything. Rounding scaled counts can tie them, which reorders the
+        // caches, so a scaled save leaves them to the load.
+        std::vector<uint32_t> cacheSection;
+        if (!completionCaches.empty() && scale == 1.0) {
+            cacheSection.push_back(0);
+            for (const auto& cache : completionCaches) {
+                cacheSection.push_back(cacheSection.back() + (uint32_t)cache.size());
+            }
+            header.cacheEntries = cacheSection.back();
+            for (const auto& cache : completionCaches) {
+                cacheSection.insert(cacheSection.end(), cache.begin(), cache.end());
+            }
+            if (header.cacheEntries == 0) cacheSection.clear();
+        }
+        std::vector<uint32_t> ngramSection;
+        flattenNgrams(ngramSection, scale);
+        header.ngramWords = ngramSection.size();
+        
+        const char* nodeBytes = reinterpret_cast<const char*>(image.data());
+        const char* cacheBytes = reinterpret_cast<const char*>(cacheSection.data());
+        uint64_t checksum = fnv1a(nodeBytes, nodes.size() * sizeof(TrieNode));
+        checksum = fnv1a(cacheBytes, cacheSection.size() * sizeof(uint32_t), checksum);
+        checksum = fnv1a(labels.data(), labels.size(), checksum);
+        const char* ngramBytes = reinterpret_cast<const char*>(ngramSection.data());
+        header.checksum = fnv1a(ngramBytes, ngramSection.size() * sizeof(uint32_t), checksum);
+        
+        file.write(reinterpret_cast<const char*>(&header), sizeof(header));
+        file.write(nodeBytes, nodes.size() * sizeof(TrieNode));
+        file.write(cacheBytes, cacheSection.size() * sizeof(uint32_t));
+        file.write(labels.data(), labels.size());
+        file.write(ngramBytes, ngramSection.size() * sizeof(uint32_t));
+        file.close();
+        
+        if (file) {
+            std::cout << "Model saved to " << filename << std::endl;
+        } else {
+            std::cout << "Error: Could not save model to " << filename << std::endl;
+        }
+    }
+    
+    // Replace the vocabulary with a binary snapshot; no per-word parsing or inserts
+    void loadBinaryModel(const std::string& filename) {
+        MetricsTimer timer(metrics, MetricOperation::ModelLoad, filename);
+        std::ifstream file(filename, std::ios::binary | std::ios::ate);
+        if (!file.is_open()) {
+            std::cout << "Could not load model from " << filename << std::endl;
+            return;
+        }
+        std::vector<char> image((size_t)file.tellg());
+        file.seekg(0);
+        file.read(image.data(), image.size());
+        
+        const char* error = file ? validateModelImage(image.data(), image.size(), true) : "read failed";
+        if (error) {
+            std::cout << "Could not load model from " << filename << ": " << error << std::endl;
+            return;
+        }
+        
+        ModelFileHeader header;
+        std::memcpy(&header, image.data(), sizeof(header));
+        const char* section = image.data() + sizeof(header);
+        nodes.resize((size_t)header.nodeCount);
+        std::memcpy(nodes.data(), section, nodes.size() * sizeof(TrieNode));
+        section += nodes.size() * sizeof(TrieNode);
+        
+        std::vector<uint32_t> cacheSection;
+        if (header.cacheEntries) {
+            cacheSection.resize((size_t)(header.nodeCount + 1 + header.cacheEntries));
+            std::memcpy(cacheSection.data(), section, cacheSection.size() * sizeof(uint32_t));
+            section += cacheSection.size() * sizeof(uint32_t);
+        }
+        labels.assign(section, (size_t)header.labelBytes);
+        section += header.labelBytes;
+        pathCompression = header.pathCompression != 0;
+        
+        std::vector<uint32_t> ngramSection((size_t)header.ngramWords);
+        if (header.ngramWords) std::memcpy(ngramSection.data(), section, ngramSection.size() * sizeof(uint32_t));
+        if (!unflattenNgrams(ngramSection.data(), ngramSection.size())) {
+            std::cout << "Warning: ignoring malformed n-gram section in " << filename << std::endl;
+            bigrams.clear();
+            trigrams.clear();
+        }
+        decayEpoch = std::chrono::steady_clock::now();  // The file holds weights, so its counts are current
+        
+        if (strategy == SuggestionStrategy::CompletionCache) {
+            completionCaches.assign(nodes.size(), std::vector<NodeId>());
+            if (cacheSection.empty()) {
+                rebuildAllCaches(ROOT_NODE);
+            } else {
+                const uint32_t* entries = cacheSection.data() + nodes.size() + 1;
+                for (size_t node = 0; node < nodes.size(); node++) {
+                    completionCaches[node].assign(entries + cacheSection[node], entries + cacheSection[node + 1]);
+                }
+            }
+        } else {
+            completionCaches.clear();
+        }
+        freeNodes.clear();
+        resultCache.clear();
+        labelGarbage = labels.size();
+        wordCount = 0;
+        frequencyTotal = 0;
+        for (NodeId node = 0; node < nodes.size(); node++) {
+            if (node != ROOT_NODE && nodes[node].parent == NO_NODE) {
+                freeNodes.push_back(node);  // Slot of a removed word
+            } else if (nodes[node].labelLength > 1) {
+                labelGarbage -= nodes[node].labelLength;
+            }
+            if (nodes[node].isEndOfWord) {
+                wordCount++;
+                frequencyTotal += nodes[node].frequency;
+            }
+        }
+        budgetCheckNodes = 0;
+        rebuildDeleteIndex();
+        if (journal.isOpen()) openJournal(journal.path());  // The journal now starts from the loaded state
+        std::cout << "Model loaded from " << filename << std::endl;
+    }
+    
+    // Load learned patterns from file, then replay any journal segments
+    // written after it. An open journal is re-based onto the loaded state.
+    void loadModel(const std::string& filename) {
+        MetricsTimer timer(metrics, MetricOperation::ModelLoad, filename);
+        std::string journalPath = journal.path();
+        bool journaling = journal.isOpen();
+        journal.close();
+        
+        auto loadLine = [this](const std::string& line) {
+            std::istringstream iss(line);
+            std::string word;
+            int frequency;
+            if (line[0] == '@') {
+                iss >> word;
+                loadNgramLine(word, iss);
+            } else if (line[0] == '!') {
+                removeWord(line.substr(1));
+            } else if (line.compare(0, 9, "#rescale ") == 0) {
+                double divisor = std::atof(line.c_str() + 9);
+                if (divisor > 0) rescaleFrequencies(divisor);
+            } else if (line[0] != '#' && iss >> word >> frequency) {
+                insertWord(word, frequency);
+            }
+        };
+        
+        std::ifstream file(filename);
+        if (file.is_open()) {
+            std::string line;
+            while (std::getline(file, line)) {
+                loadLine(line);
+            }
+            file.close();
+            
+            int segments = 0;
+            for (int number = LearningJournal::absorbedSegments(filename) + 1;
+                 LearningJournal::fileExists(LearningJournal::segmentPath(filename, number)); number++) {
+                LearningJournal::readSegment(LearningJournal::segmentPath(filename, number), loadLine);
+                segments++;
+            }
+            std::cout << "Model loaded from " << filename;
+            if (segments) std::cout << " (+" << segments << " journal segments)";
+            std::cout << std::endl;
+        } else {
+            std::cout << "Could not load model from " << filename << std::endl;
+        }
+        if (journaling) openJournal(journalPath);
+    }
+    
+    // Journal every learning event to `filename`'s journal instead of
+    // rewriting the whole model: the current state becomes the snapshot at
+    // `filename`, older journal segments are dropped, and later insertWord
+    // and n-gram updates are appended with group commits. loadModel(filename)
+    // restores snapshot plus journal; load it first to continue a journal.
+    bool openJournal(const std::string& filename) {
+        journal.close();
+        int absorbed = LearningJournal::lastSegment(filename);
+        std::ostringstream text;
+        text << "#absorbed " << absorbed << "\n";
+        std::string prefix;
+        saveTrieToFile(ROOT_NODE, prefix, text, decayScale());
+        saveNgramsToFile(text, decayScale());
+        if (!LearningJournal::replaceFile(filename, text.str())) {
+            std::cout << "Error: Could not save model to " << filename << std::endl;
+            return false;
+        }
+        LearningJournal::removeSegments(filename, absorbed);
+        if (!journal.openSegment(filename, absorbed + 1)) {
+            std::cout << "Error: Could not open journal for " << filename << std::endl;
+            return false;
+        }
+        return true;
+    }
+    
+    // Commit outstanding events and stop journaling
+    void closeJournal() {
+        journal.close();
+    }
+    
+    // Block until every learning event so far is on disk
+    void syncJournal() {
+        journal.sync();
+    }
+    
+    // Merge the journal into a new snapshot in the background
+    void compactJournal() {
+        journal.compact();
+    }
+    
+    bool journalOpen() const {
+        return journal.isOpen();
+    }
+    
+    // Write the hot-path metrics: calls, latency percentiles and trie nodes
+    // visited per call for each operation, with its slowest calls and their
+    // queries, after the vocabulary totals. As text or one JSON object.
+    void dumpMetrics(std::ostream& out, bool json = false) const {
+        long long totalFrequency = std::llround(frequencyTotal / decayScale());
+        if (json) {
+            out << "{\"words\":" << wordCount << ",\"frequency_total\":" << totalFrequency << ",\"operations\":";
+            metrics.printJson(out);
+            out << "}" << std::endl;
+        } else {
+            out << "Vocabulary: " << wordCount << " words, total frequency " << totalFrequency << std::endl;
+            metrics.print(out, true);
+        }
+    }
+    
+    // Start the metrics over, e.g. after warm-up
+    void resetMetrics() {
+        metrics.reset();
+    }
+    
+    // Display system statistics
+    void displayStats() {
+        size_t totalWords = wordCount;
+        long long totalFrequency = std::llround(frequencyTotal / decayScale());
+        
+        std::cout << "\n=== Predictive Text System Stats ===" << std::endl;
+        std::cout << "Total unique words: " << totalWords << std::endl;
+        std::cout << "Total usage frequency: " << totalFrequency << std::endl;
+        std::cout << "Average usage per word: " << (totalWords > 0 ? (double)totalFrequency/totalWords : 0) << std::endl;
+        MemoryReport memory = memoryReport();
+        std::cout << "Trie memory: " << memory.totalBytes / 1024 << " KB (" << memory.liveNodes << " nodes + "
+                  << memory.freeNodes << " free, " << memory.bytesPerNode << " bytes/node, " << memory.bytesPerWord
+                  << " bytes/word)" << std::endl;
+        if (memoryBudget) {
+            std::cout << "Memory budget: " << memory.inUseBytes / 1024 << " of " << memoryBudget / 1024 << " KB in use" << std::endl;
+        }
+        size_t successors = 0;
+        for (const auto& entry : bigrams) successors += entry.second.size();
+        for (const auto& entry : trigrams) successors += entry.second.size();
+        std::cout << "N-grams: " << bigrams.size() << " bigram contexts, " << trigrams.size()
+                  << " trigram contexts, " << successors << " successors" << std::endl;
+        if (resultCache.enabled()) {
+            resultCache.printStats();
+        }
+        if (decayHalfLife > 0) {
+            std::cout << "Frequency decay: half-life " << decayHalfLife << " s, current scale " << decayScale() << std::endl;
+        }
+        if (deleteIndexEnabled) {
+            std::cout << "Delete index: " << deleteIndex.size() << " keys, " << deleteIndexMemoryUsage() / 1024 << " KB" << std::endl;
+        }
+        metrics.print(std::cout, false);
+        std::cout << "====================================" << std::endl;
+    }
+    
+    // Add multiple words from text (for training)
+    void trainFromText(const std::string& text) {
+        std::vector<std::string> words = splitIntoWords(text);
+        std::cout << "Training from " << words.size() << " words..." << std::endl;
+        
+        std::vector<NodeId> sequence;
+        sequence.reserve(words.size());
+        for (const auto& word : words) {
+            sequence.push_back(learnWord(word, 1));
+        }
+        learnNgrams(sequence);
+        enforceMemoryBudget(NO_NODE);
+        
+        std::cout << "Training completed!" << std::endl;
+    }
+    
+    // Train from a stream of any size with bounded memory. Input is read in
+    // fixed-size chunks and word counts are aggregated locally, then applied
+    // to the trie whenever too many distinct words are pending.
+    TrainingReport trainFromStream(std::istream& in) {
+        auto start = std::chrono::high_resolution_clock::now();
+        TrainingReport report = {0, 0, 0.0};
+        
+        std::unordered_map<std::string, int> pending;
+        auto flushPending = [&]() {
+            for (const auto& pair : pending) {
+                insertWord(pair.first, pair.second);
+            }
+            pending.clear();
+        };
+        auto countWord = [&](const std::string& word) {
+            pending[word]++;
+            report.tokens++;
+        };
+        
+        WordTokenizer tokenizer;
+        std::vector<char> buffer(TRAINING_BUFFER_SIZE);
+        uint64_t nextReport = TRAINING_PROGRESS_INTERVAL;
+        while (in) {
+            in.read(buffer.data(), buffer.size());
+            size_t got = (size_t)in.gcount();
+            if (got == 0) break;
+            tokenizer.feed(buffer.data(), got, countWord);
+            report.bytes += got;
+            
+            if (pending.size() >= TRAINING_MAX_PENDING_WORDS) {
+                flushPending();
+            }
+            if (report.bytes >= nextReport) {
+                double elapsed = std::chrono::duration<double>(std::chrono::high_resolution_clock::now() - start).count();
+                std::cout << "Training: " << (report.bytes >> 20) << " MB, " << report.tokens << " words, "
+                          << (uint64_t)(report.tokens / elapsed) << " words/s" << std::endl;
+                nextReport += TRAINING_PROGRESS_INTERVAL;
+            }
+        }
+        tokenizer.finish(countWord);
+        flushPending();
+        
+        report.seconds = std::chrono::duration<double>(std::chrono::high_resolution_clock::now() - start).count();
+        std::cout << "Training completed: " << report.tokens << " words from " << report.bytes << " bytes in "
+                  << report.seconds << " s (" << (uint64_t)(report.tokens / std::max(report.seconds, 1e-9))
+                  << " words/s)" << std::endl;
+        return report;
+    }
+    
+    // Fold per-worker counts into the trie. Shard s of every worker is merged
+    // by its own thread, then the merged shards are applied with one insert
+    // per distinct word.
+    uint64_t applyWorkerCounts(std::vector<ShardedWordCounts>& workers) {
+        uint64_t tokens = 0;
+        for (const auto& worker : workers) {
+            tokens += worker.tokens;
+        }
+        
+        size_t shardCount = workers[0].shards.size();
+        std::vector<std::thread> mergers;
+        for (size_t shard = 0; shard < shardCount; shard++) {
+            mergers.emplace_back([&workers, shard]() {
+                WordCounts& merged = workers[0].shards[shard];
+                for (size_t w = 1; w < workers.size(); w++) {
+                    for (const auto& pair : workers[w].shards[shard]) {
+                        merged[pair.first] += pair.second;
+                    }
+                    WordCounts().swap(workers[w].shards[shard]);
+                }
+            });
+        }
+        for (auto& merger : mergers) {
+            merger.join();
+        }
+        
+        for (const auto& shard : workers[0].shards) {
+            for (const auto& pair : shard) {
+                insertWord(pair.first, pair.second);
+            }
+        }
+        return tokens;
+    }
+    
+    // Train on an in-memory corpus with worker threads counting disjoint ranges.
+    // Frequencies come out exactly as with trainFromText.
+    TrainingReport trainFromTextParallel(const std::string& text, int threadCount = 0) {
+        auto start = std::chrono::high_resolution_clock::now();
+        if (threadCount <= 0) threadCount = std::max(1, (int)std::thread::hardware_concurrency());
+        
+        std::vector<uint64_t> boundaries = wordAlignedBoundaries(text.size(), threadCount,
+                                                                 [&text](uint64_t i) { return text[(size_t)i]; });
+        std::vector<ShardedWordCounts> workers(threadCount, ShardedWordCounts(threadCount));
+        std::vector<std::thread> threads;
+        for (int t = 0; t < threadCount; t++) {
+            threads.emplace_back([&, t]() {
+                ShardedWordCounts& counts = workers[t];
+                auto countWord = [&counts](const std::string& word) { counts.add(word); };
+                WordTokenizer tokenizer;
+                tokenizer.feed(text.data() + boundaries[t], (size_t)(boundaries[t + 1] - boundaries[t]), countWord);
+                tokenizer.finish(countWord);
+            });
+        }
+        for (auto& thread : threads) {
+            thread.join();
+        }
+        
+        TrainingReport report = {text.size(), applyWorkerCounts(workers), 0.0};
+        report.seconds = std::chrono::duration<double>(std::chrono::high_resolution_clock::now() - start).count();
+        std::cout << "Parallel training completed: " << report.tokens << " words on " << threadCount
+                  << " threads in " << report.seconds << " s" << std::endl;
+        return report;
+    }
+    
+    // Train on a corpus file with worker threads, each streaming its own
+    // word-aligned byte range of the file in fixed-size chunks
+    TrainingReport trainFromFileParallel(const std::string& filename, int threadCount = 0) {
+        auto start = std::chrono::high_resolution_clock::now();
+        if (threadCount <= 0) threadCount = std::max(1, (int)std::thread::hardware_concurrency());
+        
+        std::ifstream probe(filename, std::ios::binary | std::ios::ate);
+        if (!probe.is_open()) {
+            std::cout << "Could not open training file " << filename << std::endl;
+            return TrainingReport{0, 0, 0.0};
+        }
+        uint64_t size = (uint64_t)probe.tellg();
+        std::vector<uint64_t> boundaries = wordAlignedBoundaries(size, threadCount, [&probe](uint64_t i) {
+            probe.seekg((std::streamoff)i);
+            return (char)probe.get();
+        });
+        
+        std::vector<ShardedWordCounts> workers(threadCount, ShardedWordCounts(threadCount));
+        std::vector<std::thread> threads;
+        for (int t = 0; t < threadCount; t++) {
+            threads.emplace_back([&, t]() {
+                ShardedWordCounts& counts = workers[t];
+                auto countWord = [&counts](const std::string& word) { counts.add(word); };
+                WordTokenizer tokenizer;
+                std::ifstream file(filename, std::ios::binary);
+                file.seekg((std::streamoff)boundaries[t]);
+                std::vector<char> buffer(TRAINING_BUFFER_SIZE);
+                uint64_t remaining = boundaries[t + 1] - boundaries[t];
+                while (remaining > 0 && file) {
+                    file.read(buffer.data(), (std::streamsize)std::min<uint64_t>(buffer.size(), remaining));
+                    size_t got = (size_t)file.gcount();
+                    if (got == 0) break;
+                    tokenizer.feed(buffer.data(), got, countWord);
+                    remaining -= got;
+                }
+                tokenizer.finish(countWord);
+            });
+        }
+        for (auto& thread : threads) {
+            thread.join();
+        }
+        
+        TrainingReport report = {size, applyWorkerCounts(workers), 0.0};
+        report.seconds = std::chrono::duration<double>(std::chrono::high_resolution_clock::now() - start).count();
+        std::cout << "Parallel training completed: " << report.tokens << " words on " << threadCount
+                  << " threads in " << report.seconds << " s (" << (uint64_t)(report.tokens / std::max(report.seconds, 1e-9))
+                  << " words/s)" << std::endl;
+        return report;
+    }
+    
+    // Stream a corpus file through trainFromStream
+    TrainingReport trainFromFile(const std::string& filename) {
+        std::ifstream file(filename, std::ios::binary);
+        if (!file.is_open()) {
+            std::cout << "Could not open training file " << filename << std::endl;
+            return TrainingReport{0, 0, 0.0};
+        }
+        return trainFromStream(file);
+    }
+};
+
+// One word being typed, a keystroke at a time. The session keeps the trie
+// position reached after every typed character, so typing steps one edge
+// character from the last position and backspace pops back to the previous
+// one. Completions come from a resumable best-first cursor, so "more" costs
+// only the extra results. Corrections keep, per typed character, every trie
+// position within maxDistance edits of the text so far; each level is built
+// from the one before it and kept for backspace. Edits count characters
+// (code points), like PredictiveTextSystem::getCorrections. Any change to the system
+// invalidates a session; call reset() after learning.
+class CompletionSession {
+private:
+    struct Position {
+        NodeId node;         // NO_NODE once the text has left the trie
+        uint16_t consumed;   // Characters of node's edge label matched
+    };
+    struct FuzzyState {
+        Position position;
+        int distance;        // Edit distance between the typed text and this trie path
+    };
+    typedef std::vector<FuzzyState> FuzzyLevel;
+    
+    const PredictiveTextSystem& system;
+    int maxDistance;
+    std::string typed;                        // Case-folded
+    std::vector<Position> positions;          // positions[i]: after i typed characters
+    TrieView::BestFirstCursor cursor;
+    bool cursorStarted;
+    std::vector<FuzzyLevel> fuzzyLevels;      // fuzzyLevels[i]: first i typed characters, built lazily
+    
+    // Call f(next position, character) for each position one character further down
+    template <typename Callback>
+    void forEachNext(Position position, Callback f) const {
+        const TrieNode& node = system.nodes[position.node];
+        if (position.consumed < node.labelLength) {
+            f(Position{position.node, (uint16_t)(position.consumed + 1)}, system.edgeChar(position.node, position.consumed));
+            return;
+        }
+        for (NodeId child = node.firstChild; child != NO_NODE; child = system.nodes[child].nextSibling) {
+            f(Position{child, 1}, system.nodes[child].label);
+        }
+    }
+    
+    // Call f(next position, packed character) for each position one whole
+    // character further down; a multi-byte character may span several edges
+    template <typename Callback>
+    void forEachNextCharacter(Position position, Callback& f, uint32_t partial = 0, uint8_t pending = 0) const {
+        forEachNext(position, [&](Position next, char byte) {
+            uint32_t character = partial;
+            uint8_t remaining = pending;
+            if (Utf8::feedByte(character, remaining, byte)) {
+                f(next, character);
+            } else {
+                forEachNextCharacter(next, f, character, remaining);
+            }
+        });
+    }
+    
+    Position step(Position position, char ch) const {
+        if (position.node == NO_NODE) return position;
+        NodeId node = system.stepDown(position.node, position.consumed, ch);
+        return Position{node, (node != NO_NODE) ? position.consumed : (uint16_t)0};
+    }
+    
+    Position step(Position position, const std::string& bytes) const {
+        for (char byte : bytes) {
+            position = step(position, byte);
+        }
+        return position;
+    }
+    
+    // Byte offset of each typed character
+    std::vector<size_t> characterStarts() const {
+        std::vector<size_t> starts;
+        for (size_t i = 0; i < typed.size(); i += Utf8::characterLength(typed.data(), typed.size(), i)) {
+            starts.push_back(i);
+        }
+        return starts;
+    }
+    
+    // Levels built from every typed character but the last stay valid when a
+    // byte is typed or erased, since only the last character can change
+    void dropStaleLevels() {
+        size_t characters = characterStarts().size();
+        if (fuzzyLevels.size() > characters) fuzzyLevels.resize(characters);
+    }
+    
+    static uint64_t positionKey(Position position) {
+        return ((uint64_t)position.node << 16) | position.consumed;
+    }
+    
+    // Record a state, keeping the smaller distance for a position seen before
+    void addState(FuzzyLevel& level, std::unordered_map<uint64_t, size_t>& index, Position position, int distance) const {
+        if (distance > maxDistance) return;
+        auto inserted = index.insert({positionKey(position), level.size()});
+        if (inserted.second) {
+            level.push_back({position, distance});
+        } else if (distance < level[inserted.first->second].distance) {
+            level[inserted.first->second].distance = distance;
+        }
+    }
+    
+    // Add the states reached by skipping trie characters (deletions from the
+    // trie path), one distance at a time so each state is final before it spreads
+    void closeLevel(FuzzyLevel& level, std::unordered_map<uint64_t, size_t>& index) const {
+        for (int distance = 0; distance < maxDistance; distance++) {
+            auto skip = [&](Position next, uint32_t) { addState(level, index, next, distance + 1); };
+            for (size_t i = 0; i < level.size(); i++) {
+                if (level[i].distance != distance) continue;
+                forEachNextCharacter(level[i].position, skip);
+            }
+        }
+    }
+    
+    // Build the fuzzy level for the first i typed characters, which start at
+    // `starts` and are packed in `characters`, from the levels before it
+    FuzzyLevel buildLevel(size_t i, const std::vector<size_t>& starts, const std::vector<uint32_t>& characters) const {
+        FuzzyLevel level;
+        std::unordered_map<uint64_t, size_t> index;
+        if (i == 0) {
+            addState(level, index, Position{ROOT_NODE, 0}, 0);
+            closeLevel(level, index);
+            return level;
+        }
+        
+        auto bytesOf = [&](size_t k) {
+            size_t end = (k + 1 < starts.size()) ? starts[k + 1] : typed.size();
+            return typed.substr(starts[k], end - starts[k]);
+        };
+        std::string ch = bytesOf(i - 1);
+        for (const FuzzyState& state : fuzzyLevels[i - 1]) {
+            addState(level, index, state.position, state.distance + 1);  // Typed character is extra
+            if (state.distance == maxDistance) {
+                // Only a match can stay within the limit
+                Position next = step(state.position, ch);
+                if (next.node != NO_NODE) addState(level, index, next, state.distance);
+                continue;
+            }
+            auto extend = [&](Position next, uint32_t label) {
+                addState(level, index, next, state.distance + (label == characters[i - 1] ? 0 : 1));  // Match or substitution
+            };
+            forEachNextCharacter(state.position, extend);
+        }
+        if (i >= 2) {
+            // Adjacent transposition: the trie path ends in ch then the previous typed character
+            std::string previous = bytesOf(i - 2);
+            for (const FuzzyState& state : fuzzyLevels[i - 2]) {
+                Position swapped = step(step(state.position, ch), previous);
+                if (swapped.node != NO_NODE) addState(level, index, swapped, state.distance + 1);
+            }
+        }
+        closeLevel(level, index);
+        return level;
+    }
+    
+    void push(char ch) {
+        typed += ch;
+        positions.push_back(step(positions.back(), ch));
+        dropStaleLevels();
+        cursorStarted = false;
+    }
+    
+public:
+    explicit CompletionSession(const PredictiveTextSystem& textSystem, int maxCorrectionDistance = 2)
+        : system(textSystem), maxDistance(maxCorrectionDistance), cursorStarted(false) {
+        reset();
+    }
+    
+    // Start over, optionally with some text already typed
+    void reset(const std::string& text = "") {
+        typed.clear();
+        positions.assign(1, Position{ROOT_NODE, 0});
+        fuzzyLevels.clear();
+        cursorStarted = false;
+        for (char ch : text) {
+            type(ch);
+        }
+    }
+    
+    // Keys arrive as UTF-8 bytes; once a multi-byte character is complete it
+    // is case-folded as a whole, which may rewrite its earlier bytes
+    void type(char ch) {
+        unsigned char c = (unsigned char)ch;
+        if (c < 0x80) {
+            push((char)std::tolower(c));
+            return;
+        }
+        push(ch);
+        size_t start = typed.size() - 1;
+        while (start > 0 && typed.size() - start < 4 && ((unsigned char)typed[start] & 0xC0) == 0x80) start--;
+        size_t length = Utf8::sequenceLength((unsigned char)typed[start]);
+        if (length < 2 || start + length != typed.size()) return;
+        
+        size_t i = start;
+        uint32_t codePoint;
+        if (!Utf8::decode(typed.data(), typed.size(), i, codePoint)) return;
+        std::string folded;
+        Utf8::append(Utf8::foldCase(codePoint), folded);
+        if (typed.compare(start, length, folded) == 0) return;
+        while (typed.size() > start) backspace();
+        for (char byte : folded) push(byte);
+    }
+    
+    void backspace() {
+        if (typed.empty()) return;
+        typed.pop_back();
+        positions.pop_back();
+        dropStaleLevels();
+        cursorStarted = false;
+    }
+    
+    const std::string& text() const {
+        return typed;
+    }
+    
+    // Whether any known word starts with the typed text
+    bool hasCompletions() const {
+        return positions.back().node != NO_NODE;
+    }
+    
+    // The next `count` completions in ranking order, continuing where the
+    // previous call for the same text stopped
+    std::vector<std::string> more(int count) {
+        std::vector<std::string> result;
+        if (!hasCompletions()) return result;
+        if (!cursorStarted) {
+            cursor = TrieView::BestFirstCursor(system.view(), positions.back().node);
+            cursorStarted = true;
+        }
+        while ((int)result.size() < count) {
+            NodeId word = cursor.next();
+            if (word == NO_NODE) break;
+            result.push_back(system.wordAt(word));
+        }
+        return result;
+    }
+    
+    // Known words within maxDistance edits of the typed text, ranked like
+    // PredictiveTextSystem::getCorrections
+    std::vector<std::string> corrections(int maxResults = 5) {
+        std::vector<size_t> starts = characterStarts();
+        std::vector<uint32_t> characters;
+        Utf8::splitCharacters(typed, characters);
+        while (fuzzyLevels.size() <= starts.size()) {
+            fuzzyLevels.push_back(buildLevel(fuzzyLevels.size(), starts, characters));
+        }
+        
+        std::vector<std::pair<NodeId, int>> matches;
+        for (const FuzzyState& state : fuzzyLevels[starts.size()]) {
+            const TrieNode& node = system.nodes[state.position.node];
+            if (state.position.consumed == node.labelLength && node.isEndOfWord) {
+                matches.push_back({state.position.node, state.distance});
+            }
+        }
+        system.rankCorrections(matches);
+        
+        std::vector<std::string> result;
+        for (size_t i = 0; i < matches.size() && (int)result.size() < maxResults; i++) {
+            result.push_back(system.wordAt(matches[i].first));
+        }
+        return result;
+    }
+};
+
+// Read-only model served straight from a memory-mapped binary model file.
+// Opening is O(1) apart from the optional checksum pass, and processes that
+// map the same file share its physical pages.
+class MappedModel {
+private:
+    const char* data;
+    size_t size;
+    bool mapped;                 // false when the image was read into `buffer` instead
+    std::vector<char> buffer;
+    
+    const char* nodeSection() const {
+        return data + sizeof(ModelFileHeader);
+    }
+    
+    const uint32_t* cacheSection() const {
+        return reinterpret_cast<const uint32_t*>(nodeSection() + header().nodeCount * sizeof(TrieNode));
+    }
+    
+    TrieView view() const {
+        size_t cacheWords = header().cacheEntries ? (size_t)(header().nodeCount + 1 + header().cacheEntries) : 0;
+        return TrieView(reinterpret_cast<const TrieNode*>(nodeSection()),
+                        reinterpret_cast<const char*>(cacheSection() + cacheWords));
+    }
+    
+public:
+    MappedModel() : data(nullptr), size(0), mapped(false) {}
+    
+    ~MappedModel() {
+        close();
+    }
+    
+    MappedModel(const MappedModel&) = delete;
+    MappedModel& operator=(const MappedModel&) = delete;
+    
+    // Map a file written by saveBinaryModel. Links are always bounds-checked;
+    // verifyChecksum also hashes every byte to catch corrupted values.
+    bool open(const std::string& filename, bool verifyChecksum = false) {
+        close();
+#ifdef HAVE_MMAP
+        int fd = ::open(filename.c_str(), O_RDONLY);
+        if (fd < 0) {
+            std::cout << "Could not open model " << filename << std::endl;
+            return false;
+        }
+        struct stat info;
+        if (fstat(fd, &info) == 0 && info.st_size > 0) {
+            void* address = mmap(nullptr, (size_t)info.st_size, PROT_READ, MAP_SHARED, fd, 0);
+            if (address != MAP_FAILED) {
+                data = static_cast<const char*>(address);
+                size = (size_t)info.st_size;
+                mapped = true;
+            }
+        }
+        ::close(fd);
+#endif
+        if (!data) {
+            // No mmap available: fall back to reading the file once
+            std::ifstream file(filename, std::ios::binary | std::ios::ate);
+            if (!file.is_open()) {
+                std::cout << "Could not open model " << filename << std::endl;
+                return false;
+            }
+            buffer.resize((size_t)file.tellg());
+            file.seekg(0);
+            file.read(buffer.data(), buffer.size());
+            data = buffer.data();
+            size = buffer.size();
+        }
+        
+        const char* error = validateModelImage(data, size, verifyChecksum);
+        if (error) {
+            std::cout << "Could not open model " << filename << ": " << error << std::endl;
+            close();
+            return false;
+        }
+        return true;
+    }
+    
+    void close() {
+#ifdef HAVE_MMAP
+        if (mapped) {
+            munmap(const_cast<char*>(data), size);
+        }
+#endif
+        std::vector<char>().swap(buffer);
+        data = nullptr;
+        size = 0;
+        mapped = false;
+    }
+    
+    bool isOpen() const {
+        return data != nullptr;
+    }
+    
+    const ModelFileHeader& header() const {
+        return *reinterpret_cast<const ModelFileHeader*>(data);
+    }
+    
+    bool search(const std::string& word) const {
+        bool exact;
+        FoldedText key(word);
+        NodeId node = view().findPrefixNode(key.str(), &exact);
+        return node != NO_NODE && exact && view().nodes[node].isEndOfWord;
+    }
     
-    TrieNode() : isEndOfWord(false), frequency(0) {}
+    std::vector<std::string> getSuggestions(const std::string& prefix, int maxSuggestions = 5) const {
+        if (prefix.empty() || !isOpen()) return {};
+        TrieView trie = view();
+        FoldedText key(prefix);
+        NodeId prefixNode = trie.findPrefixNode(key.str());
+        if (prefixNode == NO_NODE) return {};
+        
+        // Serve from the stored completion caches when the file has them
+        if (header().cacheEntries && maxSuggestions <= COMPLETION_CACHE_SIZE) {
+            const uint32_t* offsets = cacheSection();
+            const uint32_t* entries = offsets + header().nodeCount + 1;
+            std::vector<std::string> result;
+            for (uint32_t i = offsets[prefixNode]; i < offsets[prefixNode + 1] && (int)result.size() < maxSuggestions; i++) {
+                result.push_back(trie.wordAt(entries[i]));
+            }
+            return result;
+        }
+        return trie.bestFirstSuggestions(prefixNode, maxSuggestions);
+    }
 };
 
-// Main Predictive Text System with ML capabilities
-class PredictiveTextSystem {
+// Serves queries from many threads while learning continues. Readers grab
+// the published copy of the system with one atomic shared_ptr load and never
+// wait for the writer. Learning events are queued and applied in batches by
+// a single writer thread to two copies in turn: a batch goes into the standby
+// copy, that copy is published, and once the last reader has let go of the
+// old copy the same batch is replayed into it, so no copy is ever written
+// while a reader can see it.
+class ConcurrentPredictiveText {
 private:
-    TrieNode* root;
-    std::vector<std::pair<std::string, int>> suggestions;
+    std::unique_ptr<PredictiveTextSystem> copies[2];
+    int publishedIndex;                                      // Writer thread only
     
-    // Helper function to convert string to lowercase
-    std::string toLower(const std::string& str) {
-        std::string result = str;
-        std::transform(result.begin(), result.end(), result.begin(), ::tolower);
-        return result;
+    std::mutex releaseMutex;
+    std::condition_variable releaseChanged;
+    bool released[2];                                        // No reader holds copies[i]
+    
+    std::mutex queueMutex;
+    std::condition_variable queueChanged;
+    std::vector<std::pair<std::string, int>> queued;         // (word, frequency increase)
+    uint64_t queuedCount;
+    uint64_t appliedCount;
+    bool stopping;
+    
+    // Declared after the mutexes so its deleter can still signal on destruction.
+    // Accessed with std::atomic_load/atomic_store only.
+    std::shared_ptr<const PredictiveTextSystem> published;
+    std::thread writer;
+    
+    // A handle to copies[index] whose deleter, instead of freeing the copy,
+    // tells the writer that the last reader has let go of it
+    std::shared_ptr<const PredictiveTextSystem> makeHandle(int index) {
+        {
+            std::lock_guard<std::mutex> lock(releaseMutex);
+            released[index] = false;
+        }
+        return std::shared_ptr<const PredictiveTextSystem>(copies[index].get(),
+            [this, index](const PredictiveTextSystem*) {
+                std::lock_guard<std::mutex> lock(releaseMutex);
+                released[index] = true;
+                releaseChanged.notify_all();
+            });
     }
     
-    // Find the node corresponding to a prefix
-    TrieNode* findPrefixNode(const std::string& prefix) {
-        TrieNode* current = root;
-        for (char ch : prefix) {
-            if (current->children.find(ch) == current->children.end()) {
-                return nullptr;
+    void writerLoop() {
+        std::vector<std::pair<std::string, int>> batch;
+        while (true) {
+            {
+                std::unique_lock<std::mutex> lock(queueMutex);
+                queueChanged.wait(lock, [this]() { return stopping || !queued.empty(); });
+                if (queued.empty()) return;  // Stopping with nothing left to apply
+            }
+            
+            // Let more events arrive so one publish covers many of them
+            std::this_thread::sleep_for(std::chrono::milliseconds(LEARNING_BATCH_WINDOW_MS));
+            {
+                std::lock_guard<std::mutex> lock(queueMutex);
+                batch.swap(queued);
+            }
+            
+            // Settle frequency decay once per batch: both copies age by the
+            // same half-lives and store the same counts, so they cannot drift
+            // apart however long the old copy waits for its readers
+            int standby = 1 - publishedIndex;
+            int halvings = copies[standby]->agingDue();
+            if (halvings) copies[standby]->ageFrequencies(halvings);
+            double scale = copies[standby]->decayScale();
+            for (auto& event : batch) {
+                event.second = PredictiveTextSystem::clampFrequency((long long)std::llround(event.second * scale));
+                copies[standby]->insertScaledCount(event.first, event.second);
+            }
+            std::atomic_store(&published, makeHandle(standby));
+            int retired = publishedIndex;
+            publishedIndex = standby;
+            
+            // Wait for readers still holding the old copy, then bring it up to date
+            {
+                std::unique_lock<std::mutex> lock(releaseMutex);
+                releaseChanged.wait(lock, [this, retired]() { return released[retired]; });
+            }
+            if (halvings) copies[retired]->ageFrequencies(halvings);
+            for (const auto& event : batch) {
+                copies[retired]->insertScaledCount(event.first, event.second);
             }
-            current = current->children[ch];
+            
+            {
+                std::lock_guard<std::mutex> lock(queueMutex);
+                appliedCount += batch.size();
+            }
+            queueChanged.notify_all();
+            batch.clear();
         }
-        return current;
     }
     
-    // Recursively collect all words with given prefix
-    void collectSuggestions(TrieNode* node, const std::string& prefix) {
-        if (node->isEndOfWord) {
-            suggestions.push_back({node->word, node->frequency});
+public:
+    explicit ConcurrentPredictiveText(const PredictiveTextSystem& initial = PredictiveTextSystem())
+        : publishedIndex(0), queuedCount(0), appliedCount(0), stopping(false) {
+        copies[0].reset(new PredictiveTextSystem(initial));
+        copies[1].reset(new PredictiveTextSystem(initial));
+        released[0] = released[1] = true;
+        published = makeHandle(0);
+        writer = std::thread(&ConcurrentPredictiveText::writerLoop, this);
+    }
+    
+    // Snapshots handed out by snapshot() must be released before this runs
+    ~ConcurrentPredictiveText() {
+        {
+            std::lock_guard<std::mutex> lock(queueMutex);
+            stopping = true;
+        }
+        queueChanged.notify_all();
+        writer.join();
+    }
+    
+    ConcurrentPredictiveText(const ConcurrentPredictiveText&) = delete;
+    ConcurrentPredictiveText& operator=(const ConcurrentPredictiveText&) = delete;
+    
+    // The current read-only system; keep it only as long as needed, since the
+    // writer waits for the last holder before reusing an old copy
+    std::shared_ptr<const PredictiveTextSystem> snapshot() const {
+        return std::atomic_load(&published);
+    }
+    
+    std::vector<std::string> getSuggestions(const std::string& prefix, int maxSuggestions = 5) const {
+        return snapshot()->getSuggestions(prefix, maxSuggestions);
+    }
+    
+    std::string autoCorrect(const std::string& word) const {
+        return snapshot()->autoCorrect(word);
+    }
+    
+    std::vector<std::string> predictNextWord(const std::string& context) const {
+        return snapshot()->predictNextWord(context);
+    }
+    
+    // Queue a frequency change; it becomes visible with the writer's next batch
+    void learn(const std::string& word, int frequencyIncrease = 1) {
+        {
+            std::lock_guard<std::mutex> lock(queueMutex);
+            queued.push_back({word, frequencyIncrease});
+            queuedCount++;
         }
+        queueChanged.notify_all();
+    }
+    
+    void userSelectedWord(const std::string& word) {
+        learn(word, 5);  // Same boost as PredictiveTextSystem::userSelectedWord
+    }
+    
+    // Block until every event queued so far is visible to readers
+    void flush() {
+        std::unique_lock<std::mutex> lock(queueMutex);
+        uint64_t target = queuedCount;
+        queueChanged.wait(lock, [this, target]() { return appliedCount >= target; });
+    }
+};
+
+// Personalization for many users over one shared, read-only base system.
+// Each user has only an overlay: a sparse map from lowercased word to a
+// weight adjustment, which covers boosts and demotions of base words as
+// well as the user's own words. Queries merge the overlay with the base on
+// the fly. A word's weight is its base weight plus its adjustment, and a
+// word whose weight drops to 0 or below is hidden. An overlay costs tens of
+// bytes per adjusted word instead of a copy of the trie. Overlays load on
+// first use from <directory>/<user>.overlay ("word adjustment" lines). They
+// are written back and dropped when idle (evictIdle) or when more than
+// maxResident users are in memory, least recently used first.
+// All methods are safe to call from many threads.
+class PersonalizedText {
+private:
+    struct Overlay {
+        std::map<std::string, int> adjustments;   // Sorted, so a prefix is one range
+        std::list<std::string>::iterator recentEntry;
+        std::chrono::steady_clock::time_point lastUsed;
+        bool loaded;         // Read from disk; acquire loads it after releasing the global mutex
+        bool dirty;          // Changed since it was loaded or saved
+        bool evicted;        // Saved and dropped; a holder must look the user up again
+        std::mutex mutex;    // Guards the fields above except recentEntry and lastUsed
         
-        for (auto& pair : node->children) {
-            collectSuggestions(pair.second, prefix + pair.first);
+        Overlay() : loaded(false), dirty(false), evicted(false) {}
+    };
+    typedef std::pair<std::string, std::shared_ptr<Overlay>> Departure;
+    
+    std::shared_ptr<const PredictiveTextSystem> base;
+    std::string directory;
+    size_t maxResident;
+    std::mutex mutex;                                   // Guards overlays, leaving, recent and each lastUsed
+    std::unordered_map<std::string, std::shared_ptr<Overlay>> overlays;
+    std::unordered_map<std::string, std::shared_ptr<Overlay>> leaving;   // Evicted, still being written back
+    std::list<std::string> recent;                      // Resident users, most recently used first
+    
+    // User ids become file names, so they are limited to letters, digits, '-' and '_'
+    static bool validUser(const std::string& user) {
+        if (user.empty() || user.size() > 128) return false;
+        for (char c : user) {
+            if (!std::isalnum((unsigned char)c) && c != '-' && c != '_') return false;
         }
+        return true;
     }
     
-    // Search for exact word in trie
-    bool search(const std::string& word) {
-        TrieNode* current = root;
-        std::string lowerWord = toLower(word);
+    std::string overlayPath(const std::string& user) const {
+        return directory + "/" + user + ".overlay";
+    }
+    
+    // A user's overlay, loaded from disk if it is not resident; null for an
+    // invalid id. No file IO happens under `mutex`: a new overlay is loaded
+    // under its own mutex, and the overlays evicted to make room for it are
+    // written back once `mutex` is released.
+    std::shared_ptr<Overlay> acquire(const std::string& user) {
+        if (!validUser(user)) {
+            std::cout << "Error: Invalid user id '" << user << "'" << std::endl;
+            return nullptr;
+        }
+        std::shared_ptr<Overlay> overlay;
+        std::vector<Departure> departures;
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            auto it = overlays.find(user);
+            if (it != overlays.end()) {
+                overlay = it->second;
+                recent.splice(recent.begin(), recent, overlay->recentEntry);
+            } else {
+                auto pending = leaving.find(user);
+                if (pending != leaving.end()) {
+                    overlay = pending->second;  // Take it back rather than read a file about to be rewritten
+                    leaving.erase(pending);
+                } else {
+                    overlay = std::make_shared<Overlay>();
+                }
+                recent.push_front(user);
+                overlay->recentEntry = recent.begin();
+                overlays[user] = overlay;
+                while (overlays.size() > maxResident) departures.push_back(detach(recent.back()));
+            }
+            overlay->lastUsed = std::chrono::steady_clock::now();
+        }
+        for (const Departure& departure : departures) writeBack(departure);
         
-        for (char ch : lowerWord) {
-            if (current->children.find(ch) == current->children.end()) {
+        std::lock_guard<std::mutex> lock(overlay->mutex);
+        if (!overlay->loaded) {
+            LearningJournal::readSegment(overlayPath(user), [&overlay](const std::string& line) {
+                std::istringstream iss(line);
+                std::string word;
+                int adjustment;
+                if (iss >> word >> adjustment && adjustment != 0) overlay->adjustments[word] += adjustment;
+            });
+            overlay->loaded = true;
+        }
+        return overlay;
+    }
+    
+    // Take a resident overlay out of the cache into `leaving`; the caller
+    // passes it to writeBack after releasing `mutex`. Caller holds `mutex`.
+    Departure detach(const std::string& user) {
+        auto it = overlays.find(user);
+        Departure departure(user, it->second);
+        recent.erase(departure.second->recentEntry);
+        overlays.erase(it);
+        leaving[departure.first] = departure.second;
+        return departure;
+    }
+    
+    // Save a detached overlay if it changed and drop it; false if it stays
+    // resident because it could not be saved, changed again meanwhile, or was
+    // taken back by acquire. Caller must not hold `mutex`.
+    bool writeBack(const Departure& departure) {
+        const std::shared_ptr<Overlay>& overlay = departure.second;
+        {
+            std::lock_guard<std::mutex> overlayLock(overlay->mutex);
+            if (overlay->dirty) save(departure.first, *overlay);
+        }
+        std::lock_guard<std::mutex> lock(mutex);
+        auto it = leaving.find(departure.first);
+        if (it == leaving.end() || it->second != overlay) return false;
+        leaving.erase(it);
+        std::lock_guard<std::mutex> overlayLock(overlay->mutex);
+        if (overlay->dirty) {
+            recent.push_back(departure.first);  // Least recently used, so the next eviction retries it
+            overlay->recentEntry = std::prev(recent.end());
+            overlays[departure.first] = overlay;
+            return false;
+        }
+        overlay->evicted = true;
+        return true;
+    }
+    
+    // Caller holds the overlay's mutex
+    bool save(const std::string& user, Overlay& overlay) {
+        std::string path = overlayPath(user);
+        if (overlay.adjustments.empty()) {
+            std::remove(path.c_str());
+        } else {
+            std::string text;
+            for (const auto& entry : overlay.adjustments) {
+                text += entry.first + " " + std::to_string(entry.second) + "\n";
+            }
+            if (!LearningJournal::replaceFile(path, text)) {
+                std::cout << "Error: Could not save overlay to " << path << std::endl;
                 return false;
             }
-            current = current->children[ch];
+        }
+        overlay.dirty = false;
+        return true;
+    }
+    
+    // A base word's weight in the units of overlay adjustments
+    long long baseWeight(NodeId node) const {
+        return std::llround(base->nodes[node].frequency / base->decayScale());
+    }
+    
+    // Weight of a word with an overlay entry
+    long long adjustedWeight(const std::string& word, int adjustment) const {
+        NodeId node = base->findWordNode(word);
+        return (node != NO_NODE ? baseWeight(node) : 0) + adjustment;
+    }
+    
+    struct Ranked {
+        long long weight;
+        std::string word;
+        
+        bool operator<(const Ranked& other) const {
+            if (weight != other.weight) return weight > other.weight;
+            return word < other.word;
+        }
+    };
+    
+public:
+    PersonalizedText(std::shared_ptr<const PredictiveTextSystem> baseSystem, const std::string& overlayDirectory,
+                     size_t maxResidentUsers = 10000)
+        : base(baseSystem), directory(overlayDirectory), maxResident(std::max<size_t>(1, maxResidentUsers)) {
+#ifdef HAVE_MMAP
+        mkdir(directory.c_str(), 0755);  // Fails harmlessly if it exists
+#endif
+    }
+    
+    // Every changed overlay is written back
+    ~PersonalizedText() {
+        std::vector<Departure> departures;
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            while (!recent.empty()) departures.push_back(detach(recent.front()));
+        }
+        for (const Departure& departure : departures) writeBack(departure);
+    }
+    
+    PersonalizedText(const PersonalizedText&) = delete;
+    PersonalizedText& operator=(const PersonalizedText&) = delete;
+    
+    // The user's top completions: overlay words with the prefix, merged with
+    // the base's best words that the overlay leaves alone
+    std::vector<std::string> getSuggestions(const std::string& user, const std::string& prefix, int maxSuggestions = 5) {
+        if (prefix.empty()) return {};
+        std::shared_ptr<Overlay> overlay = acquire(user);
+        if (!overlay) return base->getSuggestions(prefix, maxSuggestions);
+        FoldedText key(prefix);
+        const std::string& lowerPrefix = key.str();
+        
+        std::lock_guard<std::mutex> lock(overlay->mutex);
+        const std::map<std::string, int>& adjustments = overlay->adjustments;
+        std::vector<Ranked> ranked;
+        for (auto it = adjustments.lower_bound(lowerPrefix);
+             it != adjustments.end() && it->first.compare(0, lowerPrefix.size(), lowerPrefix) == 0; ++it) {
+            long long weight = adjustedWeight(it->first, it->second);
+            if (weight > 0) ranked.push_back({weight, it->first});
+        }
+        
+        // Base words the overlay does not touch keep their base order, so
+        // the first maxSuggestions of them are all the merge can need
+        NodeId start = base->findPrefixNode(lowerPrefix);
+        if (start != NO_NODE) {
+            TrieView trie = base->view();
+            size_t overlayCount = ranked.size();
+            int taken = 0;
+            auto consider = [&](NodeId node) {
+                std::string word = trie.wordAt(node);
+                if (adjustments.count(word)) return;
+                ranked.push_back({baseWeight(node), word});
+                taken++;
+            };
+            bool complete = false;
+            if (base->strategy == SuggestionStrategy::CompletionCache) {
+                const std::vector<NodeId>& cache = base->completionCaches[start];
+                for (size_t i = 0; i < cache.size() && taken < maxSuggestions; i++) consider(cache[i]);
+                complete = taken == maxSuggestions || cache.size() < COMPLETION_CACHE_SIZE;
+            }
+            if (!complete) {
+                ranked.resize(overlayCount);
+                taken = 0;
+                TrieView::BestFirstCursor cursor(trie, start);
+                for (NodeId node; taken < maxSuggestions && (node = cursor.next()) != NO_NODE; ) consider(node);
+            }
         }
         
-        return current->isEndOfWord;
+        std::sort(ranked.begin(), ranked.end());
+        std::vector<std::string> result;
+        for (size_t i = 0; i < ranked.size() && (int)result.size() < maxSuggestions; i++) {
+            result.push_back(ranked[i].word);
+        }
+        return result;
     }
     
-    // Find correction candidates using edit distance
-    void findCandidates(TrieNode* node, const std::string& current, const std::string& target, 
-                       std::vector<std::pair<std::string, int>>& candidates, int editDistance, int maxDistance) {
-        if (editDistance > maxDistance) return;
+    // The word if the user knows it, else the best correction among base and
+    // overlay words, scored like PredictiveTextSystem::autoCorrect
+    std::string autoCorrect(const std::string& user, const std::string& word, int maxDistance = 2) {
+        std::shared_ptr<Overlay> overlay = acquire(user);
+        if (!overlay) return base->autoCorrect(word, maxDistance);
+        std::string lowerWord = PredictiveTextSystem::toLower(word);
         
-        if (node->isEndOfWord && editDistance <= maxDistance) {
-            candidates.push_back({node->word, node->frequency - editDistance * 10}); // Penalize edit distance
+        std::lock_guard<std::mutex> lock(overlay->mutex);
+        const std::map<std::string, int>& adjustments = overlay->adjustments;
+        auto own = adjustments.find(lowerWord);
+        if (own != adjustments.end() ? adjustedWeight(lowerWord, own->second) > 0 : base->search(lowerWord)) {
+            return word;
         }
         
-        for (auto& pair : node->children) {
-            char ch = pair.first;
-            TrieNode* child = pair.second;
-            
-            // Try different edit operations
-            findCandidates(child, current + ch, target, candidates, editDistance + 1, maxDistance); // Insertion
-            
-            if (!target.empty()) {
-                if (current.length() < target.length() && target[current.length()] == ch) {
-                    findCandidates(child, current + ch, target, candidates, editDistance, maxDistance); // Match
-                } else {
-                    findCandidates(child, current + ch, target, candidates, editDistance + 1, maxDistance); // Substitution
+        PredictiveTextSystem::CorrectionWalk walk;
+        walk.searches.resize(1);
+        PredictiveTextSystem::CorrectionSearch& search = walk.searches[0];
+        search.target = lowerWord;
+        search.maxDistance = maxDistance;
+        if (base->deleteIndexEnabled && maxDistance <= DELETE_INDEX_DISTANCE) {
+            search.matches = base->lookupDeleteIndex(lowerWord, maxDistance);
+        } else {
+            base->runCorrectionWalk(walk);
+        }
+        
+        // (score, distance, word): weight minus 10 per edit, then fewer edits, then alphabetical.
+        // Weights come from baseWeight and adjustedWeight, which divide out the decay scale.
+        std::tuple<long long, int, std::string> best(std::numeric_limits<long long>::min(), 0, word);
+        auto offer = [&best](long long weight, int distance, const std::string& candidate) {
+            long long score = weight - distance * 10;
+            if (score > std::get<0>(best) || (score == std::get<0>(best) && (distance < std::get<1>(best) ||
+                (distance == std::get<1>(best) && candidate < std::get<2>(best))))) {
+                best = std::make_tuple(score, distance, candidate);
+            }
+        };
+        for (const auto& match : search.matches) {
+            std::string candidate = base->wordAt(match.first);
+            if (!adjustments.count(candidate)) offer(baseWeight(match.first), match.second, candidate);
+        }
+        for (const auto& entry : adjustments) {
+            int distance = PredictiveTextSystem::boundedEditDistance(entry.first, lowerWord, maxDistance);
+            if (distance > maxDistance) continue;
+            long long weight = adjustedWeight(entry.first, entry.second);
+            if (weight > 0) offer(weight, distance, entry.first);
+        }
+        return std::get<2>(best);
+    }
+    
+    // Adjust a word's weight for one user; a new word becomes the user's own
+    void learn(const std::string& user, const std::string& word, int adjustment = 1) {
+        std::string lowerWord = PredictiveTextSystem::toLower(word);
+        if (lowerWord.empty() || lowerWord.find_first_of(" \t\r\n") != std::string::npos || adjustment == 0) return;
+        while (std::shared_ptr<Overlay> overlay = acquire(user)) {
+            std::lock_guard<std::mutex> lock(overlay->mutex);
+            if (overlay->evicted) continue;  // Saved and dropped meanwhile; reload it
+            int& value = overlay->adjustments[lowerWord];
+            value = (int)std::max<long long>(std::numeric_limits<int>::min(),
+                                             std::min<long long>(std::numeric_limits<int>::max(), (long long)value + adjustment));
+            if (value == 0) overlay->adjustments.erase(lowerWord);
+            overlay->dirty = true;
+            return;
+        }
+    }
+    
+    void userSelectedWord(const std::string& user, const std::string& word) {
+        learn(user, word, 5);  // Same boost as PredictiveTextSystem::userSelectedWord
+    }
+    
+    // Write back and drop every overlay unused for idleSeconds; returns how many
+    size_t evictIdle(double idleSeconds) {
+        std::vector<Departure> departures;
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            auto cutoff = std::chrono::steady_clock::now() -
+                          std::chrono::duration_cast<std::chrono::steady_clock::duration>(std::chrono::duration<double>(idleSeconds));
+            while (!recent.empty() && overlays[recent.back()]->lastUsed <= cutoff) {
+                departures.push_back(detach(recent.back()));
+            }
+        }
+        size_t evicted = 0;
+        for (const Departure& departure : departures) evicted += writeBack(departure);
+        return evicted;
+    }
+    
+    // Drop a user's overlay from memory and disk
+    void forgetUser(const std::string& user) {
+        if (!validUser(user)) return;
+        std::shared_ptr<Overlay> overlay;
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            auto it = overlays.find(user);
+            if (it != overlays.end()) {
+                overlay = it->second;
+                recent.erase(overlay->recentEntry);
+                overlays.erase(it);
+            } else {
+                auto pending = leaving.find(user);
+                if (pending != leaving.end()) {
+                    overlay = pending->second;
+                    leaving.erase(pending);
                 }
             }
         }
+        if (overlay) {
+            std::lock_guard<std::mutex> overlayLock(overlay->mutex);  // Waits out a write-back in progress
+            overlay->adjustments.clear();
+            overlay->loaded = true;
+            overlay->dirty = false;
+            overlay->evicted = true;
+        }
+        std::remove(overlayPath(user).c_str());
     }
     
-    // Split text into individual words
-    std::vector<std::string> splitIntoWords(const std::string& text) {
-        std::vector<std::string> words;
-        std::istringstream iss(text);
-        std::string word;
-        while (iss >> word) {
-            // Remove punctuation
-            word.erase(std::remove_if(word.begin(), word.end(), 
-                      [](char c) { return !std::isalnum(c); }), word.end());
-            if (!word.empty()) {
-                words.push_back(word);
+    size_t residentUsers() {
+        std::lock_guard<std::mutex> lock(mutex);
+        return overlays.size();
+    }
+    
+    // Approximate bytes held by the resident overlays: map nodes and the
+    // words too long for in-place string storage. The overlays are listed
+    // under `mutex` and summed after releasing it, so a slow overlay (one
+    // being loaded, say) does not hold up every other user.
+    size_t memoryUsage() {
+        size_t bytes = 0;
+        std::vector<std::shared_ptr<Overlay>> resident;
+        {
+            std::lock_guard<std::mutex> lock(mutex);
+            resident.reserve(overlays.size());
+            for (const auto& entry : overlays) {
+                bytes += sizeof(Overlay) + sizeof(entry) + entry.first.capacity() + 2 * sizeof(void*);
+                resident.push_back(entry.second);
             }
         }
-        return words;
+        for (const auto& overlay : resident) {
+            std::lock_guard<std::mutex> overlayLock(overlay->mutex);
+            for (const auto& adjustment : overlay->adjustments) {
+                bytes += sizeof(adjustment) + 4 * sizeof(void*);  // Tree node links and colour
+                const char* inlineStart = reinterpret_cast<const char*>(&adjustment.first);
+                if (adjustment.first.data() < inlineStart || adjustment.first.data() >= inlineStart + sizeof(std::string)) {
+                    bytes += adjustment.first.capacity() + 1;
+                }
+            }
+        }
+        return bytes;
     }
+};
+
+#ifdef HAVE_EPOLL
+// Serves a ConcurrentPredictiveText over TCP or a Unix socket. The protocol
+// is one request per line, using the interactive demo's commands:
+//   suggest <prefix> [k]   -> "OK w1 w2 ..."
+//   correct <word>         -> "OK word"
+//   predict <context>      -> "OK w1 w2 ..."
+//   select <word>          -> "OK"
+//   train <text>           -> "OK <words learned>"
+//   ping                   -> "OK"
+//   quit                   -> "OK", then the server closes the connection
+// Anything else gets "ERR <reason>". Every request gets exactly one response
+// line, in order, so clients may pipeline. One thread runs the epoll loop.
+// The requests that arrive in one wakeup are answered together on a
+// WorkerPool. Learning is queued for the system's single writer, so it
+// shows in answers after the writer's next batch.
+class PredictiveTextServer {
+private:
+    struct Connection {
+        std::string input;      // Received bytes not yet forming a full line
+        std::string output;     // Responses not yet written
+        uint32_t events;        // Registered epoll events
+        bool closing;           // Answer nothing more; close once output is written
+    };
     
-    // Load common English words with initial frequencies
-    void loadCommonWords() {
-        std::vector<std::pair<std::string, int>> commonWords = {
-            {"the", 100}, {"and", 90}, {"to", 85}, {"of", 80}, {"a", 75},
-            {"in", 70}, {"is", 65}, {"it", 60}, {"you", 55}, {"that", 50},
-            {"he", 45}, {"was", 45}, {"for", 40}, {"on", 40}, {"are", 35},
-            {"as", 35}, {"with", 30}, {"his", 30}, {"they", 25}, {"i", 25},
-            {"at", 20}, {"be", 20}, {"this", 20}, {"have", 18}, {"from", 18},
-            {"or", 15}, {"one", 15}, {"had", 15}, {"by", 12}, {"word", 12},
-            {"but", 10}, {"not", 10}, {"what", 10}, {"all", 8}, {"were", 8},
-            {"would", 7}, {"there", 7}, {"we", 6}, {"when", 6}, {"your", 5},
-            {"can", 12}, {"said", 11}, {"each", 9}, {"which", 9}, {"she", 8},
-            {"do", 15}, {"how", 12}, {"their", 10}, {"if", 14}, {"will", 13},
-            {"up", 11}, {"other", 8}, {"about", 7}, {"out", 10}, {"many", 6},
-            {"then", 9}, {"them", 8}, {"these", 6}, {"so", 12}, {"some", 7},
-            {"her", 9}, {"would", 7}, {"make", 8}, {"like", 9}, {"into", 6},
-            {"him", 7}, {"time", 8}, {"has", 9}, {"two", 6}, {"more", 7},
-            {"go", 8}, {"no", 9}, {"way", 6}, {"could", 6}, {"my", 10},
-            {"than", 6}, {"first", 5}, {"been", 6}, {"call", 4}, {"who", 7},
-            {"its", 5}, {"now", 8}, {"find", 5}, {"long", 4}, {"down", 5},
-            {"day", 6}, {"did", 6}, {"get", 8}, {"come", 5}, {"made", 5},
-            {"may", 4}, {"part", 4}, {"over", 5}, {"new", 6}, {"sound", 3},
-            {"take", 6}, {"only", 5}, {"little", 4}, {"work", 5}, {"know", 7}
-        };
-        
-        for (const auto& pair : commonWords) {
-            insertWord(pair.first, pair.second);
+    struct Request {
+        int fd;
+        std::string line;
+        std::string response;
+        bool quit;
+    };
+    
+    ConcurrentPredictiveText& text;
+    WorkerPool pool;
+    int epollFd;
+    int wakeFd;                 // eventfd that interrupts epoll_wait for stop()
+    std::vector<int> listenFds;
+    uint16_t boundPort;
+    std::string unixPath;
+    std::unordered_map<int, Connection> connections;
+    std::atomic<bool> stopping;
+    std::atomic<uint64_t> served;
+    
+    bool isListener(int fd) const {
+        return std::find(listenFds.begin(), listenFds.end(), fd) != listenFds.end();
+    }
+    
+    bool startListening(int fd, const sockaddr* address, socklen_t length, const std::string& description) {
+        int on = 1;
+        setsockopt(fd, SOL_SOCKET, SO_REUSEADDR, &on, sizeof(on));
+        epoll_event event;
+        event.events = EPOLLIN;
+        event.data.fd = fd;
+        if (bind(fd, address, length) != 0 || listen(fd, SOMAXCONN) != 0 ||
+            epoll_ctl(epollFd, EPOLL_CTL_ADD, fd, &event) != 0) {
+            std::cout << "Error: Could not listen on " << description << std::endl;
+            close(fd);
+            return false;
         }
+        listenFds.push_back(fd);
+        return true;
     }
     
-    // Save trie to file recursively
-    void saveTrieToFile(TrieNode* node, const std::string& prefix, std::ofstream& file) {
-        if (node->isEndOfWord) {
-            file << node->word << " " << node->frequency << std::endl;
+    void acceptConnections(int listenFd) {
+        while (true) {
+            int fd = accept4(listenFd, nullptr, nullptr, SOCK_NONBLOCK | SOCK_CLOEXEC);
+            if (fd < 0) return;  // EAGAIN: nothing more waiting
+            int on = 1;
+            setsockopt(fd, IPPROTO_TCP, TCP_NODELAY, &on, sizeof(on));  // Fails harmlessly on Unix sockets
+            epoll_event event;
+            event.events = EPOLLIN;
+            event.data.fd = fd;
+            if (epoll_ctl(epollFd, EPOLL_CTL_ADD, fd, &event) != 0) {
+                close(fd);
+                continue;
+            }
+            Connection& connection = connections[fd];
+            connection.events = EPOLLIN;
+            connection.closing = false;
+        }
+    }
+    
+    void closeConnection(int fd) {
+        epoll_ctl(epollFd, EPOLL_CTL_DEL, fd, nullptr);
+        close(fd);
+        connections.erase(fd);
+    }
+    
+    // Read what has arrived and queue each complete line; false if the connection failed
+    bool readRequests(int fd, Connection& connection, std::vector<Request>& batch) {
+        char buffer[1 << 16];
+        ssize_t got = recv(fd, buffer, sizeof(buffer), 0);
+        if (got == 0) {
+            connection.closing = true;  // The client is done sending; finish writing to it
+            return true;
         }
+        if (got < 0) return errno == EAGAIN || errno == EWOULDBLOCK || errno == EINTR;
         
-        for (auto& pair : node->children) {
-            saveTrieToFile(pair.second, prefix + pair.first, file);
+        connection.input.append(buffer, (size_t)got);
+        size_t start = 0;
+        for (size_t end; (end = connection.input.find('\n', start)) != std::string::npos; start = end + 1) {
+            size_t length = end - start;
+            if (length > 0 && connection.input[end - 1] == '\r') length--;
+            batch.push_back(Request{fd, connection.input.substr(start, length), std::string(), false});
+        }
+        connection.input.erase(0, start);
+        if (connection.input.size() > SERVER_MAX_LINE) {
+            batch.push_back(Request{fd, std::string(), std::string(), false});
+            batch.back().line.swap(connection.input);  // Answered with an error
         }
+        return true;
     }
     
-    // Calculate system statistics recursively
-    void calculateStats(TrieNode* node, int& totalWords, int& totalFrequency) {
-        if (node->isEndOfWord) {
-            totalWords++;
-            totalFrequency += node->frequency;
+    // Write as much pending output as the socket takes, then register for
+    // what the connection waits on next: more input, or room to write.
+    // A connection with SERVER_MAX_OUTPUT bytes unwritten is not read from
+    // until its client catches up. False if the connection is done.
+    bool flush(int fd, Connection& connection) {
+        size_t written = 0;
+        while (written < connection.output.size()) {
+            ssize_t sent = send(fd, connection.output.data() + written, connection.output.size() - written, MSG_NOSIGNAL);
+            if (sent < 0) {
+                if (errno == EAGAIN || errno == EWOULDBLOCK) break;
+                if (errno == EINTR) continue;
+                return false;
+            }
+            written += (size_t)sent;
         }
+        connection.output.erase(0, written);
+        if (connection.closing && connection.output.empty()) return false;
         
-        for (auto& pair : node->children) {
-            calculateStats(pair.second, totalWords, totalFrequency);
+        uint32_t events = 0;
+        if (!connection.closing && connection.output.size() < SERVER_MAX_OUTPUT) events |= EPOLLIN;
+        if (!connection.output.empty()) events |= EPOLLOUT;
+        if (events != connection.events) {
+            epoll_event event;
+            event.events = events;
+            event.data.fd = fd;
+            epoll_ctl(epollFd, EPOLL_CTL_MOD, fd, &event);
+            connection.events = events;
         }
+        return true;
     }
     
-    // Delete trie to prevent memory leaks
-    void deleteTrie(TrieNode* node) {
-        for (auto& pair : node->children) {
-            deleteTrie(pair.second);
+    void respond(Request& request) const {
+        if (request.line.size() > SERVER_MAX_LINE) {
+            request.response = "ERR line too long";
+            request.quit = true;
+            return;
+        }
+        std::istringstream iss(request.line);
+        std::string command;
+        iss >> command;
+        std::string argument;
+        std::getline(iss >> std::ws, argument);
+        
+        std::vector<std::string> words;
+        if (command == "suggest") {
+            std::istringstream arguments(argument);
+            std::string prefix;
+            int count = 5;
+            if (!(arguments >> prefix)) {
+                request.response = "ERR usage: suggest <prefix> [k]";
+                return;
+            }
+            arguments >> count;
+            words = text.getSuggestions(prefix, std::max(1, std::min(count, 100)));
+        } else if (command == "correct") {
+            if (argument.empty()) {
+                request.response = "ERR usage: correct <word>";
+                return;
+            }
+            words.push_back(text.autoCorrect(argument));
+        } else if (command == "predict") {
+            words = text.predictNextWord(argument);
+        } else if (command == "select") {
+            if (argument.empty()) {
+                request.response = "ERR usage: select <word>";
+                return;
+            }
+            text.userSelectedWord(argument);
+        } else if (command == "train") {
+            // Word counts only: the shared writer does not learn n-grams
+            int learned = 0;
+            WordTokenizer tokenizer;
+            auto onWord = [&](const std::string& word) {
+                text.learn(word, 1);
+                learned++;
+            };
+            tokenizer.feed(argument.data(), argument.size(), onWord);
+            tokenizer.finish(onWord);
+            words.push_back(std::to_string(learned));
+        } else if (command == "quit") {
+            request.quit = true;
+        } else if (command != "ping") {
+            request.response = "ERR unknown command";
+            return;
+        }
+        request.response = "OK";
+        for (const auto& word : words) {
+            request.response += " " + word;
         }
-        delete node;
     }
     
 public:
-    PredictiveTextSystem() {
-        root = new TrieNode();
-        loadCommonWords(); // Initialize with common vocabulary
+    // 0 workers: one per hardware thread besides the event loop's
+    explicit PredictiveTextServer(ConcurrentPredictiveText& system, int workerCount = 0)
+        : text(system), pool(workerCount), boundPort(0), stopping(false), served(0) {
+        epollFd = epoll_create1(EPOLL_CLOEXEC);
+        wakeFd = eventfd(0, EFD_NONBLOCK | EFD_CLOEXEC);
+        epoll_event event;
+        event.events = EPOLLIN;
+        event.data.fd = wakeFd;
+        epoll_ctl(epollFd, EPOLL_CTL_ADD, wakeFd, &event);
     }
     
-    ~PredictiveTextSystem() {
-        deleteTrie(root);
+    ~PredictiveTextServer() {
+        for (const auto& entry : connections) close(entry.first);
+        for (int fd : listenFds) close(fd);
+        if (!unixPath.empty()) unlink(unixPath.c_str());
+        close(wakeFd);
+        close(epollFd);
     }
     
-    // Insert word with frequency tracking (Learning Component)
-    void insertWord(const std::string& word, int frequencyIncrease = 1) {
-        if (word.empty()) return;
-        
-        TrieNode* current = root;
-        
-        // Convert to lowercase for consistency
-        std::string lowerWord = toLower(word);
-        
-        for (char ch : lowerWord) {
-            if (current->children.find(ch) == current->children.end()) {
-                current->children[ch] = new TrieNode();
+    PredictiveTextServer(const PredictiveTextServer&) = delete;
+    PredictiveTextServer& operator=(const PredictiveTextServer&) = delete;
+    
+    // Listen on a TCP port (0 picks a free one; see port())
+    bool listenTcp(uint16_t port, const std::string& address = "127.0.0.1") {
+        sockaddr_in socketAddress;
+        std::memset(&socketAddress, 0, sizeof(socketAddress));
+        socketAddress.sin_family = AF_INET;
+        socketAddress.sin_port = htons(port);
+        std::string description = address + ":" + std::to_string(port);
+        if (inet_pton(AF_INET, address.c_str(), &socketAddress.sin_addr) != 1) {
+            std::cout << "Error: Could not listen on " << description << std::endl;
+            return false;
+        }
+        int fd = socket(AF_INET, SOCK_STREAM | SOCK_NONBLOCK | SOCK_CLOEXEC, 0);
+        if (fd < 0 || !startListening(fd, (const sockaddr*)&socketAddress, sizeof(socketAddress), description)) {
+            return false;
+        }
+        socklen_t length = sizeof(socketAddress);
+        getsockname(fd, (sockaddr*)&socketAddress, &length);
+        boundPort = ntohs(socketAddress.sin_port);
+        return true;
+    }
+    
+    // Listen on a Unix socket, replacing a stale socket file at path
+    bool listenUnix(const std::string& path) {
+        sockaddr_un socketAddress;
+        std::memset(&socketAddress, 0, sizeof(socketAddress));
+        socketAddress.sun_family = AF_UNIX;
+        if (path.size() >= sizeof(socketAddress.sun_path)) {
+            std::cout << "Error: Could not listen on " << path << std::endl;
+            return false;
+        }
+        std::memcpy(socketAddress.sun_path, path.c_str(), path.size());
+        unlink(path.c_str());
+        int fd = socket(AF_UNIX, SOCK_STREAM | SOCK_NONBLOCK | SOCK_CLOEXEC, 0);
+        if (fd < 0 || !startListening(fd, (const sockaddr*)&socketAddress, sizeof(socketAddress), path)) {
+            return false;
+        }
+        unixPath = path;
+        return true;
+    }
+    
+    uint16_t port() const {
+        return boundPort;
+    }
+    
+    uint64_t requestsServed() const {
+        return served.load(std::memory_order_relaxed);
+    }
+    
+    // Serve until stop() is called
+    void run() {
+        std::vector<epoll_event> events(SERVER_MAX_EVENTS);
+        std::vector<Request> batch;
+        std::vector<int> touched;
+        while (!stopping.load()) {
+            int ready = epoll_wait(epollFd, events.data(), (int)events.size(), -1);
+            if (ready < 0) {
+                if (errno == EINTR) continue;
+                std::cout << "Error: epoll_wait failed" << std::endl;
+                return;
+            }
+            
+            batch.clear();
+            touched.clear();
+            for (int i = 0; i < ready; i++) {
+                int fd = events[i].data.fd;
+                if (fd == wakeFd) continue;
+                if (isListener(fd)) {
+                    acceptConnections(fd);
+                    continue;
+                }
+                auto it = connections.find(fd);
+                if (it == connections.end()) continue;
+                bool open = !(events[i].events & EPOLLERR);
+                if (open && (events[i].events & (EPOLLIN | EPOLLHUP))) {
+                    open = readRequests(fd, it->second, batch);
+                }
+                if (open) {
+                    touched.push_back(fd);
+                } else {
+                    closeConnection(fd);
+                }
+            }
+            
+            // Answer everything that arrived, in parallel; responses keep request order
+            pool.parallelFor(batch.size(), [&](size_t i) { respond(batch[i]); });
+            served.fetch_add(batch.size(), std::memory_order_relaxed);
+            for (Request& request : batch) {
+                auto it = connections.find(request.fd);
+                if (it == connections.end() || it->second.closing) continue;
+                it->second.output += request.response;
+                it->second.output += '\n';
+                if (request.quit) it->second.closing = true;
+            }
+            for (int fd : touched) {
+                auto it = connections.find(fd);
+                if (it != connections.end() && !flush(fd, it->second)) closeConnection(fd);
             }
-            current = current->children[ch];
         }
-        
-        current->isEndOfWord = true;
-        current->frequency += frequencyIncrease;  // ML: Learn from usage
-        current->word = lowerWord;
     }
     
-    // Smart search with learning-based ranking
-    std::vector<std::string> getSuggestions(const std::string& prefix, int maxSuggestions = 5) {
-        suggestions.clear();
-        
-        if (prefix.empty()) return {};
-        
-        std::string lowerPrefix = toLower(prefix);
-        TrieNode* prefixNode = findPrefixNode(lowerPrefix);
-        
-        if (!prefixNode) return {};
-        
-        // Collect all words with this prefix
-        collectSuggestions(prefixNode, lowerPrefix);
+    // Make run() return; safe from any thread
+    void stop() {
+        stopping = true;
+        uint64_t one = 1;
+        ssize_t written = write(wakeFd, &one, sizeof(one));
+        (void)written;
+    }
+};
+
+// Throughput and latency seen by ServerLoadGenerator
+struct LoadReport {
+    uint64_t requests;
+    uint64_t errors;         // "ERR" responses
+    double seconds;
+    double p50Micros;
+    double p95Micros;
+    double p99Micros;
+};
+
+// Drives a PredictiveTextServer from client threads, each on its own
+// connection with up to pipelineDepth requests in flight. A request's
+// latency runs from sending it to reading its response line.
+class ServerLoadGenerator {
+private:
+    uint16_t port;
+    std::string host;
+    std::string unixPath;    // Set: connect here instead of host:port
+    
+    int connectToServer() const {
+        int fd;
+        if (!unixPath.empty()) {
+            sockaddr_un address;
+            std::memset(&address, 0, sizeof(address));
+            address.sun_family = AF_UNIX;
+            std::strncpy(address.sun_path, unixPath.c_str(), sizeof(address.sun_path) - 1);
+            fd = socket(AF_UNIX, SOCK_STREAM | SOCK_CLOEXEC, 0);
+            if (fd >= 0 && connect(fd, (const sockaddr*)&address, sizeof(address)) == 0) return fd;
+        } else {
+            sockaddr_in address;
+            std::memset(&address, 0, sizeof(address));
+            address.sin_family = AF_INET;
+            address.sin_port = htons(port);
+            inet_pton(AF_INET, host.c_str(), &address.sin_addr);
+            fd = socket(AF_INET, SOCK_STREAM | SOCK_CLOEXEC, 0);
+            if (fd >= 0 && connect(fd, (const sockaddr*)&address, sizeof(address)) == 0) {
+                int on = 1;
+                setsockopt(fd, IPPROTO_TCP, TCP_NODELAY, &on, sizeof(on));
+                return fd;
+            }
+        }
+        if (fd >= 0) close(fd);
+        return -1;
+    }
+    
+    // One client: `count` requests cycling through `requests` from `offset`;
+    // false if the connection could not be made or broke
+    bool runClient(const std::vector<std::string>& requests, size_t offset, int count, int pipelineDepth,
+                   std::vector<double>& micros, uint64_t& errors) const {
+        int fd = connectToServer();
+        if (fd < 0) return false;
         
-        // Sort by frequency (ML element) then alphabetically
-        std::sort(suggestions.begin(), suggestions.end(), 
-                 [](const std::pair<std::string, int>& a, const std::pair<std::string, int>& b) {
-                     if (a.second != b.second) {
-                         return a.second > b.second; // Higher frequency first
-                     }
-                     return a.first < b.first; // Alphabetical for same frequency
-                 });
+        std::vector<std::chrono::steady_clock::time_point> sentAt(count);
+        std::string output, input;
+        char buffer[1 << 16];
+        int sent = 0, received = 0;
+        bool ok = true;
+        while (received < count && ok) {
+            output.clear();
+            auto now = std::chrono::steady_clock::now();
+            for (; sent < count && sent - received < pipelineDepth; sent++) {
+                output += requests[(offset + sent) % requests.size()];
+                output += '\n';
+                sentAt[sent] = now;
+            }
+            for (size_t written = 0; written < output.size() && ok; ) {
+                ssize_t n = send(fd, output.data() + written, output.size() - written, MSG_NOSIGNAL);
+                ok = n > 0;
+                if (ok) written += (size_t)n;
+            }
+            
+            // Wait for at least one response, then take every complete line
+            int before = received;
+            while (ok && received == before) {
+                ssize_t got = recv(fd, buffer, sizeof(buffer), 0);
+                ok = got > 0;
+                if (!ok) break;
+                input.append(buffer, (size_t)got);
+                auto arrived = std::chrono::steady_clock::now();
+                size_t start = 0;
+                for (size_t end; (end = input.find('\n', start)) != std::string::npos; start = end + 1) {
+                    if (input.compare(start, 3, "ERR") == 0) errors++;
+                    micros.push_back(std::chrono::duration<double, std::micro>(arrived - sentAt[received]).count());
+                    received++;
+                }
+                input.erase(0, start);
+            }
+        }
+        close(fd);
+        return ok;
+    }
+    
+public:
+    explicit ServerLoadGenerator(uint16_t port, const std::string& host = "127.0.0.1") : port(port), host(host) {}
+    explicit ServerLoadGenerator(const std::string& unixPath) : port(0), unixPath(unixPath) {}
+    
+    // `clients` connections each send `requestsPerClient` requests, cycling
+    // through `requests` (request lines without the newline)
+    LoadReport run(const std::vector<std::string>& requests, int clients, int requestsPerClient, int pipelineDepth) const {
+        std::vector<std::vector<double>> micros(clients);
+        std::vector<uint64_t> errors(clients, 0);
+        std::vector<char> ok(clients, 0);
+        auto start = std::chrono::steady_clock::now();
+        std::vector<std::thread> threads;
+        for (int c = 0; c < clients; c++) {
+            threads.emplace_back([&, c]() {
+                micros[c].reserve(requestsPerClient);
+                ok[c] = runClient(requests, (size_t)c * 7919, requestsPerClient, std::max(1, pipelineDepth),
+                                  micros[c], errors[c]);
+            });
+        }
+        for (auto& thread : threads) {
+            thread.join();
+        }
         
-        // Extract top suggestions
-        std::vector<std::string> result;
-        for (int i = 0; i < std::min(maxSuggestions, (int)suggestions.size()); i++) {
-            result.push_back(suggestions[i].first);
+        LoadReport report = {0, 0, std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count(), 0, 0, 0};
+        std::vector<double> all;
+        for (int c = 0; c < clients; c++) {
+            if (!ok[c]) std::cout << "Error: Could not complete load client " << c << std::endl;
+            all.insert(all.end(), micros[c].begin(), micros[c].end());
+            report.errors += errors[c];
+        }
+        report.requests = all.size();
+        if (!all.empty()) {
+            std::sort(all.begin(), all.end());
+            auto at = [&all](double p) { return all[std::min(all.size() - 1, (size_t)(p / 100 * all.size()))]; };
+            report.p50Micros = at(50);
+            report.p95Micros = at(95);
+            report.p99Micros = at(99);
+        }
+        return report;
+    }
+};
+#endif
+
+// Seeded benchmark of every public operation at several dictionary sizes.
+// Each operation is timed call by call and summarized as p50/p95/p99
+// latency; throughput-style operations (training, model files) report a
+// rate. Every row is also written as one JSON object per line so runs can
+// be compared for regressions.
+class BenchmarkSuite {
+private:
+    std::mt19937 random;
+    uint32_t seed;
+    std::ofstream results;
+    size_t dictionarySize;
+    
+    static long peakRssKb() {
+#ifdef HAVE_MMAP
+        struct rusage usage;
+        if (getrusage(RUSAGE_SELF, &usage) != 0) return 0;
+#ifdef __APPLE__
+        return usage.ru_maxrss / 1024;  // Bytes on macOS
+#else
+        return usage.ru_maxrss;
+#endif
+#else
+        return 0;
+#endif
+    }
+    
+    // Time each call of `run(i)` for i in [0, count)
+    template <typename Operation>
+    static std::vector<double> timeEach(size_t count, Operation run) {
+        std::vector<double> micros(count);
+        for (size_t i = 0; i < count; i++) {
+            auto start = std::chrono::steady_clock::now();
+            run(i);
+            micros[i] = std::chrono::duration<double, std::micro>(std::chrono::steady_clock::now() - start).count();
         }
+        return micros;
+    }
+    
+    static double percentile(const std::vector<double>& sorted, double p) {
+        if (sorted.empty()) return 0;
+        size_t rank = (size_t)std::ceil(p / 100 * sorted.size());
+        return sorted[std::min(sorted.size() - 1, rank > 0 ? rank - 1 : 0)];
+    }
+    
+    void reportLatency(const std::string& operation, std::vector<double> micros) {
+        std::sort(micros.begin(), micros.end());
+        double total = 0;
+        for (double value : micros) total += value;
+        double mean = micros.empty() ? 0 : total / micros.size();
+        double p50 = percentile(micros, 50), p95 = percentile(micros, 95), p99 = percentile(micros, 99);
         
-        return result;
+        std::cout << "  " << operation << std::string(operation.size() < 16 ? 16 - operation.size() : 1, ' ')
+                  << "n=" << micros.size() << "  p50 " << p50 << "  p95 " << p95 << "  p99 " << p99
+                  << "  mean " << mean << " us" << std::endl;
+        results << "{\"seed\":" << seed << ",\"words\":" << dictionarySize << ",\"operation\":\"" << operation
+                << "\",\"samples\":" << micros.size() << ",\"p50_us\":" << p50 << ",\"p95_us\":" << p95
+                << ",\"p99_us\":" << p99 << ",\"mean_us\":" << mean << ",\"peak_rss_kb\":" << peakRssKb() << "}" << std::endl;
     }
     
-    // Learn from user selection (Reinforcement Learning)
-    void userSelectedWord(const std::string& word) {
-        insertWord(word, 5); // Boost frequency significantly for user choices
-        std::cout << "Learning: Increased priority for '" << word << "'" << std::endl;
+    void reportRate(const std::string& operation, double amount, double seconds, const std::string& unit) {
+        double rate = amount / std::max(seconds, 1e-9);
+        std::cout << "  " << operation << std::string(operation.size() < 16 ? 16 - operation.size() : 1, ' ')
+                  << (uint64_t)rate << " " << unit << "/s (" << seconds * 1000 << " ms)" << std::endl;
+        results << "{\"seed\":" << seed << ",\"words\":" << dictionarySize << ",\"operation\":\"" << operation
+                << "\",\"" << unit << "_per_second\":" << rate << ",\"seconds\":" << seconds
+                << ",\"peak_rss_kb\":" << peakRssKb() << "}" << std::endl;
     }
     
-    // Predict next word based on context (Advanced ML feature)
-    std::vector<std::string> predictNextWord(const std::string& context) {
-        std::vector<std::string> contextWords = splitIntoWords(context);
-        if (contextWords.empty()) return {};
+    // Run every operation against a dictionary of `size` words
+    void runSize(size_t size) {
+        dictionarySize = size;
+        std::cout << "\n--- " << size << " words ---" << std::endl;
         
-        // Simple bigram prediction: find words that commonly follow the last word
-        std::string lastWord = toLower(contextWords.back());
-        std::vector<std::string> predictions;
+        std::vector<std::string> words;
+        std::vector<int> frequencies;
+        dictionary(size, words, frequencies);
         
-        // Enhanced prediction based on common word patterns
-        if (lastWord == "i" || lastWord == "you" || lastWord == "we" || lastWord == "they") {
-            std::vector<std::string> verbSuggestions = {"am", "are", "will", "can", "have", "want", "need"};
-            for (const auto& verb : verbSuggestions) {
-                if (search(verb)) {
-                    predictions.push_back(verb);
-                }
-            }
-        } else if (lastWord == "the" || lastWord == "a" || lastWord == "an") {
-            // Suggest common nouns
-            std::vector<char> commonStarters = {'c', 'b', 'f', 'm', 'p', 's', 'w', 'h'};
-            for (char starter : commonStarters) {
-                auto wordSuggestions = getSuggestions(std::string(1, starter), 2);
-                predictions.insert(predictions.end(), wordSuggestions.begin(), wordSuggestions.end());
-            }
-        } else {
-            // General high-frequency words
-            std::vector<char> commonStarters = {'t', 'a', 'i', 'o', 'h', 'w'};
-            for (char starter : commonStarters) {
-                auto wordSuggestions = getSuggestions(std::string(1, starter), 2);
-                predictions.insert(predictions.end(), wordSuggestions.begin(), wordSuggestions.end());
-            }
+        PredictiveTextSystem system;
+        reportLatency("insert", timeEach(size, [&](size_t i) { system.insertWord(words[i], frequencies[i]); }));
+        
+        std::vector<std::string> probes(10000);
+        for (size_t i = 0; i < probes.size(); i++) {
+            probes[i] = (i % 2) ? words[random() % size] : randomWord(3, 12);  // Half hits, half mostly misses
         }
+        reportLatency("search", timeEach(probes.size(), [&](size_t i) { system.search(probes[i]); }));
         
-        // Remove duplicates and limit results
-        std::sort(predictions.begin(), predictions.end());
-        predictions.erase(std::unique(predictions.begin(), predictions.end()), predictions.end());
+        for (size_t length : {1, 2, 3, 5}) {
+            std::vector<std::string> prefixes;
+            for (size_t i = 0; i < 2000; i++) {
+                const std::string& word = words[random() % size];
+                if (word.size() >= length) prefixes.push_back(word.substr(0, length));
+            }
+            reportLatency("prefix_" + std::to_string(length),
+                          timeEach(prefixes.size(), [&](size_t i) { system.getSuggestions(prefixes[i], 8); }));
+        }
         
-        if (predictions.size() > 6) {
-            predictions.resize(6);
+        for (int distance = 1; distance <= 2; distance++) {
+            std::vector<std::string> typos(distance == 1 ? 500 : 200);
+            for (auto& typo : typos) typo = misspell(words[random() % size], distance);
+            reportLatency("autocorrect_d" + std::to_string(distance),
+                          timeEach(typos.size(), [&](size_t i) { system.getCorrections(typos[i], distance); }));
         }
         
-        return predictions;
-    }
-    
-    // Auto-correct with learning (ML-based correction)
-    std::string autoCorrect(const std::string& word) {
-        if (search(word)) return word; // Word is correct
+        // Six-character prefixes, exact and with one typo, which allow two edits
+        for (int distance = 0; distance <= 1; distance++) {
+            std::vector<std::string> prefixes;
+            for (size_t i = 0; i < 2000; i++) {
+                const std::string& word = words[random() % size];
+                if (word.size() >= 6) prefixes.push_back(distance ? misspell(word.substr(0, 6), 1) : word.substr(0, 6));
+            }
+            reportLatency("fuzzy_prefix_d" + std::to_string(distance),
+                          timeEach(prefixes.size(), [&](size_t i) { system.getFuzzySuggestions(prefixes[i], 8); }));
+        }
         
-        // Find closest words using edit distance
-        std::vector<std::pair<std::string, int>> candidates;
-        findCandidates(root, "", toLower(word), candidates, 0, 2); // Max edit distance of 2
+        // Sentences over the more common words, for training and prediction
+        size_t corpusWords = std::min<size_t>(std::max<size_t>(size, 10000), 200000);
+        std::string corpus;
+        size_t vocabulary = std::min<size_t>(size, 5000);
+        for (size_t i = 0; i < corpusWords; i++) {
+            corpus += words[random() % vocabulary];
+            corpus += (i % 12 == 11) ? ". " : " ";
+        }
+        auto start = std::chrono::steady_clock::now();
+        system.trainFromText(corpus);
+        reportRate("train", (double)corpusWords,
+                   std::chrono::duration<double>(std::chrono::steady_clock::now() - start).count(), "words");
         
-        if (candidates.empty()) return word;
+        std::vector<std::string> contexts(2000);
+        for (size_t i = 0; i < contexts.size(); i++) {
+            contexts[i] = words[random() % vocabulary];
+            if (i % 2) contexts[i] += " " + words[random() % vocabulary];
+        }
+        reportLatency("predict", timeEach(contexts.size(), [&](size_t i) { system.predictNextWord(contexts[i]); }));
         
-        // Sort by frequency and edit distance
-        std::sort(candidates.begin(), candidates.end(), 
-                 [](const std::pair<std::string, int>& a, const std::pair<std::string, int>& b) {
-                     return a.second > b.second;
-                 });
+        auto timeFile = [&](const std::string& operation, const std::function<void()>& run) {
+            auto fileStart = std::chrono::steady_clock::now();
+            run();
+            reportRate(operation, (double)size, std::chrono::duration<double>(std::chrono::steady_clock::now() - fileStart).count(), "words");
+        };
+        timeFile("save_text", [&]() { system.saveModel("benchmark_suite.txt"); });
+        timeFile("load_text", [&]() { PredictiveTextSystem loaded; loaded.loadModel("benchmark_suite.txt"); });
+        timeFile("save_binary", [&]() { system.saveBinaryModel("benchmark_suite.bin"); });
+        timeFile("load_binary", [&]() { PredictiveTextSystem loaded; loaded.loadBinaryModel("benchmark_suite.bin"); });
+        std::remove("benchmark_suite.txt");
+        std::remove("benchmark_suite.bin");
         
-        return candidates[0].first;
+        std::cout << "  peak RSS        " << peakRssKb() / 1024 << " MB" << std::endl;
     }
     
-    // Save learned patterns to file
-    void saveModel(const std::string& filename) {
-        std::ofstream file(filename);
-        if (file.is_open()) {
-            saveTrieToFile(root, "", file);
-            file.close();
-            std::cout << "Model saved to " << filename << std::endl;
-        } else {
-            std::cout << "Error: Could not save model to " << filename << std::endl;
+public:
+    explicit BenchmarkSuite(uint32_t randomSeed = BENCHMARK_SEED) : seed(randomSeed), dictionarySize(0) {}
+    
+    // The dictionary every benchmark draws from: `size` words of 3-12
+    // letters with Zipf-like frequencies. The generator is reseeded from the
+    // seed and size first, so the draws that follow are reproducible too.
+    void dictionary(size_t size, std::vector<std::string>& words, std::vector<int>& frequencies) {
+        random.seed(seed + (uint32_t)size);
+        words.resize(size);
+        frequencies.resize(size);
+        for (size_t i = 0; i < size; i++) {
+            words[i] = randomWord(3, 12);
+            frequencies[i] = (int)(100000 / (i + 1)) + 1;  // Zipf-like: a few very common words
         }
     }
     
-    // Load learned patterns from file
-    void loadModel(const std::string& filename) {
-        std::ifstream file(filename);
-        if (file.is_open()) {
-            std::string line;
-            while (std::getline(file, line)) {
-                std::istringstream iss(line);
-                std::string word;
-                int frequency;
-                if (iss >> word >> frequency) {
-                    insertWord(word, frequency);
-                }
-            }
-            file.close();
-            std::cout << "Model loaded from " << filename << std::endl;
-        } else {
-            std::cout << "Could not load model from " << filename << std::endl;
+    // Insert a dictionary of `size` words into system; returns the words
+    std::vector<std::string> fillDictionary(PredictiveTextSystem& system, size_t size) {
+        std::vector<std::string> words;
+        std::vector<int> frequencies;
+        dictionary(size, words, frequencies);
+        for (size_t i = 0; i < size; i++) {
+            system.insertWord(words[i], frequencies[i]);
         }
+        return words;
     }
     
-    // Display system statistics
-    void displayStats() {
-        int totalWords = 0;
-        int totalFrequency = 0;
-        calculateStats(root, totalWords, totalFrequency);
-        
-        std::cout << "\n=== Predictive Text System Stats ===" << std::endl;
-        std::cout << "Total unique words: " << totalWords << std::endl;
-        std::cout << "Total usage frequency: " << totalFrequency << std::endl;
-        std::cout << "Average usage per word: " << (totalWords > 0 ? (double)totalFrequency/totalWords : 0) << std::endl;
-        std::cout << "====================================" << std::endl;
+    // Uniform draw from [0, bound)
+    size_t draw(size_t bound) {
+        return random() % bound;
     }
     
-    // Add multiple words from text (for training)
-    void trainFromText(const std::string& text) {
-        std::vector<std::string> words = splitIntoWords(text);
-        std::cout << "Training from " << words.size() << " words..." << std::endl;
-        
-        for (const auto& word : words) {
-            insertWord(word, 1);
+    std::string randomWord(size_t minLength, size_t maxLength) {
+        // Letter weights roughly follow English so prefixes share realistically
+        static const char letters[] = "eeeeeeeeeeeettttttttaaaaaaaaoooooooiiiiiiinnnnnnnssssssrrrrrrhhhhhlllldddcccuuummmfffpppggwwyybbvkxjqz";
+        size_t length = minLength + random() % (maxLength - minLength + 1);
+        std::string word;
+        for (size_t i = 0; i < length; i++) {
+            word += letters[random() % (sizeof(letters) - 1)];
         }
-        
-        std::cout << "Training completed!" << std::endl;
+        return word;
+    }
+    
+    // Replace, insert, delete or swap letters of a word
+    std::string misspell(std::string word, int edits) {
+        for (int e = 0; e < edits; e++) {
+            size_t at = random() % word.size();
+            switch (random() % 4) {
+                case 0: word[at] = (char)('a' + random() % 26); break;
+                case 1: word.insert(word.begin() + at, (char)('a' + random() % 26)); break;
+                case 2: if (word.size() > 2) word.erase(at, 1); break;
+                default: if (at + 1 < word.size()) std::swap(word[at], word[at + 1]); break;
+            }
+        }
+        return word;
+    }
+    
+    // Benchmark each dictionary size in turn, appending rows to resultsFile
+    void run(const std::vector<size_t>& sizes, const std::string& resultsFile = BENCHMARK_RESULTS_FILE) {
+        results.open(resultsFile);
+        std::cout << "\n=== Benchmark Suite (seed " << seed << ") ===" << std::endl;
+        std::cout << "Latencies in microseconds; results also written to " << resultsFile << std::endl;
+        for (size_t size : sizes) {
+            runSize(size);
+        }
+        results.close();
     }
 };
 
@@ -374,13 +5413,20 @@ public:
         std::cout << "=== Predictive Text System with Machine Learning ===" << std::endl;
         std::cout << "This system learns from your usage patterns!" << std::endl;
         std::cout << "\nCommands:" << std::endl;
-        std::cout << "  - Type any prefix to get autocomplete suggestions" << std::endl;
+        std::cout << "  - Type any prefix to get autocomplete suggestions (typos are tolerated)" << std::endl;
         std::cout << "  - 'select <word>' - Learn from your word choice" << std::endl;
         std::cout << "  - 'correct <word>' - Get auto-correction suggestions" << std::endl;
         std::cout << "  - 'predict <context>' - Predict next word based on context" << std::endl;
         std::cout << "  - 'train <text>' - Train system with custom text" << std::endl;
+        std::cout << "  - 'trainfile <path>' - Train from a corpus file of any size" << std::endl;
+        std::cout << "  - 'trainparallel <path>' - Train from a corpus file on all cores" << std::endl;
         std::cout << "  - 'stats' - View system statistics" << std::endl;
+        std::cout << "  - 'metrics' / 'metrics json' - Latencies, node visits and slowest queries per operation" << std::endl;
         std::cout << "  - 'save' / 'load' - Persist learning to file" << std::endl;
+        std::cout << "  - 'savebin' / 'loadbin' - Persist learning as a binary snapshot" << std::endl;
+        std::cout << "  - 'journal' - Persist every learning event to learned_model.txt as it happens" << std::endl;
+        std::cout << "  - 'forget <word>' - Remove a word from the vocabulary" << std::endl;
+        std::cout << "  - 'prune <n>' - Remove every word used fewer than n times" << std::endl;
         std::cout << "  - 'demo' - Run automated demonstration" << std::endl;
         std::cout << "  - 'quit' - Exit the program" << std::endl;
         std::cout << "======================================================" << std::endl;
@@ -397,12 +5443,32 @@ public:
                 break;
             } else if (input == "stats") {
                 textSystem.displayStats();
+            } else if (input == "metrics" || input == "metrics json") {
+                textSystem.dumpMetrics(std::cout, input == "metrics json");
             } else if (input == "save") {
                 textSystem.saveModel("learned_model.txt");
             } else if (input == "load") {
                 textSystem.loadModel("learned_model.txt");
+            } else if (input == "savebin") {
+                textSystem.saveBinaryModel("learned_model.bin");
+            } else if (input == "loadbin") {
+                textSystem.loadBinaryModel("learned_model.bin");
+            } else if (input == "journal") {
+                if (textSystem.openJournal("learned_model.txt")) {
+                    std::cout << "Journaling learning to learned_model.txt" << std::endl;
+                }
             } else if (input == "demo") {
                 runAutomatedDemo();
+            } else if (input.substr(0, 7) == "forget ") {
+                std::string word = input.substr(7);
+                if (textSystem.removeWord(word)) {
+                    std::cout << "Forgot '" << word << "'" << std::endl;
+                } else {
+                    std::cout << "'" << word << "' is not in the vocabulary" << std::endl;
+                }
+            } else if (input.substr(0, 6) == "prune ") {
+                size_t removed = textSystem.pruneWords(std::atoi(input.c_str() + 6));
+                std::cout << "Removed " << removed << " words" << std::endl;
             } else if (input.substr(0, 7) == "select ") {
                 std::string word = input.substr(7);
                 textSystem.userSelectedWord(word);
@@ -427,12 +5493,16 @@ public:
                     }
                 }
                 std::cout << std::endl;
+            } else if (input.substr(0, 14) == "trainparallel ") {
+                textSystem.trainFromFileParallel(input.substr(14));
+            } else if (input.substr(0, 10) == "trainfile ") {
+                textSystem.trainFromFile(input.substr(10));
             } else if (input.substr(0, 6) == "train ") {
                 std::string text = input.substr(6);
                 textSystem.trainFromText(text);
             } else {
-                // Get autocomplete suggestions
-                auto suggestions = textSystem.getSuggestions(input, 8);
+                // Completions that tolerate typos in the prefix, in one query
+                auto suggestions = textSystem.getFuzzySuggestions(input, 8);
                 
                 if (suggestions.empty()) {
                     std::cout << "No suggestions found for '" << input << "'" << std::endl;
@@ -499,9 +5569,17 @@ public:
             std::string corrected = textSystem.autoCorrect(typo);
             std::cout << "   '" << typo << "' -> '" << corrected << "'" << std::endl;
         }
+        auto fuzzy = textSystem.getFuzzySuggestions("progrma", 3);
+        std::cout << "   'progrma' completes to: ";
+        for (size_t i = 0; i < fuzzy.size(); i++) {
+            std::cout << fuzzy[i] << (i + 1 < fuzzy.size() ? ", " : "");
+        }
+        std::cout << std::endl;
         
         // Demo 4: Context prediction
         std::cout << "\n4. Context Prediction:" << std::endl;
+        textSystem.trainFromText("I am going home. I am learning to code. We will see you soon. "
+                                 "We will win. She can swim. She can code. The quick brown fox jumps.");
         std::vector<std::string> contexts = {"I am", "The quick", "We will", "She can"};
         for (const auto& context : contexts) {
             auto predictions = textSystem.predictNextWord(context);
@@ -513,51 +5591,700 @@ public:
             std::cout << std::endl;
         }
         
+        // Demo 5: Keystroke session
+        std::cout << "\n5. Keystroke Session:" << std::endl;
+        CompletionSession session(textSystem, 1);
+        for (char ch : std::string("wrd")) {
+            session.type(ch);
+            auto completions = session.more(3);
+            auto corrections = session.corrections(3);
+            std::cout << "   '" << session.text() << "' -> ";
+            for (size_t i = 0; i < completions.size(); i++) {
+                std::cout << completions[i] << (i + 1 < completions.size() ? ", " : "");
+            }
+            std::cout << " | corrections: ";
+            for (size_t i = 0; i < corrections.size(); i++) {
+                std::cout << corrections[i] << (i + 1 < corrections.size() ? ", " : "");
+            }
+            std::cout << std::endl;
+        }
+        
         std::cout << "\nDemo completed!" << std::endl;
     }
     
     void runBenchmark() {
         std::cout << "\n=== Performance Benchmark ===" << std::endl;
         
-        // Add sample data
-        std::vector<std::string> sampleWords = {
-            "algorithm", "application", "computer", "programming", "development",
-            "artificial", "intelligence", "machine", "learning", "technology",
-            "software", "hardware", "network", "database", "security",
-            "framework", "interface", "structure", "function", "variable",
-            "optimization", "implementation", "documentation", "debugging", "testing"
+        BenchmarkSuite suite;
+        suite.run({1000, 10000, 100000, 1000000});
+        
+        // The comparisons below draw their words from the suite's dictionary
+        benchmarkSuggestionStrategies(suite);
+        benchmarkTrieLayout(suite);
+        benchmarkModelFiles(suite);
+        benchmarkTraining(suite);
+        benchmarkConcurrentQueries(suite);
+        benchmarkAutoCorrect(suite);
+        benchmarkSessions(suite);
+        benchmarkBatchQueries(suite);
+        benchmarkJournal(suite);
+        benchmarkDecay(suite);
+        benchmarkMemoryBudget(suite);
+        benchmarkServer(suite);
+        benchmarkPersonalization(suite);
+    }
+    
+    // Serve the demo's system on SERVER_PORT until 'quit' is typed
+    void runServer() {
+#ifdef HAVE_EPOLL
+        ConcurrentPredictiveText shared(textSystem);
+        PredictiveTextServer server(shared);
+        if (!server.listenTcp(SERVER_PORT)) return;
+        std::thread loop(&PredictiveTextServer::run, &server);
+        std::cout << "Serving on 127.0.0.1:" << server.port() << " - try: printf 'suggest th\\n' | nc 127.0.0.1 "
+                  << server.port() << std::endl;
+        std::cout << "Type 'quit' to stop." << std::endl;
+        std::string input;
+        while (std::getline(std::cin, input) && input != "quit") {}
+        server.stop();
+        loop.join();
+        shared.flush();
+        std::cout << "Served " << server.requestsServed() << " requests" << std::endl;
+#else
+        std::cout << "Server mode needs Linux (epoll)" << std::endl;
+#endif
+    }
+    
+    // Load a server already running on SERVER_PORT
+    void runLoadTest() {
+#ifdef HAVE_EPOLL
+        ServerLoadGenerator generator((uint16_t)SERVER_PORT);
+        printLoadReport("8 clients, pipeline 16", generator.run(serverWorkload(), 8, 20000, 16));
+#else
+        std::cout << "The load generator needs Linux (epoll)" << std::endl;
+#endif
+    }
+    
+#ifdef HAVE_EPOLL
+    // Mostly completions, some corrections, predictions and learning
+    static std::vector<std::string> serverWorkload() {
+        std::vector<std::string> requests;
+        const char* words[] = {"the", "that", "there", "their", "would", "which", "about", "other", "little", "know"};
+        for (const char* word : words) {
+            std::string text = word;
+            requests.push_back("suggest " + text.substr(0, 1));
+            requests.push_back("suggest " + text.substr(0, 2));
+            requests.push_back("suggest " + text.substr(0, 3) + " 10");
+            requests.push_back("correct " + text.substr(1));
+            requests.push_back("predict " + text);
+        }
+        requests.push_back("select there");
+        return requests;
+    }
+    
+    static void printLoadReport(const std::string& label, const LoadReport& report) {
+        std::cout << "- " << label << ": " << (uint64_t)(report.requests / std::max(report.seconds, 1e-9))
+                  << " requests/s, p50 " << report.p50Micros << " / p95 " << report.p95Micros << " / p99 "
+                  << report.p99Micros << " microseconds";
+        if (report.errors) std::cout << ", " << report.errors << " errors";
+        std::cout << std::endl;
+    }
+#endif
+    
+    // Throughput and tail latency of server mode on loopback TCP and a Unix
+    // socket, one request at a time and pipelined
+    void benchmarkServer(BenchmarkSuite& suite) {
+#ifdef HAVE_EPOLL
+        std::cout << "\n=== Server Mode ===" << std::endl;
+        
+        PredictiveTextSystem base;
+        suite.fillDictionary(base, 10000);
+        base.setDeleteIndex(true);  // Keeps corrections from dominating what is measured
+        ConcurrentPredictiveText shared(base);
+        PredictiveTextServer server(shared);
+        std::string socketPath = "benchmark_server.sock";
+        if (!server.listenTcp(0) || !server.listenUnix(socketPath)) return;
+        std::thread loop(&PredictiveTextServer::run, &server);
+        
+        std::vector<std::string> requests = serverWorkload();
+        ServerLoadGenerator tcp(server.port());
+        ServerLoadGenerator local(socketPath);
+        printLoadReport("TCP, 8 clients, 1 in flight", tcp.run(requests, 8, 2000, 1));
+        printLoadReport("TCP, 8 clients, pipeline 16", tcp.run(requests, 8, 20000, 16));
+        printLoadReport("TCP, 64 clients, pipeline 16", tcp.run(requests, 64, 2000, 16));
+        printLoadReport("Unix, 8 clients, pipeline 16", local.run(requests, 8, 20000, 16));
+        
+        server.stop();
+        loop.join();
+        shared.flush();
+#endif
+    }
+    
+    // Many users over one shared base: memory per user, query cost against
+    // the base alone, and writing idle users out and reading them back
+    void benchmarkPersonalization(BenchmarkSuite& suite) {
+        std::cout << "\n=== Personalization Overlays ===" << std::endl;
+        
+        std::shared_ptr<PredictiveTextSystem> base(new PredictiveTextSystem());
+        std::vector<std::string> words = suite.fillDictionary(*base, 100000);
+        const int users = 2000;
+        std::string directory = "benchmark_overlays";
+        PersonalizedText personalized(base, directory, users);
+        
+        auto start = std::chrono::high_resolution_clock::now();
+        for (int user = 0; user < users; user++) {
+            for (int i = 0; i < 30; i++) {
+                // Boosts of base words, and some words of the user's own
+                std::string word = (i % 3) ? words[suite.draw(words.size())] : words[suite.draw(words.size())] + "x";
+                personalized.learn("user" + std::to_string(user), word, (int)suite.draw(500) + 1);
+            }
+        }
+        double learnMicros = std::chrono::duration<double, std::micro>(std::chrono::high_resolution_clock::now() - start).count();
+        size_t overlayBytes = personalized.memoryUsage();
+        std::cout << "- " << users << " users: " << overlayBytes / 1024 << " KB of overlays (" << overlayBytes / users
+                  << " bytes per user) vs " << base->memoryReport().totalBytes / 1024 << " KB per full copy; "
+                  << learnMicros / (users * 30) << " microseconds per learn" << std::endl;
+        
+        const int queries = 100000;
+        std::vector<std::string> prefixes(queries);
+        for (auto& prefix : prefixes) {
+            const std::string& word = words[suite.draw(words.size())];
+            prefix = word.substr(0, suite.draw(3) + 1);
+        }
+        start = std::chrono::high_resolution_clock::now();
+        for (int i = 0; i < queries; i++) base->getSuggestions(prefixes[i], 5);
+        double baseMicros = std::chrono::duration<double, std::micro>(std::chrono::high_resolution_clock::now() - start).count();
+        start = std::chrono::high_resolution_clock::now();
+        for (int i = 0; i < queries; i++) personalized.getSuggestions("user" + std::to_string(i % users), prefixes[i], 5);
+        double userMicros = std::chrono::duration<double, std::micro>(std::chrono::high_resolution_clock::now() - start).count();
+        std::cout << "- Suggestions: " << baseMicros / queries << " microseconds from the base, " << userMicros / queries
+                  << " with a user's overlay merged" << std::endl;
+        
+        start = std::chrono::high_resolution_clock::now();
+        size_t evicted = personalized.evictIdle(0);
+        double evictMillis = std::chrono::duration<double, std::milli>(std::chrono::high_resolution_clock::now() - start).count();
+        start = std::chrono::high_resolution_clock::now();
+        for (int user = 0; user < users; user++) personalized.getSuggestions("user" + std::to_string(user), "a", 5);
+        double reloadMillis = std::chrono::duration<double, std::milli>(std::chrono::high_resolution_clock::now() - start).count();
+        std::cout << "- Evicted " << evicted << " idle users to disk in " << evictMillis << " ms; first queries reloading them took "
+                  << reloadMillis << " ms" << std::endl;
+        
+        for (int user = 0; user < users; user++) personalized.forgetUser("user" + std::to_string(user));
+#ifdef HAVE_MMAP
+        rmdir(directory.c_str());
+#endif
+    }
+    
+    // Endless stream of new words under a memory budget: eviction should
+    // hold the trie flat
+    void benchmarkMemoryBudget(BenchmarkSuite& suite) {
+        std::cout << "\n=== Memory Budget ===" << std::endl;
+        
+        PredictiveTextSystem streamSystem;
+        streamSystem.setMemoryBudget(8 << 20);
+        std::vector<std::string> batch(100000);
+        std::vector<int> weights(batch.size());
+        for (int round = 1; round <= 10; round++) {
+            for (size_t i = 0; i < batch.size(); i++) {
+                batch[i] = suite.randomWord(6, 6);
+                weights[i] = (int)suite.draw(5) + 1;
+            }
+            auto start = std::chrono::high_resolution_clock::now();
+            for (size_t i = 0; i < batch.size(); i++) streamSystem.insertWord(batch[i], weights[i]);
+            double elapsed = std::chrono::duration<double, std::micro>(std::chrono::high_resolution_clock::now() - start).count();
+            if (round % 2 == 0) {
+                MemoryReport memory = streamSystem.memoryReport();
+                std::cout << "- After " << round * batch.size() << " words: " << memory.totalBytes / 1024 << " KB trie ("
+                          << memory.inUseBytes / 1024 << " KB in use), " << memory.words << " words, "
+                          << elapsed / batch.size() << " microseconds per insert" << std::endl;
+            }
+        }
+    }
+    
+    // Endless stream of new words with decay on: the pool should stop
+    // growing once old words start expiring
+    void benchmarkDecay(BenchmarkSuite& suite) {
+        std::cout << "\n=== Frequency Decay ===" << std::endl;
+        
+        PredictiveTextSystem streamSystem;
+        streamSystem.setFrequencyDecay(0.02);  // Short half-life so the stream spans many of them
+        std::vector<std::string> batch(100000);
+        for (int round = 1; round <= 10; round++) {
+            for (auto& word : batch) word = suite.randomWord(6, 6);
+            auto start = std::chrono::high_resolution_clock::now();
+            for (const auto& word : batch) streamSystem.insertWord(word);
+            double elapsed = std::chrono::duration<double, std::micro>(std::chrono::high_resolution_clock::now() - start).count();
+            if (round % 2 == 0) {
+                std::cout << "- After " << round * batch.size() << " words: " << streamSystem.memoryUsage() / 1024
+                          << " KB trie, " << elapsed / batch.size() << " microseconds per insert" << std::endl;
+            }
+        }
+    }
+    
+    // Cost of persisting one learning event: a journal append against
+    // rewriting the whole text model
+    void benchmarkJournal(BenchmarkSuite& suite) {
+        std::cout << "\n=== Learning Journal ===" << std::endl;
+        
+        PredictiveTextSystem largeSystem;
+        std::vector<std::string> words = suite.fillDictionary(largeSystem, 100000);
+        std::vector<std::string> events;
+        for (int i = 0; i < 100000; i++) {
+            events.push_back(words[suite.draw(words.size())]);
+        }
+        auto timeIt = [](const std::function<void()>& run) {
+            auto start = std::chrono::high_resolution_clock::now();
+            run();
+            return std::chrono::duration<double, std::micro>(std::chrono::high_resolution_clock::now() - start).count();
+        };
+        
+        double save = timeIt([&]() { largeSystem.saveModel("benchmark_journal.txt"); });
+        double plain = timeIt([&]() {
+            for (const auto& word : events) largeSystem.insertWord(word, 1);
+        });
+        largeSystem.openJournal("benchmark_journal.txt");
+        double journaled = timeIt([&]() {
+            for (const auto& word : events) largeSystem.insertWord(word, 1);
+        });
+        double sync = timeIt([&]() { largeSystem.syncJournal(); });
+        double single = timeIt([&]() {
+            for (int i = 0; i < 20; i++) {
+                largeSystem.insertWord(events[i], 1);
+                largeSystem.syncJournal();
+            }
+        });
+        largeSystem.compactJournal();
+        largeSystem.closeJournal();
+        
+        std::cout << "- saveModel, " << words.size() << " words: " << save / 1000 << " ms per save" << std::endl;
+        std::cout << "- insertWord: " << plain / events.size() << " microseconds without journal, "
+                  << journaled / events.size() << " with journal" << std::endl;
+        std::cout << "- Sync after " << events.size() << " events: " << sync / 1000 << " ms; one event, durable: "
+                  << single / 20 / 1000 << " ms (group commit window " << JOURNAL_COMMIT_INTERVAL_MS << " ms)" << std::endl;
+        
+        LearningJournal::removeSegments("benchmark_journal.txt", LearningJournal::lastSegment("benchmark_journal.txt"));
+        std::remove("benchmark_journal.txt");
+    }
+    
+    // Batched suggestions and corrections against a loop of single calls
+    void benchmarkBatchQueries(BenchmarkSuite& suite) {
+        std::cout << "\n=== Batch Queries ===" << std::endl;
+        
+        PredictiveTextSystem largeSystem;
+        largeSystem.setSuggestionStrategy(SuggestionStrategy::BestFirstSearch);
+        std::vector<std::string> words = suite.fillDictionary(largeSystem, 100000);
+        
+        std::vector<std::string> prefixes, typos;
+        for (int i = 0; i < 1000; i++) {
+            const std::string& word = words[suite.draw(300)];  // Overlapping prefixes, as in real traffic
+            prefixes.push_back(word.substr(0, suite.draw(3) + 1));
+        }
+        for (int i = 0; i < 200; i++) {
+            typos.push_back(suite.misspell(words[suite.draw(2000)], 1));
+        }
+        
+        WorkerPool pool;
+        BatchResults out;
+        std::vector<std::vector<std::string>> single;
+        auto timeIt = [](const std::function<void()>& run) {
+            auto start = std::chrono::high_resolution_clock::now();
+            run();
+            return std::chrono::duration<double, std::micro>(std::chrono::high_resolution_clock::now() - start).count();
+        };
+        auto matches = [&](const std::vector<std::vector<std::string>>& expected) {
+            for (size_t i = 0; i < expected.size(); i++) {
+                if (out.results(i) != expected[i]) return false;
+            }
+            return true;
         };
         
+        double loop = timeIt([&]() {
+            for (const auto& prefix : prefixes) single.push_back(largeSystem.getSuggestions(prefix, 8));
+        });
+        double batch = timeIt([&]() { largeSystem.getSuggestionsBatch(prefixes, 8, out); });
+        bool same = matches(single);
+        double pooled = timeIt([&]() { largeSystem.getSuggestionsBatch(prefixes, 8, out, &pool); });
+        same = same && matches(single);
+        std::cout << "- Suggestions, " << prefixes.size() << " prefixes: loop " << loop / prefixes.size() << ", batch "
+                  << batch / prefixes.size() << ", batch on " << pool.size() + 1 << " threads " << pooled / prefixes.size()
+                  << " microseconds per query" << std::endl;
+        
+        single.clear();
+        loop = timeIt([&]() {
+            for (const auto& typo : typos) single.push_back(std::vector<std::string>(1, largeSystem.autoCorrect(typo)));
+        });
+        batch = timeIt([&]() { largeSystem.autoCorrectBatch(typos, out); });
+        same = same && matches(single);
+        pooled = timeIt([&]() { largeSystem.autoCorrectBatch(typos, out, &pool); });
+        same = same && matches(single);
+        std::cout << "- Corrections, " << typos.size() << " typos: loop " << loop / typos.size() << ", batch "
+                  << batch / typos.size() << ", batch on " << pool.size() + 1 << " threads " << pooled / typos.size()
+                  << " microseconds per query" << std::endl;
+        std::cout << "- Results identical: " << (same ? "yes" : "NO") << std::endl;
+    }
+    
+    // Per-keystroke cost of completions plus corrections: full queries on
+    // every prefix against one incremental session per word
+    void benchmarkSessions(BenchmarkSuite& suite) {
+        std::cout << "\n=== Keystroke Sessions ===" << std::endl;
+        
+        PredictiveTextSystem largeSystem;
+        std::vector<std::string> words = suite.fillDictionary(largeSystem, 100000);
+        std::vector<std::string> typedWords;
+        for (int i = 0; i < 200; i++) {
+            typedWords.push_back(suite.misspell(words[suite.draw(words.size())], 1));  // One typo somewhere
+        }
+        
+        size_t keystrokes = 0;
+        std::vector<std::vector<std::string>> fullResults, sessionResults;
+        auto start = std::chrono::high_resolution_clock::now();
+        for (const auto& word : typedWords) {
+            for (size_t length = 1; length <= word.size(); length++) {
+                std::string prefix = word.substr(0, length);
+                fullResults.push_back(largeSystem.getSuggestions(prefix, 5));
+                fullResults.push_back(largeSystem.getCorrections(prefix, 2, 5));
+                keystrokes++;
+            }
+        }
+        auto middle = std::chrono::high_resolution_clock::now();
+        CompletionSession session(largeSystem, 2);
+        for (const auto& word : typedWords) {
+            session.reset();
+            for (char ch : word) {
+                session.type(ch);
+                sessionResults.push_back(session.more(5));
+                sessionResults.push_back(session.corrections(5));
+            }
+        }
+        auto end = std::chrono::high_resolution_clock::now();
+        
+        std::cout << "- Full queries per keystroke: "
+                  << std::chrono::duration<double, std::micro>(middle - start).count() / keystrokes << " microseconds" << std::endl;
+        std::cout << "- Incremental session: "
+                  << std::chrono::duration<double, std::micro>(end - middle).count() / keystrokes << " microseconds" << std::endl;
+        std::cout << "- Results identical: " << (fullResults == sessionResults ? "yes" : "NO") << std::endl;
+    }
+    
+    // Autocorrect latency on a large dictionary at edit distances 1 and 2
+    void benchmarkAutoCorrect(BenchmarkSuite& suite) {
+        std::cout << "\n=== Auto-correction ===" << std::endl;
+        
+        PredictiveTextSystem largeSystem;
+        std::vector<std::string> words = suite.fillDictionary(largeSystem, 100000);
+        
+        // Typos with up to 1 or 2 random edits
+        std::vector<std::pair<std::string, std::string>> typos[2];
+        for (int maxDistance = 1; maxDistance <= 2; maxDistance++) {
+            for (int i = 0; i < 500; i++) {
+                const std::string& original = words[suite.draw(words.size())];
+                typos[maxDistance - 1].push_back({suite.misspell(original, maxDistance), original});
+            }
+        }
+        
+        for (int useIndex = 0; useIndex <= 1; useIndex++) {
+            if (useIndex) {
+                auto start = std::chrono::high_resolution_clock::now();
+                largeSystem.setDeleteIndex(true);
+                auto end = std::chrono::high_resolution_clock::now();
+                std::cout << "Delete index: built in " << std::chrono::duration<double, std::milli>(end - start).count()
+                          << " ms, " << largeSystem.deleteIndexMemoryUsage() / (1024 * 1024) << " MB (trie: "
+                          << largeSystem.memoryUsage() / (1024 * 1024) << " MB)" << std::endl;
+            } else {
+                std::cout << "Trie walk:" << std::endl;
+            }
+            
+            for (int maxDistance = 1; maxDistance <= 2; maxDistance++) {
+                int recovered = 0;
+                auto start = std::chrono::high_resolution_clock::now();
+                for (const auto& typo : typos[maxDistance - 1]) {
+                    auto corrections = largeSystem.getCorrections(typo.first, maxDistance, 5);
+                    recovered += std::find(corrections.begin(), corrections.end(), typo.second) != corrections.end();
+                }
+                auto end = std::chrono::high_resolution_clock::now();
+                size_t queries = typos[maxDistance - 1].size();
+                double micros = std::chrono::duration<double, std::micro>(end - start).count() / queries;
+                
+                std::cout << "- Distance " << maxDistance << ": " << micros << " microseconds per query, original word in top 5 for "
+                          << (100.0 * recovered / queries) << "% of typos" << std::endl;
+            }
+        }
+    }
+    
+    // Query throughput as reader threads are added, with learning running alongside
+    void benchmarkConcurrentQueries(BenchmarkSuite& suite) {
+        std::cout << "\n=== Concurrent Queries ===" << std::endl;
+        
+        PredictiveTextSystem base;
+        std::vector<std::string> words = suite.fillDictionary(base, 100000);
+        ConcurrentPredictiveText server(base);
+        
+        const auto runTime = std::chrono::milliseconds(300);
+        int threadCounts[] = {1, 2, 4, 8};
+        for (int threadCount : threadCounts) {
+            std::atomic<bool> running(true);
+            std::atomic<uint64_t> queries(0);
+            std::vector<std::thread> readers;
+            for (int t = 0; t < threadCount; t++) {
+                readers.emplace_back([&, t]() {
+                    uint64_t done = 0;
+                    size_t next = (size_t)t * 7919;
+                    while (running.load(std::memory_order_relaxed)) {
+                        const std::string& word = words[next++ % words.size()];
+                        server.getSuggestions(word.substr(0, next % 3 + 1), 5);
+                        done++;
+                    }
+                    queries += done;
+                });
+            }
+            std::thread learner([&]() {
+                size_t next = 0;
+                while (running.load(std::memory_order_relaxed)) {
+                    server.userSelectedWord(words[next++ % words.size()]);
+                    std::this_thread::sleep_for(std::chrono::microseconds(200));
+                }
+            });
+            
+            std::this_thread::sleep_for(runTime);
+            running = false;
+            for (auto& reader : readers) {
+                reader.join();
+            }
+            learner.join();
+            
+            double seconds = std::chrono::duration<double>(runTime).count();
+            std::cout << "- " << threadCount << " reader thread(s): " << (uint64_t)(queries / seconds)
+                      << " queries/s" << std::endl;
+        }
+        server.flush();
+    }
+    
+    // Build a synthetic corpus over the suite's dictionary with a skewed
+    // word distribution and punctuation
+    static std::string generateCorpus(BenchmarkSuite& suite, int vocabularySize, int tokens) {
+        std::vector<std::string> vocabulary;
+        std::vector<int> frequencies;
+        suite.dictionary(vocabularySize, vocabulary, frequencies);
+        
+        std::string corpus;
+        for (int i = 0; i < tokens; i++) {
+            // Multiplying two uniform draws favours low indices, so a few words dominate
+            size_t index = (size_t)((uint64_t)suite.draw(vocabularySize) * suite.draw(vocabularySize) / vocabularySize);
+            corpus += vocabulary[index];
+            corpus += (i % 17 == 16) ? ".\n" : (i % 5 == 4 ? ", " : " ");
+        }
+        return corpus;
+    }
+    
+    // Training throughput of the in-memory and streaming trainers
+    void benchmarkTraining(BenchmarkSuite& suite) {
+        std::cout << "\n=== Training Throughput ===" << std::endl;
+        
+        std::string corpus = generateCorpus(suite, 50000, 2000000);
+        std::cout << "- Corpus: " << corpus.size() << " bytes" << std::endl;
+        
+        PredictiveTextSystem inMemory;
         auto start = std::chrono::high_resolution_clock::now();
+        inMemory.trainFromText(corpus);
+        auto end = std::chrono::high_resolution_clock::now();
+        double textSeconds = std::chrono::duration<double>(end - start).count();
         
-        // Insert words
-        for (const auto& word : sampleWords) {
-            textSystem.insertWord(word, rand() % 50 + 1);
+        PredictiveTextSystem streamed;
+        std::istringstream stream(corpus);
+        TrainingReport report = streamed.trainFromStream(stream);
+        
+        bool identical = true;
+        std::string prefixes[] = {"a", "e", "th", "qu", "xy"};
+        for (const auto& prefix : prefixes) {
+            identical = identical && inMemory.getSuggestions(prefix, 8) == streamed.getSuggestions(prefix, 8);
         }
         
-        // Perform searches
-        int operations = 1000;
-        for (int i = 0; i < operations; i++) {
-            std::string prefix = sampleWords[rand() % sampleWords.size()].substr(0, rand() % 4 + 1);
-            textSystem.getSuggestions(prefix);
+        PredictiveTextSystem parallel;
+        int threadCount = std::max(1, (int)std::thread::hardware_concurrency());
+        TrainingReport parallelReport = parallel.trainFromTextParallel(corpus, threadCount);
+        for (const auto& prefix : prefixes) {
+            identical = identical && inMemory.getSuggestions(prefix, 8) == parallel.getSuggestions(prefix, 8);
         }
         
+        std::cout << "- trainFromText: " << (uint64_t)(report.tokens / textSeconds) << " words/s" << std::endl;
+        std::cout << "- trainFromStream: " << (uint64_t)(report.tokens / report.seconds) << " words/s" << std::endl;
+        std::cout << "- trainFromTextParallel (" << threadCount << " threads): "
+                  << (uint64_t)(parallelReport.tokens / parallelReport.seconds) << " words/s" << std::endl;
+        std::cout << "- Results identical: " << (identical ? "yes" : "NO") << std::endl;
+    }
+    
+    // Startup cost of the text format, the binary snapshot and a mapped snapshot
+    void benchmarkModelFiles(BenchmarkSuite& suite) {
+        std::cout << "\n=== Model Files: Text vs Binary vs Mapped ===" << std::endl;
+        
+        PredictiveTextSystem largeSystem;
+        suite.fillDictionary(largeSystem, 200000);
+        largeSystem.saveModel("benchmark_model.txt");
+        largeSystem.saveBinaryModel("benchmark_model.bin");
+        
+        auto start = std::chrono::high_resolution_clock::now();
+        PredictiveTextSystem textLoaded;
+        textLoaded.loadModel("benchmark_model.txt");
         auto end = std::chrono::high_resolution_clock::now();
-        auto duration = std::chrono::duration_cast<std::chrono::microseconds>(end - start);
+        double textSeconds = std::chrono::duration<double>(end - start).count();
+        
+        // Cache answers from the starting vocabulary, which the load must drop
+        std::string prefixes[] = {"a", "qu", "th", "zz", "mno"};
+        PredictiveTextSystem binaryLoaded;
+        binaryLoaded.setResultCacheCapacity(16);
+        for (const auto& prefix : prefixes) binaryLoaded.getSuggestions(prefix, 8);
+        
+        start = std::chrono::high_resolution_clock::now();
+        binaryLoaded.loadBinaryModel("benchmark_model.bin");
+        end = std::chrono::high_resolution_clock::now();
+        double binarySeconds = std::chrono::duration<double>(end - start).count();
+        
+        start = std::chrono::high_resolution_clock::now();
+        MappedModel mappedModel;
+        mappedModel.open("benchmark_model.bin");
+        end = std::chrono::high_resolution_clock::now();
+        double mappedSeconds = std::chrono::duration<double>(end - start).count();
+        
+        bool identical = true;
+        for (const auto& prefix : prefixes) {
+            auto expected = largeSystem.getSuggestions(prefix, 8);
+            identical = identical && binaryLoaded.getSuggestions(prefix, 8) == expected &&
+                        mappedModel.getSuggestions(prefix, 8) == expected;
+        }
+        
+        std::cout << "- Text load: " << textSeconds * 1000 << " ms" << std::endl;
+        std::cout << "- Binary load: " << binarySeconds * 1000 << " ms" << std::endl;
+        std::cout << "- Mapped open: " << mappedSeconds * 1000 << " ms" << std::endl;
+        std::cout << "- Results identical: " << (identical ? "yes" : "NO") << std::endl;
+        
+        mappedModel.close();
+        std::remove("benchmark_model.txt");
+        std::remove("benchmark_model.bin");
+    }
+    
+    // Memory and throughput of the node pool on a large vocabulary
+    void benchmarkTrieLayout(BenchmarkSuite& suite) {
+        std::cout << "\n=== Trie Layout: Memory and Throughput ===" << std::endl;
+        
+        const int vocabularySize = 200000;
+        std::vector<std::string> words;
+        std::vector<int> frequencies;
+        suite.dictionary(vocabularySize, words, frequencies);
+        size_t textBytes = 0;
+        for (const auto& word : words) textBytes += word.size();
+        std::cout << "- Words: " << vocabularySize << " (" << textBytes << " bytes of text)" << std::endl;
+        
+        const char* layouts[] = {"One node per character", "Radix (path compression)"};
+        for (int layout = 0; layout < 2; layout++) {
+            PredictiveTextSystem largeSystem;
+            largeSystem.setSuggestionStrategy(SuggestionStrategy::BestFirstSearch);  // Pool only, no caches
+            largeSystem.setPathCompression(layout == 1);
+            auto start = std::chrono::high_resolution_clock::now();
+            for (size_t i = 0; i < words.size(); i++) {
+                largeSystem.insertWord(words[i], frequencies[i]);
+            }
+            auto end = std::chrono::high_resolution_clock::now();
+            double insertSeconds = std::chrono::duration<double>(end - start).count();
+            size_t poolBytes = largeSystem.memoryUsage();
+            
+            start = std::chrono::high_resolution_clock::now();
+            int lookups = 0;
+            for (const auto& word : words) {
+                lookups += largeSystem.getSuggestions(word.substr(0, 3), 1).empty() ? 0 : 1;
+            }
+            end = std::chrono::high_resolution_clock::now();
+            double lookupSeconds = std::chrono::duration<double>(end - start).count();
+            
+            largeSystem.setSuggestionStrategy(SuggestionStrategy::CompletionCache);
+            size_t cachedBytes = largeSystem.memoryUsage();
+            size_t nodes = largeSystem.nodeCount();
+            
+            std::cout << layouts[layout] << ":" << std::endl;
+            std::cout << "- Nodes: " << nodes << " x " << sizeof(TrieNode) << " bytes" << std::endl;
+            std::cout << "- Node pool: " << poolBytes << " bytes (" << (double)poolBytes / vocabularySize
+                      << " per word)" << std::endl;
+            std::cout << "- Node pool with completion caches: " << cachedBytes << " bytes" << std::endl;
+            if (layout == 0) {
+                // What the same nodes would cost as heap nodes holding an unordered_map,
+                // a word string and a cache vector, plus one hash node and bucket per edge
+                size_t mapNodeBytes = sizeof(std::unordered_map<char, void*>) + sizeof(std::string) +
+                                      sizeof(std::vector<void*>) + 3 * sizeof(int) + 16;
+                size_t mapEdgeBytes = 32 + sizeof(void*);
+                size_t mapLayoutBytes = nodes * mapNodeBytes + (nodes - 1) * mapEdgeBytes;
+                std::cout << "- Estimated map-based nodes: " << mapLayoutBytes << " bytes ("
+                          << (double)mapLayoutBytes / vocabularySize << " per word)" << std::endl;
+            }
+            std::cout << "- Insert throughput: " << vocabularySize / insertSeconds << " words/s" << std::endl;
+            std::cout << "- Lookup throughput: " << lookups / lookupSeconds << " prefix queries/s" << std::endl;
+        }
+    }
+    
+    // Compare the suggestion strategies on a large vocabulary
+    void benchmarkSuggestionStrategies(BenchmarkSuite& suite) {
+        std::cout << "\n=== Suggestion Strategies ===" << std::endl;
+        
+        const int vocabularySize = 200000;
+        const int queries = 500;
+        PredictiveTextSystem largeSystem;
+        suite.fillDictionary(largeSystem, vocabularySize);
+        
+        std::vector<std::string> prefixes;
+        for (int i = 0; i < queries; i++) {
+            prefixes.push_back(suite.randomWord(1, 2));  // Short prefixes have the biggest subtrees
+        }
+        
+        SuggestionStrategy strategies[] = {SuggestionStrategy::SubtreeWalk, SuggestionStrategy::CompletionCache,
+                                           SuggestionStrategy::BestFirstSearch};
+        const char* names[] = {"Subtree walk", "Completion cache", "Best-first search"};
+        std::vector<std::vector<std::string>> results[3];
+        for (int s = 0; s < 3; s++) {
+            largeSystem.setSuggestionStrategy(strategies[s]);
+            auto start = std::chrono::high_resolution_clock::now();
+            for (const auto& prefix : prefixes) {
+                results[s].push_back(largeSystem.getSuggestions(prefix, 8));
+            }
+            auto end = std::chrono::high_resolution_clock::now();
+            auto duration = std::chrono::duration_cast<std::chrono::microseconds>(end - start);
+            std::cout << "- " << names[s] << ": " << (double)duration.count() / queries
+                      << " microseconds per query" << std::endl;
+        }
         
-        std::cout << "Benchmark Results:" << std::endl;
-        std::cout << "- Operations performed: " << operations + sampleWords.size() << std::endl;
-        std::cout << "- Total time: " << duration.count() << " microseconds" << std::endl;
-        std::cout << "- Average time per operation: " << (double)duration.count() / (operations + sampleWords.size()) << " microseconds" << std::endl;
+        std::cout << "- Vocabulary: " << vocabularySize << " words, " << queries << " queries of 1-2 letters" << std::endl;
+        std::cout << "- Results identical: "
+                  << (results[0] == results[1] && results[0] == results[2] ? "yes" : "NO") << std::endl;
         
-        textSystem.displayStats();
+        // Keystroke traffic is skewed: a few short prefixes make up most queries
+        std::vector<std::string> skewed;
+        for (int i = 0; i < 20000; i++) {
+            double u = suite.draw(1 << 20) / (double)(1 << 20);
+            skewed.push_back(prefixes[(size_t)(u * u * u * (queries - 1))]);
+        }
+        std::vector<std::vector<std::string>> cached[2];
+        for (int useCache = 0; useCache <= 1; useCache++) {
+            largeSystem.setResultCacheCapacity(useCache ? 64 : 0);
+            std::vector<std::string> learned;
+            auto start = std::chrono::high_resolution_clock::now();
+            for (size_t i = 0; i < skewed.size(); i++) {
+                cached[useCache].push_back(largeSystem.getSuggestions(skewed[i], 8));
+                // Now and then the last suggestion is picked and jumps to the top
+                if (i % 100 == 0 && !cached[useCache].back().empty()) {
+                    learned.push_back(cached[useCache].back().back());
+                    largeSystem.insertWord(learned.back(), 1000);
+                }
+            }
+            auto end = std::chrono::high_resolution_clock::now();
+            for (const auto& word : learned) {
+                largeSystem.insertWord(word, -1000);  // Same starting point for the next run
+            }
+            std::cout << "- Best-first, skewed prefixes, " << (useCache ? "64-entry result cache" : "no result cache") << ": "
+                      << std::chrono::duration<double, std::micro>(end - start).count() / skewed.size()
+                      << " microseconds per query" << std::endl;
+        }
+        std::cout << "- Cached results identical: " << (cached[0] == cached[1] ? "yes" : "NO") << std::endl;
     }
 };
 
 // Main function
 int main() {
-    srand(time(nullptr));
-    
     PredictiveTextDemo demo;
     
     std::cout << "=== Predictive Text System with Trie & Machine Learning ===" << std::endl;
@@ -565,7 +6292,9 @@ int main() {
     std::cout << "1. Interactive Demo" << std::endl;
     std::cout << "2. Performance Benchmark" << std::endl;
     std::cout << "3. Quick Demo" << std::endl;
-    std::cout << "Enter choice (1, 2, or 3): ";
+    std::cout << "4. Server (TCP port " << SERVER_PORT << ")" << std::endl;
+    std::cout << "5. Load Test a Running Server" << std::endl;
+    std::cout << "Enter choice (1-5): ";
     
     int choice;
     std::cin >> choice;
@@ -581,6 +6310,12 @@ int main() {
         case 3:
             demo.runAutomatedDemo();
             break;
+        case 4:
+            demo.runServer();
+            break;
+        case 5:
+            demo.runLoadTest();
+            break;
         default:
             std::cout << "Invalid choice! Running interactive demo..." << std::endl;
             demo.runDemo();